@@ -43,6 +43,14 @@ setup(
     install_requires=[
         'calmjs.parse',
     ],
+    extras_require={
+        'inotify': [
+            'inotify_simple',
+        ],
+        'brotli': [
+            'brotli',
+        ],
+    },
     entry_points={
         'console_scripts': [
             'crimp = crimp.runtime:main',
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+"""
+A JavaScript minifier built on calmjs.parse.
+"""
+
+from crimp.api import minify
+from crimp.api import minify_file
+from crimp.limits import LimitExceeded
+from crimp.limits import Limits
+
+__all__ = ['minify', 'minify_file', 'Limits', 'LimitExceeded']
+
+try:
+    from crimp.aio import aminify
+    from crimp.aio import aminify_files
+except (ImportError, SyntaxError):  # pragma: no cover
+    # the asyncio API requires Python 3.5 or later, as its module fails
+    # to compile on the earlier versions.
+    pass
+else:
+    __all__ += ['aminify', 'aminify_files']
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+The asyncio API, for minifying within an event loop (e.g. that of an
+asset server) without blocking it.
+
+Files are read and written in the default executor of the loop, while
+the parsing and unparsing are done in the executor provided; as those
+hold the GIL for their entire duration, a ProcessPoolExecutor should be
+provided where the loop is to remain responsive under load.  Concurrent
+requests for an identical input are coalesced into a single job, which
+is only cancelled once every request waiting on it is cancelled.
+
+Requires Python 3.5 or later; asyncio is only imported once needed.
+"""
+
+from functools import partial
+from weakref import WeakKeyDictionary
+
+from crimp.api import cache_key
+from crimp.api import decode
+from crimp.api import file_target
+from crimp.api import minify_text
+from crimp.api import printer_options
+from crimp.api import read
+from crimp.api import render
+from crimp.api import write
+from crimp.limits import no_limits
+
+# the jobs in progress for every event loop, keyed by their keys, each
+# being a list of the future and the number of requests waiting on it.
+_jobs = WeakKeyDictionary()
+
+
+async def run_job(key, func, *args, executor=None):
+    """
+    Return the result of calling func with args in the executor (or the
+    default executor of the loop if None), sharing the job with every
+    concurrent call for the same key.
+    """
+
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+    jobs = _jobs.setdefault(loop, {})
+    job = jobs.get(key)
+    if job is None:
+        job = jobs[key] = [loop.run_in_executor(executor, func, *args), 0]
+    job[1] += 1
+    try:
+        # the job is shielded from the cancellation of any one request.
+        return await asyncio.shield(job[0])
+    except asyncio.CancelledError:
+        if job[1] == 1:
+            # jobs that have started will run to completion regardless.
+            job[0].cancel()
+        raise
+    finally:
+        job[1] -= 1
+        if not job[1] and jobs.get(key) is job:
+            del jobs[key]
+
+
+async def minify_source(
+        text, sourcepath, options, executor=None, limits=no_limits):
+    """
+    Return the list of stream fragments for the source text in the same
+    manner as crimp.api.minify_text, as a coalesced job.
+    """
+
+    return await run_job(
+        (cache_key(text, options), sourcepath, tuple(sorted(
+            vars(limits).items()))),
+        partial(minify_text, limits=limits), text, sourcepath, options,
+        executor=executor,
+    )
+
+
+async def aminify(
+        source, sourcepath=None, source_map=False, encoding='utf8',
+        executor=None, limits=no_limits, **options):
+    """
+    The asynchronous variant of crimp.minify, which returns a 2-tuple of
+    the output code and the source map as a dict (or None if source_map
+    is False).
+
+    Arguments
+
+    source
+        The source text; either a str, or bytes which will be decoded
+        using the encoding.
+    sourcepath
+        The path of the source that will be used for error messages and
+        the source map.
+    source_map
+        Also generate the source map.
+    encoding
+        The encoding to decode bytes with, unless it starts with a byte
+        order mark.
+    executor
+        The executor to parse and unparse the source in; defaults to
+        the default executor of the loop.
+    limits
+        A crimp.limits.Limits to process the source within; as the
+        default executor runs it in a thread, the timeout is then only
+        checked once it was processed.
+
+    Any other keyword arguments are the options accepted by the
+    printer_options function.
+    """
+
+    import asyncio
+
+    if isinstance(source, bytes):
+        source = decode(source, encoding)
+    fragments = await minify_source(
+        source, sourcepath, printer_options(**options), executor=executor,
+        limits=limits)
+    return await asyncio.get_event_loop().run_in_executor(
+        None, render, fragments, source_map)
+
+
+async def aminify_files(
+        inputs, output_path, source_map_path=None, encoding='utf8',
+        executor=None, skip_unchanged=False, compress=(), limits=no_limits,
+        **options):
+    """
+    The asynchronous variant of crimp.minify_file, where the inputs are
+    read and processed concurrently.  The executor is the one to parse
+    and unparse the inputs in, as per aminify; the remaining arguments
+    are as per crimp.minify_file.
+
+    The output is only written once every input has been processed; if
+    cancelled while it is being written, the writing will complete.
+    """
+
+    import asyncio
+
+    loop = asyncio.get_event_loop()
+    input_streams, output_stream, sourcemap_stream = file_target(
+        inputs, output_path, source_map_path, encoding=encoding,
+        skip_unchanged=skip_unchanged, compress=compress,
+    )
+    options = printer_options(**options)
+    for input_stream in input_streams:
+        limits.check_file(input_stream.path)
+    sources = await asyncio.gather(*[
+        loop.run_in_executor(None, read, input_stream)
+        for input_stream in input_streams
+    ])
+    fragments = await asyncio.gather(*[
+        minify_source(
+            text, sourcepath, options, executor=executor, limits=limits)
+        for text, sourcepath in sources
+    ])
+    await loop.run_in_executor(
+        None, write, fragments, output_stream, sourcemap_stream)
@@ -0,0 +1,1159 @@
+# -*- coding: utf-8 -*-
+"""
+The library API.
+
+The functions here raise exceptions rather than exiting, such that they
+may be used by other Python packages without spawning a subprocess; the
+command line runtime is a wrapper around these.
+
+As importing calmjs.parse will load the parser (along with everything
+else it depends on), it is only imported by the functions that require
+it such that importing this module remains cheap.
+"""
+
+import codecs
+import logging
+import re
+
+from functools import partial
+from io import StringIO
+from fnmatch import fnmatch
+from itertools import islice
+from os.path import abspath
+from os.path import basename
+
+from crimp.cache import digest
+from crimp.limits import no_limits
+from crimp.output import AtomicWriter
+from crimp.timing import Timings
+from crimp.timing import null_timings
+
+logger = logging.getLogger(__name__)
+
+# printers created by get_printer, keyed by their options.
+_printers = {}
+# results of pkg_version, keyed by the name.
+_versions = {}
+# the byte order marks and their encodings; UTF-32 must be checked
+# before UTF-16 as the little endian marks share the same prefix.
+BOMS = (
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+# the thresholds for the is_minified heuristic: the minimum size in
+# characters, the minimum average line length and the maximum ratio of
+# whitespace characters.
+MINIFIED_MIN_SIZE = 1024
+MINIFIED_LINE_LENGTH = 250
+MINIFIED_WHITESPACE = 0.1
+# the comments referencing the source map of (or the name for) a file,
+# which no longer apply once it is passed through into an output.
+SOURCE_MAP_COMMENT = re.compile(r'^\s*//[#@]\s*source(Mapping)?URL=\S*\s*$')
+
+
+def pkg_version(name):
+    """
+    Return the project name, version and location for the named package.
+    importlib.metadata is used where available, as importing
+    pkg_resources takes considerably longer.
+    """
+
+    if name in _versions:
+        return _versions[name]
+
+    try:
+        from importlib import metadata
+    except ImportError:  # pragma: no cover
+        # Python<3.8
+        from pkg_resources import Requirement
+        from pkg_resources import working_set
+        dist = working_set.find(Requirement.parse(name))
+        result = (
+            getattr(dist, 'project_name', name),
+            getattr(dist, 'version', '?'),
+            getattr(dist, 'location', '?'),
+        )
+    else:
+        try:
+            dist = metadata.distribution(name)
+        except metadata.PackageNotFoundError:
+            result = (name, '?', '?')
+        else:
+            result = (
+                dist.metadata['Name'], dist.version,
+                str(dist.locate_file('')),
+            )
+
+    _versions[name] = result
+    return result
+
+
+def printer_options(
+        mangle=False, obfuscate=False, pretty=False, indent_width=4,
+        drop_semi=False, optimize=False, define=None):
+    """
+    Return the effective options for the construction of a printer as a
+    sorted tuple of key, value pairs, where flags that are implied by
+    others are resolved such that equivalent option sets will compare
+    equal.  The optimize option enables the optimization pass from
+    crimp.optimize over the trees before they are printed; define is a
+    mapping (or a list of 2-tuples) of global names to the source text
+    of the literals to replace them with, which implies optimize.
+    """
+
+    define = tuple(sorted(dict(define or ()).items()))
+    return (
+        ('define', define),
+        ('drop_semi', bool(drop_semi or mangle)),
+        ('indent_width', indent_width if pretty else None),
+        ('obfuscate', bool(obfuscate or mangle)),
+        ('optimize', bool(optimize or define)),
+        ('pretty', bool(pretty)),
+    )
+
+
+def create_printer(options, obfuscation=None):
+    """
+    Create the Unparser from the options produced by printer_options.
+    If provided, the obfuscation rule is used in place of the default
+    obfuscate rule from calmjs.parse.rules.
+    """
+
+    from calmjs.parse import rules
+    from calmjs.parse.lexers.es5 import Lexer
+    from calmjs.parse.unparsers.es5 import Unparser
+
+    options = dict(options)
+    enabled_rules = [rules.minify(drop_semi=options['drop_semi'])]
+    if options['obfuscate']:
+        enabled_rules.append(obfuscation or rules.obfuscate(
+            reserved_keywords=Lexer.keywords_dict.keys()
+        ))
+
+    if options['pretty']:
+        enabled_rules.append(rules.indent(
+            indent_str=' ' * options['indent_width']))
+
+    return Unparser(rules=enabled_rules)
+
+
+def get_printer(options):
+    """
+    Return a printer for the options, reusing one previously created for
+    the same options within this process.
+    """
+
+    if options not in _printers:
+        _printers[options] = create_printer(options)
+    return _printers[options]
+
+
+def options_key(options):
+    """
+    Generate a key for the options along with the versions of the
+    packages that the output depends on.
+    """
+
+    return digest(
+        '%s %s' % pkg_version('crimp')[:2],
+        '%s %s' % pkg_version('calmjs.parse')[:2],
+        repr(options),
+    )
+
+
+def fragments_key(key, text_digest):
+    """
+    Generate the key that identifies the stream fragments produced with
+    the options (as keyed by options_key) for the source text with the
+    digest.
+    """
+
+    return digest(key, text_digest)
+
+
+def cache_key(text, options):
+    """
+    Generate the cache key for the source text to be processed by the
+    printer created using the provided options, which is also the key
+    for the stream fragments produced.
+    """
+
+    return fragments_key(options_key(options), digest(text))
+
+
+class Fragments(list):
+    """
+    A list of stream fragments, along with the key that identifies what
+    they were produced from (see fragments_key), if known.
+    """
+
+    def __init__(self, fragments=(), key=None):
+        super(Fragments, self).__init__(fragments)
+        self.key = key
+
+
+def decode(data, encoding):
+    """
+    Decode the bytes in one go; if it starts with a byte order mark,
+    the encoding it denotes is used instead of the provided encoding and
+    the mark is stripped.
+    """
+
+    for bom, bom_encoding in BOMS:
+        if data.startswith(bom):
+            return data.decode(bom_encoding)
+    return data.decode(encoding)
+
+
+class InputFile(object):
+    """
+    A callable that opens the file at path for reading, for use as an
+    input stream where the path of the file is required (e.g. to check
+    whether it was modified).  The read function will read the file
+    through the read method instead.
+    """
+
+    def __init__(self, path, encoding):
+        self.path = path
+        self.encoding = encoding
+
+    def __call__(self):
+        return codecs.open(self.path, encoding=self.encoding)
+
+    def read(self):
+        """
+        Return the decoded content of the file, which is read as bytes
+        in a single call rather than through a stream reader.
+        """
+
+        with open(self.path, 'rb') as fd:
+            return decode(fd.read(), self.encoding)
+
+
+def read(stream):
+    """
+    Read the stream, which may be a callable that produces one, and
+    return a 2-tuple of the text and the name of the stream.
+    """
+
+    if isinstance(stream, InputFile):
+        return stream.read(), stream.path
+
+    source = stream() if callable(stream) else stream
+    try:
+        return source.read(), getattr(source, 'name', None)
+    finally:
+        if callable(stream):
+            source.close()
+
+
+def text_size(text):
+    """
+    Return the size of the text in bytes, as encoded in UTF-8, for the
+    events passed to the hooks of the timings.
+    """
+
+    return len(text.encode('utf8'))
+
+
+def fragments_source(fragments):
+    """
+    Return the source of the stream fragments, i.e. that of the first
+    fragment with one, or None if there are none.
+    """
+
+    for fragment in fragments:
+        if fragment[4] is not None:
+            return None if fragment[4] is NotImplemented else fragment[4]
+    return None
+
+
+def parse(text):
+    """
+    Parse the text into an AST using the ES5 parser from calmjs.parse,
+    as managed by crimp.parser.
+    """
+
+    from crimp.parser import parse
+    return parse(text)
+
+
+def parse_text(text, sourcepath):
+    """
+    Parse the text into an AST, with the sourcepath assigned.  Syntax
+    errors will report the sourcepath in the same manner as the read
+    function provided by calmjs.parse.io.
+    """
+
+    from calmjs.parse.exceptions import ECMASyntaxError
+    from calmjs.parse.utils import repr_compat
+
+    try:
+        result = parse(text)
+    except ECMASyntaxError as e:
+        raise type(e)('%s in %s' % (str(e), repr_compat(sourcepath)))
+    result.sourcepath = sourcepath
+    return result
+
+
+def parse_cached(text, sourcepath, tree_cache=None):
+    """
+    Parse the text in the same manner as parse_text, reusing the tree
+    from the crimp.cache.TreeCache if provided.
+    """
+
+    tree = (
+        tree_cache.get(text, sourcepath) if tree_cache is not None else
+        None
+    )
+    if tree is None:
+        tree = parse_text(text, sourcepath)
+        if tree_cache is not None:
+            tree_cache.put(text, sourcepath, tree)
+    return tree
+
+
+def dump_fragments(fragments):
+    """
+    Convert the stream fragments into a list that may be serialized to
+    JSON; as the source of every fragment is either undefined or the
+    sourcepath of the AST that it was produced from, only a flag of
+    whether it was defined is stored.
+    """
+
+    return [
+        [text, lineno, colno, name, source is not None]
+        for text, lineno, colno, name, source in fragments
+    ]
+
+
+def load_fragments(raw, sourcepath):
+    """
+    The reverse of dump_fragments, restoring the source for the given
+    sourcepath.
+    """
+
+    # an AST without a sourcepath will have its fragments produced
+    # with NotImplemented as the source.
+    source = NotImplemented if sourcepath is None else sourcepath
+    return [
+        (text, lineno, colno, name, source if flag else None)
+        for text, lineno, colno, name, flag in raw
+    ]
+
+
+def minify_text(
+        text, sourcepath, options, timings=null_timings, tree_cache=None,
+        limits=no_limits):
+    """
+    Produce the list of stream fragments for the source text, using a
+    printer created with the options, and the tree from the tree cache
+    if provided.  This is the unit of work that may be dispatched to a
+    worker process; the crimp.limits.Limits are enforced throughout.
+    """
+
+    printer = get_printer(options)
+    with limits.enforce(sourcepath):
+        limits.check_size(text, sourcepath)
+        with timings.phase('parse', sourcepath) as event:
+            tree = parse_cached(text, sourcepath, tree_cache)
+            if timings.hooks:
+                event['size'] = text_size(text)
+        limits.check_depth(tree, sourcepath)
+        tree = optimize_tree(tree, options, timings, sourcepath)
+        return print_tree(printer, tree, timings, sourcepath)
+
+
+def optimize_tree(tree, options, timings=null_timings, sourcepath=None):
+    """
+    Return the tree as optimized by crimp.optimize if the options enable
+    it, otherwise the tree itself; the tree is never modified, such that
+    it may be kept in a tree cache.
+    """
+
+    options = dict(options)
+    if not options.get('optimize'):
+        return tree
+    from crimp.optimize import optimize
+    with timings.phase('optimize', sourcepath):
+        return optimize(tree, dict(options.get('define') or ()))
+
+
+def print_tree(printer, tree, timings=null_timings, sourcepath=None):
+    """
+    Produce the list of stream fragments for the tree using the printer;
+    the sourcepath is only used for the events of the timings.
+    """
+
+    fragments = printer(tree)
+    # the rules (e.g. the name obfuscation) are applied through the
+    # prewalk hooks that get invoked before the first fragment.
+    with timings.phase('rules', sourcepath):
+        result = [tuple(fragment) for fragment in islice(fragments, 1)]
+    with timings.phase('unparse', sourcepath) as event:
+        result.extend(tuple(fragment) for fragment in fragments)
+        if timings.hooks:
+            event['size'] = sum(text_size(fragment[0]) for fragment in result)
+    return result
+
+
+def is_minified(text, sourcepath=None):
+    """
+    Return whether the source text appears to be minified already, i.e.
+    the sourcepath ends with '.min.js', or the text consists of long
+    lines with little whitespace (see the MINIFIED_* thresholds).
+    """
+
+    if sourcepath and sourcepath.endswith('.min.js'):
+        return True
+    size = len(text)
+    if size < MINIFIED_MIN_SIZE:
+        return False
+    if size < MINIFIED_LINE_LENGTH * (text.count(u'\n') + 1):
+        return False
+    whitespace = text.count(u' ') + text.count(u'\t') + text.count(u'\n')
+    return whitespace <= size * MINIFIED_WHITESPACE
+
+
+def passthrough_matcher(patterns=(), minified=False):
+    """
+    Return the predicate for the passthrough argument of minify_sources
+    that matches the sourcepaths against the glob patterns, and if
+    minified is True, also the source texts that appear to be minified
+    already (see is_minified); None if neither is specified.  Patterns
+    with a path separator are matched against the entire sourcepath
+    (relative ones are made absolute first), otherwise only against the
+    filename.
+    """
+
+    if not patterns and not minified:
+        return None
+    patterns = passthrough_patterns(patterns)
+
+    def passthrough(text, sourcepath):
+        if sourcepath:
+            name = basename(sourcepath)
+            for pattern in patterns:
+                if fnmatch(name if basename(pattern) == pattern else (
+                        sourcepath), pattern):
+                    return True
+        return minified and is_minified(text, sourcepath)
+
+    return passthrough
+
+
+def passthrough_patterns(patterns):
+    """
+    Return the list of the glob patterns for passthrough_matcher, with
+    those that have a path separator made absolute.
+    """
+
+    return [
+        pattern if basename(pattern) == pattern else abspath(pattern)
+        for pattern in patterns
+    ]
+
+
+def passthrough_fragments(text, sourcepath):
+    """
+    Produce the list of stream fragments that reproduces the source text
+    verbatim without parsing it, with a fragment for every line such
+    that the source map will map the start of every line to the same in
+    the source.  A trailing newline is ensured such that the text is
+    terminated from whatever follows it.  The trailing sourceMappingURL
+    and sourceURL comments are removed, as they would otherwise apply to
+    the output.
+    """
+
+    source = NotImplemented if sourcepath is None else sourcepath
+    lines = text.split(u'\n')
+    end = len(lines)
+    for idx in range(len(lines) - 1, -1, -1):
+        if SOURCE_MAP_COMMENT.match(lines[idx]):
+            end = idx
+        elif lines[idx].strip():
+            break
+    del lines[end:]
+    if lines and not lines[-1]:
+        lines.pop()
+    return [
+        (line + u'\n', lineno, 1, None, source)
+        for lineno, line in enumerate(lines, 1)
+    ]
+
+
+def passthrough_key(text):
+    """
+    The key for the stream fragments from passthrough_fragments, in
+    place of cache_key.
+    """
+
+    return fragments_key('passthrough', digest(text))
+
+
+def minify_sources(
+        sources, options, cache=None, jobs=1, server=None,
+        timings=null_timings, tree_cache=None, passthrough=None,
+        limits=no_limits):
+    """
+    Produce a list of stream fragments lists for the list of 2-tuples of
+    source text and sourcepath, making use of the cache if provided.
+    If the path to the socket of a server is provided, the sources will
+    be sent there for processing if it is available.  Otherwise, if jobs
+    is greater than 1, the sources will be processed using a pool of
+    that many processes; results are returned in the order of the
+    provided sources regardless.  The timings and the tree cache (a
+    crimp.cache.TreeCache) only apply to the sources processed in this
+    process; the sources with their trees in the tree cache are always
+    processed in this process, such that they are not parsed again.
+
+    Sources for which the passthrough predicate (e.g. as returned by
+    passthrough_matcher) returns True for the text and the sourcepath
+    are reproduced verbatim without being parsed.  The limits (a
+    crimp.limits.Limits) apply to every source wherever it is processed,
+    with a LimitExceeded raised for the first to exceed them; as max_rss
+    only applies to worker processes, the sources are always processed
+    by a pool of processes if it is set.
+    """
+
+    results = [None] * len(sources)
+    keys = [None] * len(sources)
+    pending = []
+    for idx, (text, sourcepath) in enumerate(sources):
+        if passthrough is not None and passthrough(text, sourcepath):
+            logger.debug('passing through %r', sourcepath)
+            results[idx] = Fragments(
+                passthrough_fragments(text, sourcepath),
+                passthrough_key(text))
+            continue
+        keys[idx] = cache_key(text, options)
+        if cache is not None:
+            raw = cache.get(keys[idx])
+            if raw is not None:
+                logger.debug('cache hit for %r', sourcepath)
+                results[idx] = Fragments(
+                    load_fragments(raw, sourcepath), keys[idx])
+                continue
+        pending.append(idx)
+
+    # the sources with their trees in the tree cache are printed from
+    # there in this process, rather than parsed again elsewhere.
+    remote = [
+        idx for idx in pending
+        if tree_cache is None or not tree_cache.contains(*sources[idx])
+    ]
+    texts = [sources[idx][0] for idx in remote]
+    sourcepaths = [sources[idx][1] for idx in remote]
+    processed = None
+    if server and remote:
+        from crimp.server import minify
+        processed = minify(
+            server, list(zip(texts, sourcepaths)), options, limits=limits)
+
+    parallel = (jobs > 1 and len(remote) > 1) or bool(
+        limits.max_rss and remote)
+    if parallel:
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+        except ImportError:  # pragma: no cover
+            # Python 2 without the futures backport.
+            logger.warning(
+                'parallel processing is unavailable; processing serially')
+            parallel = False
+
+    if processed is None and parallel:
+        with ProcessPoolExecutor(
+                max_workers=max(1, min(jobs, len(remote)))) as executor:
+            processed = list(executor.map(
+                partial(minify_text, limits=limits), texts, sourcepaths,
+                [options] * len(remote)))
+    processed = dict(zip(remote, processed)) if processed is not None else {}
+
+    for idx in pending:
+        if idx in processed:
+            fragments = processed[idx]
+        else:
+            fragments = minify_text(
+                sources[idx][0], sources[idx][1], options, timings,
+                tree_cache, limits)
+        results[idx] = Fragments(fragments, keys[idx])
+        if cache is not None:
+            cache.put(keys[idx], dump_fragments(fragments))
+
+    return results
+
+
+def minify_shared(
+        sources, options, cache=None, timings=null_timings, tree_cache=None,
+        passthrough=None, limits=no_limits):
+    """
+    Produce a list of stream fragments lists for the list of 2-tuples of
+    source text and sourcepath, where the names are obfuscated with a
+    scope shared by all the sources through the SharedObfuscator from
+    crimp.obfuscation.  The result for the sources as a whole is stored
+    in the cache if provided, such that it will be reused if none of the
+    sources changed.  Sources matched by the passthrough predicate are
+    reproduced verbatim as per minify_sources, and are excluded from the
+    shared scope.  The limits apply to the parsing and the printing of
+    every source, which are all done in this process such that max_rss
+    does not apply.
+    """
+
+    from calmjs.parse.lexers.es5 import Lexer
+    from crimp.obfuscation import SharedObfuscator
+    from crimp.obfuscation import frequency_charset
+
+    if passthrough is not None:
+        results = [
+            Fragments(
+                passthrough_fragments(text, sourcepath),
+                passthrough_key(text),
+            ) if passthrough(text, sourcepath) else None
+            for text, sourcepath in sources
+        ]
+        shared = [idx for idx, result in enumerate(results) if result is None]
+        for idx, fragments in zip(shared, minify_shared(
+                [sources[idx] for idx in shared], options, cache=cache,
+                timings=timings, tree_cache=tree_cache, limits=limits)):
+            results[idx] = fragments
+        return results
+
+    texts = [text for text, sourcepath in sources]
+    if cache is not None:
+        key = digest(options_key(options), 'shared_scope', *texts)
+        raw = cache.get(key)
+        if raw is not None:
+            logger.debug('cache hit for %d sources', len(sources))
+            return [
+                load_fragments(fragments, sourcepath)
+                for fragments, (text, sourcepath) in zip(raw, sources)
+            ]
+
+    trees = []
+    for text, sourcepath in sources:
+        with limits.enforce(sourcepath):
+            limits.check_size(text, sourcepath)
+            with timings.phase('parse', sourcepath) as event:
+                tree = parse_cached(text, sourcepath, tree_cache)
+                if timings.hooks:
+                    event['size'] = text_size(text)
+            limits.check_depth(tree, sourcepath)
+            trees.append(optimize_tree(tree, options, timings, sourcepath))
+    obfuscator = SharedObfuscator(
+        trees, charset=frequency_charset(texts),
+        reserved_keywords=Lexer.keywords_dict.keys(),
+    )
+    printer = create_printer(options, obfuscation=obfuscator.rules)
+    results = []
+    for tree, (text, sourcepath) in zip(trees, sources):
+        with limits.enforce(sourcepath):
+            results.append(print_tree(printer, tree, timings, sourcepath))
+
+    if cache is not None:
+        cache.put(key, [dump_fragments(fragments) for fragments in results])
+    return results
+
+
+def write_section(fragments, stream, cache=None):
+    """
+    Write the stream fragments to the stream and return the source map
+    for them as a section of an index map.  If the fragments have a key
+    (i.e. they are Fragments), the section will be stored in the cache
+    if provided, and be reused from there.
+    """
+
+    from crimp.mappings import encode_section
+
+    key = getattr(fragments, 'key', None)
+    if cache is not None and key is not None and fragments:
+        # the sources of the section are determined by the source of
+        # the first fragment.
+        key = digest(key, 'section', str(fragments[0][4]))
+        section = cache.get(key)
+        if section is not None:
+            stream.writelines(fragment[0] for fragment in fragments)
+            return section
+    section = encode_section(fragments, stream)
+    if cache is not None and key is not None and fragments:
+        cache.put(key, section)
+    return section
+
+
+def write(
+        fragments, output_stream, sourcemap_stream=None,
+        timings=null_timings, source_maps=None, index_map=False,
+        cache=None):
+    """
+    Write out the iterable of stream fragments lists into the output
+    stream, and optionally the sourcemap using the sourcemap stream; the
+    streams are handled in the same manner as the write function
+    provided by calmjs.parse.io.  The source map will be composed with
+    the source maps (a dict of crimp.mappings.SourceMap instances, keyed
+    by the sourcepath of the inputs they apply to) if provided.
+
+    If index_map is True, the source map will instead be an index map
+    with a section for every stream fragments list, with the sections
+    stored in and reused from the cache if provided (see write_section).
+
+    Every stream fragments list is written out and released before the
+    next one is taken from the iterable, and the source map mappings
+    are encoded as they are produced, such that the memory required is
+    bounded by the largest of the lists if they are produced lazily.
+    """
+
+    from calmjs.parse import sourcemap
+    from crimp.mappings import MappingsEncoder
+    from crimp.mappings import PositionTracker
+    from crimp.mappings import compose
+    from crimp.mappings import write_index_map
+    from crimp.mappings import write_sourcemap
+
+    opened = []
+
+    def get_stream(stream):
+        if callable(stream):
+            result = stream()
+            opened.append(result)
+        else:
+            result = stream
+        return result
+
+    try:
+        out_s = get_stream(output_stream)
+        sourcemap_stream = (
+            out_s if sourcemap_stream is output_stream else sourcemap_stream)
+        index_map = index_map and sourcemap_stream
+        if index_map:
+            tracker = PositionTracker(out_s)
+            sections = []
+        elif sourcemap_stream:
+            book = sourcemap.default_book()
+            sources = sourcemap.Names()
+            names = sourcemap.Names()
+            mappings = [[]]
+            encoder = MappingsEncoder()
+        for fragments_list in fragments:
+            source = before = None
+            if timings.hooks:
+                source = fragments_source(fragments_list)
+                before = getattr(out_s, 'size', None)
+            with timings.phase('write', source) as event:
+                if index_map:
+                    sections.append(((tracker.line, tracker.column), (
+                        write_section(fragments_list, tracker, cache))))
+                elif sourcemap_stream:
+                    sourcemap.write(
+                        fragments_list, out_s, normalize=False, book=book,
+                        sources=sources, names=names, mappings=mappings)
+                    encoder.update(mappings)
+                else:
+                    out_s.writelines(
+                        fragment[0] for fragment in fragments_list)
+                if timings.hooks:
+                    # the actual number of bytes if the stream tracks it.
+                    event['size'] = out_s.size - before if (
+                        before is not None) else sum(
+                        text_size(fragment[0]) for fragment in fragments_list)
+            # release it before the next one is produced.
+            fragments_list = None
+        if index_map:
+            sourcemap_stream = get_stream(sourcemap_stream)
+            with timings.phase('sourcemap'):
+                if source_maps:
+                    sections = [(offset, dict(zip(
+                        ('mappings', 'sources', 'names'), compose(
+                            section['mappings'], section['sources'],
+                            section['names'], source_maps)
+                    ))) for offset, section in sections]
+                write_index_map(sections, out_s, sourcemap_stream)
+        elif sourcemap_stream:
+            sourcemap_stream = get_stream(sourcemap_stream)
+            with timings.phase('sourcemap'):
+                mappings, sources, names = encoder.getvalue(), [
+                    sourcemap.INVALID_SOURCE
+                    if s == NotImplemented else s for s in sources
+                ], list(names)
+                if source_maps:
+                    mappings, sources, names = compose(
+                        mappings, sources, names, source_maps)
+                write_sourcemap(
+                    mappings, sources or [sourcemap.INVALID_SOURCE], names,
+                    out_s, sourcemap_stream,
+                )
+    except BaseException:
+        # streams that support it (i.e. the AtomicWriter) will leave
+        # their destinations untouched.
+        for stream in opened:
+            if hasattr(stream, 'discard'):
+                stream.discard()
+        raise
+    finally:
+        for stream in reversed(opened):
+            stream.close()
+
+
+def minify_streams(
+        streams, options, cache=None, jobs=1, server=None,
+        timings=null_timings, manifest=None, tree_cache=None,
+        passthrough=None, limits=no_limits):
+    """
+    Produce a list of stream fragments lists for the list of input
+    streams.
+
+    If a crimp.manifest.Manifest is provided, the fragments recorded
+    for inputs with a path (i.e. InputFile instances) that remained
+    unchanged will be reused, and it will be updated with the results.
+    Inputs with a path that exceed the size permitted by the limits are
+    rejected before they are read.  The remaining arguments are passed
+    to minify_sources.
+    """
+
+    paths = [getattr(stream, 'path', None) for stream in streams]
+    results = [None] * len(streams)
+    sources = []
+    pending = []
+    for idx, (stream, path) in enumerate(zip(streams, paths)):
+        raw = manifest.lookup(path) if manifest is not None and path else None
+        if raw is None:
+            if path:
+                limits.check_file(path)
+            with timings.phase('read', path) as event:
+                text, sourcepath = read(stream)
+                if timings.hooks:
+                    event['size'] = text_size(text)
+            raw = manifest.lookup_text(path, text) if (
+                manifest is not None and path) else None
+        if raw is not None:
+            logger.debug('reusing unchanged input %r', path)
+            results[idx] = Fragments(
+                load_fragments(raw, path),
+                fragments_key(manifest.key, manifest.digest(path)),
+            )
+            continue
+        sources.append((text, sourcepath))
+        pending.append(idx)
+
+    processed = minify_sources(
+        sources, options, cache=cache, jobs=jobs, server=server,
+        timings=timings, tree_cache=tree_cache, passthrough=passthrough,
+        limits=limits,
+    )
+    for idx, (text, sourcepath), fragments in zip(
+            pending, sources, processed):
+        results[idx] = fragments
+        if manifest is not None and paths[idx]:
+            manifest.update(paths[idx], text, dump_fragments(fragments))
+    return results
+
+
+def find_source_maps(streams):
+    """
+    Return a dict of the source maps referenced by the input streams
+    that are files, keyed by their paths.
+    """
+
+    from crimp.mappings import find_source_map
+
+    result = {}
+    for stream in streams:
+        path = getattr(stream, 'path', None)
+        source_map = find_source_map(path) if path else None
+        if source_map is not None:
+            result[path] = source_map
+    return result
+
+
+def minify_targets(
+        targets, options, cache=None, jobs=1, server=None,
+        timings=null_timings, manifest=None, stream=False,
+        shared_scope=False, input_source_maps=False, index_map=False,
+        tree_cache=None, passthrough=None, limits=no_limits, hooks=()):
+    """
+    Process the list of targets, each being a 3-tuple of the list of
+    input streams, the output stream and the sourcemap stream (or None),
+    such that the inputs will be combined into the output.  Streams are
+    handled in the same manner as the write function.
+
+    All inputs are processed before any output stream is opened, such
+    that failures will not result in truncated outputs.  If stream is
+    True, every input will instead be processed one at a time and be
+    written out immediately, such that the memory required will be
+    bounded by the largest input rather than the total of all inputs;
+    outputs that are not written through an AtomicWriter may then be
+    truncated on failure, and jobs is ignored.
+
+    If shared_scope is True and the options enable obfuscation, the
+    inputs of every target will be processed together by minify_shared
+    instead, such that the names are obfuscated with a scope shared by
+    all of them; stream, jobs, server and manifest are then ignored.
+
+    If input_source_maps is True, the source maps referenced by the
+    inputs through their sourceMappingURL comments will be composed with
+    the source maps of the outputs.  If index_map is True, the source
+    maps will be index maps with a section for every input, which will
+    also be stored in the cache.
+
+    The timings (a crimp.timing.Timings) record the phases of every
+    input, and notify the hooks it was created with as they start and
+    end; alternatively, the hooks may be provided on their own, for a
+    Timings to be created with them.  As only the phases of the inputs
+    processed in this process can be recorded, jobs and server are then
+    ignored.
+
+    The manifest (if provided) is saved after all outputs have been
+    written; it and the remaining arguments (including the tree cache,
+    the passthrough predicate and the limits) are passed to
+    minify_streams.
+    """
+
+    if hooks:
+        if timings is not null_timings:
+            raise ValueError('hooks must be provided through the timings')
+        timings = Timings(hooks=hooks)
+    if timings is not null_timings:
+        jobs = 1
+        server = None
+
+    def source_maps(input_streams, sourcemap_stream):
+        if input_source_maps and sourcemap_stream:
+            with timings.phase('sourcemap'):
+                return find_source_maps(input_streams)
+        return None
+
+    if shared_scope and dict(options)['obfuscate']:
+        for input_streams, output_stream, sourcemap_stream in targets:
+            sources = []
+            for input_stream in input_streams:
+                path = getattr(input_stream, 'path', None)
+                if path:
+                    limits.check_file(path)
+                with timings.phase('read', path) as event:
+                    sources.append(read(input_stream))
+                    if timings.hooks:
+                        event['size'] = text_size(sources[-1][0])
+            write(
+                minify_shared(
+                    sources, options, cache=cache, timings=timings,
+                    tree_cache=tree_cache, passthrough=passthrough,
+                    limits=limits),
+                output_stream, sourcemap_stream, timings=timings,
+                source_maps=source_maps(input_streams, sourcemap_stream),
+                index_map=index_map, cache=cache,
+            )
+    elif stream:
+        for input_streams, output_stream, sourcemap_stream in targets:
+            fragments = (
+                minify_streams(
+                    [input_stream], options, cache=cache, server=server,
+                    timings=timings, manifest=manifest, tree_cache=tree_cache,
+                    passthrough=passthrough, limits=limits,
+                )[0] for input_stream in input_streams
+            )
+            write(
+                fragments, output_stream, sourcemap_stream, timings=timings,
+                source_maps=source_maps(input_streams, sourcemap_stream),
+                index_map=index_map, cache=cache,
+            )
+    else:
+        results = iter(minify_streams(
+            [input_stream for input_streams, _, _ in targets
+             for input_stream in input_streams],
+            options, cache=cache, jobs=jobs, server=server,
+            timings=timings, manifest=manifest, tree_cache=tree_cache,
+            passthrough=passthrough, limits=limits,
+        ))
+        for input_streams, output_stream, sourcemap_stream in targets:
+            write(
+                [next(results) for _ in input_streams],
+                output_stream, sourcemap_stream, timings=timings,
+                source_maps=source_maps(input_streams, sourcemap_stream),
+                index_map=index_map, cache=cache,
+            )
+
+    if manifest is not None:
+        manifest.save()
+
+
+def minify(
+        source, sourcepath=None, source_map=False, encoding='utf8',
+        tree_cache=None, limits=no_limits, **options):
+    """
+    Minify the source and return a 2-tuple of the output code and the
+    source map as a dict (or None if source_map is False).
+
+    Arguments
+
+    source
+        The source text; either a str, bytes which will be decoded using
+        the encoding, or a stream object which will be read from.
+    sourcepath
+        The path of the source that will be used for error messages and
+        the source map; defaults to the name of the stream if available.
+    source_map
+        Also generate the source map.
+    encoding
+        The encoding to decode bytes with, unless it starts with a byte
+        order mark.
+    tree_cache
+        A crimp.cache.TreeCache to reuse the parsed tree from, such that
+        the same source may be printed with different options without
+        being parsed again.
+    limits
+        A crimp.limits.Limits to process the source within; a
+        crimp.limits.LimitExceeded is raised if it exceeds them.
+
+    Any other keyword arguments are the options accepted by the
+    printer_options function, i.e. mangle, obfuscate, pretty,
+    indent_width, drop_semi, optimize and define.  The optimize flag
+    enables the optimization pass of crimp.optimize, and define is a
+    dict (or a list of 2-tuples) of global names to the source text of
+    the literals to replace them with (e.g. {'DEBUG': 'false'}), being
+    a string, number, boolean or null literal; it implies optimize.
+
+    The printer for every distinct set of options is reused between
+    calls.  Syntax errors will be raised as ECMASyntaxError, and define
+    values that are not such literals as ValueError.
+    """
+
+    if hasattr(source, 'read'):
+        source, name = read(source)
+        sourcepath = sourcepath or name
+    if isinstance(source, bytes):
+        source = decode(source, encoding)
+
+    return render(
+        minify_text(
+            source, sourcepath, printer_options(**options),
+            tree_cache=tree_cache, limits=limits),
+        source_map,
+    )
+
+
+def render(fragments, source_map=False):
+    """
+    Return a 2-tuple of the output code for the stream fragments and the
+    source map as a dict (or None if source_map is False).
+    """
+
+    from calmjs.parse import sourcemap
+
+    stream = StringIO()
+    mappings, sources, names = sourcemap.write(fragments, stream)
+    if not source_map:
+        return stream.getvalue(), None
+    result = sourcemap.encode_sourcemap(None, mappings, sources, names)
+    result.pop('file')
+    return stream.getvalue(), result
+
+
+def minify_file(
+        inputs, output_path, source_map_path=None, encoding='utf8',
+        cache=None, jobs=1, skip_unchanged=False, shared_scope=False,
+        compress=(), input_source_maps=False, index_map=False,
+        tree_cache=None, passthrough=(), passthrough_minified=False,
+        limits=no_limits, timings=null_timings, hooks=(), **options):
+    """
+    Minify the input file(s) into the output file.
+
+    Arguments
+
+    inputs
+        The path of an input file, or a list of paths of input files
+        that will be combined.
+    output_path
+        The path to write the output to.
+    source_map_path
+        The path to write the source map to; if an empty string, the
+        output_path with '.map' appended will be used; if identical to
+        the output_path, the source map will be written inline.
+    encoding
+        The encoding of the files.
+    cache
+        An optional crimp.cache.Cache instance.
+    jobs
+        The number of processes to process the inputs with.
+    skip_unchanged
+        Leave the output files (and their modification times) untouched
+        if their content would be unchanged.
+    shared_scope
+        Obfuscate the names of all the inputs with a shared scope, if
+        obfuscation is enabled.
+    compress
+        The extensions of the compressed copies to write alongside the
+        output files (see crimp.output.COMPRESSIONS).
+    input_source_maps
+        Compose the source map with the source maps referenced by the
+        inputs, if any.
+    index_map
+        Write the source map as an index map with a section for every
+        input.
+    tree_cache
+        A crimp.cache.TreeCache to reuse the parsed trees from, as per
+        minify.
+    passthrough
+        Glob patterns for the inputs to be copied into the output
+        verbatim rather than processed (see passthrough_matcher).
+    passthrough_minified
+        Also copy the inputs that appear to be minified already into
+        the output verbatim.
+    limits
+        A crimp.limits.Limits to process every input within, as per
+        minify.
+    timings
+        A crimp.timing.Timings to record the durations of the phases
+        of every input in.
+    hooks
+        Callables to be notified as every phase starts and ends for
+        every input (see crimp.timing.Timings), such as a
+        crimp.timing.Stats; an alternative to timings.
+
+    If timings or hooks are provided, the inputs are all processed in
+    this process, such that jobs is ignored.
+
+    The output files are only replaced once they have been completely
+    written.
+
+    Any other keyword arguments are the options accepted by the
+    printer_options function.
+    """
+
+    minify_targets([file_target(
+        inputs, output_path, source_map_path, encoding=encoding,
+        skip_unchanged=skip_unchanged, compress=compress,
+    )], printer_options(**options), cache=cache, jobs=jobs,
+        shared_scope=shared_scope, input_source_maps=input_source_maps,
+        index_map=index_map, tree_cache=tree_cache,
+        passthrough=passthrough_matcher(passthrough, passthrough_minified),
+        limits=limits, timings=timings, hooks=hooks)
+
+
+def file_target(
+        inputs, output_path, source_map_path=None, encoding='utf8',
+        skip_unchanged=False, compress=()):
+    """
+    Return the target for minify_targets for the arguments of the same
+    names as minify_file.
+    """
+
+    if not isinstance(inputs, (list, tuple)):
+        inputs = [inputs]
+    abs_output = abspath(output_path)
+    open_writer = partial(
+        AtomicWriter, encoding=encoding, skip_unchanged=skip_unchanged,
+        compress=compress)
+    output_stream = partial(open_writer, abs_output)
+    if source_map_path is None:
+        sourcemap_stream = None
+    elif source_map_path == '':
+        sourcemap_stream = partial(open_writer, abs_output + '.map')
+    elif abspath(source_map_path) == abs_output:
+        sourcemap_stream = output_stream
+    else:
+        sourcemap_stream = partial(open_writer, abspath(source_map_path))
+    return (
+        [InputFile(abspath(p), encoding) for p in inputs],
+        output_stream, sourcemap_stream,
+    )
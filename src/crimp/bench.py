@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks for the phases of the minification process.
+
+Run with ``python -m crimp.bench``; by default a corpus of generated
+ES5 sources of increasing size is used, but paths to real files may be
+provided instead.
+"""
+
+import sys
+import codecs
+
+from argparse import ArgumentParser
+from io import StringIO
+from os.path import basename
+
+from crimp.api import minify_text
+from crimp.api import printer_options
+from crimp.api import read
+from crimp.api import write
+from crimp.parser import report
+from crimp.timing import PHASES
+from crimp.timing import Timings
+from crimp.timing import tracemalloc
+
+# the sizes of the generated corpus, in bytes.
+DEFAULT_SIZES = (1024, 16 * 1024, 128 * 1024, 512 * 1024)
+
+# a module with a representative mix of constructs; the %(n)d will be
+# replaced with a counter such that every module is distinct.
+TEMPLATE = u'''\
+(function(root, factory) {
+  if (typeof define === 'function' && define.amd) {
+    define('module%(n)d', ['exports'], factory);
+  } else {
+    factory((root.module%(n)d = {}));
+  }
+}(this, function(exports) {
+  'use strict';
+
+  var DEFAULTS = {
+    name: 'module%(n)d',
+    values: [1, 2, 3, 0x%(n)x, 4.5e-3],
+    pattern: /^[a-z]+\\d*$/i
+  };
+
+  function Counter(initial) {
+    this.count = initial || 0;
+    this.history = [];
+  }
+
+  Counter.prototype.increment = function(amount) {
+    var previous = this.count;
+    this.count += typeof amount === 'number' ? amount : 1;
+    this.history.push(previous);
+    return this;
+  };
+
+  function merge(target, source) {
+    var key, result = {};
+    for (key in target) {
+      if (Object.prototype.hasOwnProperty.call(target, key)) {
+        result[key] = target[key];
+      }
+    }
+    for (key in source) {
+      if (Object.prototype.hasOwnProperty.call(source, key)) {
+        result[key] = source[key];
+      }
+    }
+    return result;
+  }
+
+  function process(items, callback) {
+    var i, length = items.length, output = [];
+    for (i = 0; i < length; i++) {
+      try {
+        output.push(callback(items[i], i));
+      } catch (error) {
+        output.push(null);
+      }
+    }
+    return output.length > 0 ? output : undefined;
+  }
+
+  exports.Counter = Counter;
+  exports.create = function(options) {
+    var settings = merge(DEFAULTS, options);
+    var counter = new Counter(settings.values.length);
+    process(settings.values, function(value, index) {
+      return counter.increment(value * index).count;
+    });
+    return {settings: settings, counter: counter};
+  };
+}));
+'''
+
+
+def generate(size):
+    """
+    Generate the source text of at least the size specified (in
+    characters) from the template.
+    """
+
+    chunks = []
+    length = 0
+    n = 0
+    while length < size:
+        chunk = TEMPLATE % {'n': n}
+        chunks.append(chunk)
+        length += len(chunk)
+        n += 1
+    return u''.join(chunks)
+
+
+class NamedStringIO(StringIO):
+
+    def __init__(self, value=u'', name=None):
+        StringIO.__init__(self, value)
+        self.name = name
+
+
+def bench(text, name, options, repeat=1, memory=False):
+    """
+    Run the text through all the phases repeat times and return the
+    Timings instance that accounted for it.  The output is written to
+    memory rather than to disk.
+    """
+
+    timings = Timings(memory=memory)
+    if timings.memory:
+        tracemalloc.start()
+    try:
+        for _ in range(repeat):
+            with timings.phase('read'):
+                text, sourcepath = read(NamedStringIO(text, name))
+            fragments = minify_text(text, sourcepath, options, timings)
+            output = NamedStringIO(name='bench.min.js')
+            write(
+                [fragments], output, NamedStringIO(name='bench.min.js.map'),
+                timings=timings,
+            )
+    finally:
+        if timings.memory:
+            tracemalloc.stop()
+    return timings
+
+
+def corpus(paths, sizes, encoding):
+    """
+    Yield a 2-tuple of the label and text for every benchmark entry.
+    """
+
+    if paths:
+        for path in paths:
+            with codecs.open(path, encoding=encoding) as fd:
+                yield basename(path), fd.read()
+    else:
+        for size in sizes:
+            yield 'generated-%dk' % (size // 1024), generate(size)
+
+
+def format_row(label, size, timings):
+    cols = ['%-20s %9d' % (label[:20], size)]
+    for phase in PHASES:
+        cols.append('%9.4f' % timings.durations[phase])
+    cols.append('%9.4f' % timings.total)
+    if timings.memory:
+        cols.append('%10.1f' % (max(timings.peaks.values()) / 1024.0))
+    return ' '.join(cols)
+
+
+def format_header(memory):
+    cols = ['%-20s %9s' % ('input', 'bytes')]
+    cols.extend('%9s' % phase for phase in PHASES)
+    cols.append('%9s' % 'total')
+    if memory:
+        cols.append('%10s' % 'peak (KiB)')
+    return ' '.join(cols)
+
+
+def create_argparser():
+    parser = ArgumentParser(
+        prog='python -m crimp.bench',
+        description='benchmark the phases of the minification process; '
+                    'times are reported in seconds, summed over every '
+                    'repetition')
+    parser.add_argument(
+        'paths', metavar='input_file', nargs='*',
+        help='path(s) to input file(s) to use instead of the generated '
+             'corpus')
+    parser.add_argument(
+        '-m', '--mangle', action='store_true', default=False,
+        help='enable all basic mangling options')
+    parser.add_argument(
+        '-p', '--pretty-print', dest='pretty', action='store_true',
+        default=False, help='use pretty printer')
+    parser.add_argument(
+        '--optimize', action='store_true', default=False,
+        help='enable the optimization pass')
+    parser.add_argument(
+        '-n', '--repeat', type=int, default=3, metavar='n',
+        help='number of repetitions for every input (default: 3)')
+    parser.add_argument(
+        '--sizes', type=int, nargs='+', default=None, metavar='n',
+        help='sizes of the generated inputs in KiB')
+    parser.add_argument(
+        '--memory', action='store_true', default=False,
+        help='also report the peak memory usage (considerably slower)')
+    parser.add_argument(
+        '--encoding', default='utf8', metavar='<codec>',
+        help='the encoding of the input files')
+    return parser
+
+
+def main(argv=None, stream=None):
+    stream = sys.stdout if stream is None else stream
+    args = create_argparser().parse_args(argv)
+    sizes = [s * 1024 for s in args.sizes] if args.sizes else DEFAULT_SIZES
+    options = printer_options(
+        mangle=args.mangle, pretty=args.pretty, optimize=args.optimize)
+    memory = args.memory and tracemalloc is not None
+
+    # the parser tables are loaded on first use; account for that here
+    # so the first entry is not skewed.
+    timings = Timings()
+    minify_text(u'', None, options, timings)
+    stream.write('# parser loaded in %.4f seconds\n' % timings.total)
+    stream.write('# ' + report())
+    stream.write(format_header(memory) + '\n')
+    for label, text in corpus(args.paths, sizes, args.encoding):
+        timings = bench(
+            text, label, options, repeat=args.repeat, memory=memory)
+        stream.write(format_row(
+            label, len(text.encode('utf8')), timings) + '\n')
+        stream.flush()
+
+
+if __name__ == '__main__':  # pragma: no cover
+    main()
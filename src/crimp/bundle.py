@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency ordered bundling of AMD and CommonJS modules.
+
+Starting from the entry files, the modules they depend on are found
+through the string literals passed to define and require, resolved to
+files and ordered such that every module is listed once, after all of
+the modules it depends on.  The trees parsed to find the dependencies
+are stored in the provided crimp.cache.TreeCache, such that they will
+be reused for the output rather than parsed again; the dependencies of
+every module may also be stored in the on-disk cache, such that the
+unchanged ones will not be parsed at all.
+"""
+
+import logging
+
+from os.path import abspath
+from os.path import dirname
+from os.path import isfile
+from os.path import join
+from os.path import normpath
+
+from crimp.api import InputFile
+from crimp.api import parse_cached
+from crimp.cache import digest
+from crimp.limits import no_limits
+
+logger = logging.getLogger(__name__)
+
+# the special dependencies provided by AMD loaders.
+AMD_SPECIAL = ('require', 'exports', 'module')
+# the functions that declare dependencies through their arguments.
+LOADERS = ('define', 'require')
+
+
+def string_value(node):
+    """
+    Return the value of the String node, without the quotes.
+    """
+
+    return node.value[1:-1]
+
+
+def find_module_ids(tree):
+    """
+    Return the list of the ids of the modules that the tree depends on,
+    in the order they are referenced, i.e. the strings in the arrays
+    passed to define or require, and those passed directly to require.
+    """
+
+    from calmjs.parse import asttypes
+    from calmjs.parse.walkers import Walker
+
+    results = []
+    for node in Walker().filter(tree, lambda node: (
+            isinstance(node, asttypes.FunctionCall) and
+            isinstance(node.identifier, asttypes.Identifier) and
+            node.identifier.value in LOADERS)):
+        for arg in node.args.items:
+            if isinstance(arg, asttypes.Array):
+                results.extend(
+                    string_value(item) for item in arg.items
+                    if isinstance(item, asttypes.String))
+            elif (isinstance(arg, asttypes.String) and
+                    node.identifier.value == 'require'):
+                results.append(string_value(arg))
+    return results
+
+
+def resolve_module(module_id, path, root):
+    """
+    Return the path of the file for the module id as referenced by the
+    file at path, or None if it does not refer to a file (i.e. the
+    special AMD dependencies, loader plugins and URLs).  Relative ids
+    are resolved against the directory of the file, others against the
+    root; the '.js' extension is appended if absent.
+    """
+
+    if module_id in AMD_SPECIAL or '!' in module_id or ':' in module_id:
+        return None
+    base = dirname(path) if module_id.startswith(('./', '../')) else root
+    target = normpath(join(base, module_id))
+    return target if target.endswith('.js') else target + '.js'
+
+
+def bundle(
+        entries, root=None, encoding='utf8', cache=None, tree_cache=None,
+        passthrough=None, limits=no_limits):
+    """
+    Return the list of paths of the entry files along with the modules
+    that they depend on, ordered such that every module is listed once,
+    after all the modules it depends on; circular dependencies are
+    broken where they are first encountered.  Dependencies that cannot
+    be resolved to a file are logged and left out.
+
+    Arguments
+
+    entries
+        The paths of the entry files.
+    root
+        The directory that module ids which are not relative are
+        resolved against; defaults to the directory of the first entry.
+    encoding
+        The encoding of the files.
+    cache
+        An optional crimp.cache.Cache to store the module ids that every
+        module depends on.
+    tree_cache
+        An optional crimp.cache.TreeCache to store the parsed trees in.
+    passthrough
+        An optional predicate as per crimp.api.minify_sources; the
+        matching files are not searched for dependencies.
+    limits
+        An optional crimp.limits.Limits for every file parsed.
+    """
+
+    root = abspath(root) if root else dirname(abspath(entries[0]))
+
+    def dependencies(path):
+        limits.check_file(path)
+        text = InputFile(path, encoding).read()
+        if passthrough is not None and passthrough(text, path):
+            return
+        key = digest('module_ids', digest(text))
+        module_ids = cache.get(key) if cache is not None else None
+        if module_ids is None:
+            with limits.enforce(path):
+                limits.check_size(text, path)
+                tree = parse_cached(text, path, tree_cache)
+                limits.check_depth(tree, path)
+                module_ids = find_module_ids(tree)
+            if cache is not None:
+                cache.put(key, module_ids)
+        for module_id in module_ids:
+            target = resolve_module(module_id, path, root)
+            if target is None:
+                continue
+            if not isfile(target):
+                logger.warning(
+                    'cannot resolve the dependency %r of %r', module_id, path)
+                continue
+            yield target
+
+    results = []
+    visited = set()
+    for entry in entries:
+        entry = abspath(entry)
+        if entry in visited:
+            continue
+        visited.add(entry)
+        # depth first, without recursion such that long chains of
+        # dependencies will not exceed the recursion limit.
+        stack = [(entry, dependencies(entry))]
+        while stack:
+            path, remaining = stack[-1]
+            for target in remaining:
+                if target not in visited:
+                    visited.add(target)
+                    stack.append((target, dependencies(target)))
+                    break
+            else:
+                stack.pop()
+                results.append(path)
+    return results
@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""
+A content addressed, size bounded on-disk cache.
+
+Entries are stored as JSON documents under a two level directory tree
+derived from the hex digest of the key, with the modification time of
+each entry serving as its last access time for the purpose of the least
+recently used eviction.
+
+An in-memory cache of parsed ASTs is also provided, such that the same
+inputs may be printed with different options without being parsed
+again.
+"""
+
+import errno
+import json
+import logging
+import os
+import hashlib
+import threading
+
+from collections import OrderedDict
+
+from os.path import exists
+from os.path import join
+from tempfile import mkstemp
+
+logger = logging.getLogger(__name__)
+
+# 64 MiB
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+SUFFIX = '.json'
+# the defaults for the TreeCache.
+DEFAULT_TREE_COUNT = 256
+DEFAULT_TREE_SIZE = 256 * 1024 * 1024
+# the approximate number of bytes of memory taken up by the AST for
+# every character of the source text.
+TREE_SIZE_FACTOR = 150
+
+
+def digest(*parts):
+    """
+    Produce a hex digest out of the provided text parts.
+    """
+
+    h = hashlib.sha256()
+    for part in parts:
+        data = part.encode('utf8')
+        # length prefix the parts so that the boundaries between them
+        # remain significant.
+        h.update(('%d:' % len(data)).encode('ascii'))
+        h.update(data)
+    return h.hexdigest()
+
+
+class Cache(object):
+    """
+    The on-disk cache.
+    """
+
+    def __init__(self, root, max_size=DEFAULT_MAX_SIZE):
+        """
+        Arguments
+
+        root
+            The directory to store the entries in; will be created when
+            the first entry is stored.
+        max_size
+            The maximum size of all entries in bytes; the least recently
+            used entries will be evicted when the prune method is called
+            and the total size exceeded this value.
+        """
+
+        self.root = root
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return join(self.root, key[:2], key[2:] + SUFFIX)
+
+    def get(self, key):
+        """
+        Return the value stored for the key, or None if not available.
+        """
+
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as fd:
+                value = json.loads(fd.read().decode('utf8'))
+        except (IOError, OSError):
+            self.misses += 1
+            return None
+        except ValueError:
+            # corrupted entry, treat as a miss and get rid of it.
+            logger.warning("removing corrupted cache entry '%s'", path)
+            self._unlink(path)
+            self.misses += 1
+            return None
+
+        try:
+            # mark the entry as recently used.
+            os.utime(path, None)
+        except (IOError, OSError):  # pragma: no cover
+            pass
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """
+        Store the value for the key.  Failures to write are logged but
+        otherwise ignored, as the cache is only an optimization.
+        """
+
+        path = self.path(key)
+        target = os.path.dirname(path)
+        try:
+            if not exists(target):
+                try:
+                    os.makedirs(target)
+                except OSError as e:  # pragma: no cover
+                    # another process may have created it.
+                    if e.errno != errno.EEXIST:
+                        raise
+            fd, tmp = mkstemp(dir=target, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as stream:
+                stream.write(json.dumps(
+                    value, separators=(',', ':'), ensure_ascii=False,
+                ).encode('utf8'))
+            replace_file(tmp, path)
+        except (IOError, OSError) as e:
+            logger.warning("failed to write cache entry '%s': %s", path, e)
+
+    def entries(self):
+        """
+        Yield a 3-tuple of (mtime, size, path) for every stored entry.
+        """
+
+        if not exists(self.root):
+            return
+        for name in sorted(os.listdir(self.root)):
+            subdir = join(self.root, name)
+            if len(name) != 2 or not os.path.isdir(subdir):
+                continue
+            for entry in os.listdir(subdir):
+                if not entry.endswith(SUFFIX):
+                    continue
+                path = join(subdir, entry)
+                try:
+                    st = os.stat(path)
+                except (IOError, OSError):  # pragma: no cover
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def size(self):
+        return sum(size for mtime, size, path in self.entries())
+
+    def prune(self):
+        """
+        Evict the least recently used entries until the total size of
+        the cache falls within the maximum size.  Returns the number of
+        entries removed.
+        """
+
+        entries = sorted(self.entries())
+        total = sum(size for mtime, size, path in entries)
+        removed = 0
+        for mtime, size, path in entries:
+            if total <= self.max_size:
+                break
+            if self._unlink(path):
+                total -= size
+                removed += 1
+        return removed
+
+    def _unlink(self, path):
+        try:
+            os.unlink(path)
+        except (IOError, OSError):  # pragma: no cover
+            return False
+        return True
+
+
+class TreeCache(object):
+    """
+    The in-memory cache of parsed ASTs, keyed by the content of the
+    source text and the sourcepath, with the least recently used entries
+    evicted once either bound is exceeded.  The trees are unaffected by
+    being printed, such that they may be reused with any printer.
+    """
+
+    def __init__(
+            self, max_count=DEFAULT_TREE_COUNT, max_size=DEFAULT_TREE_SIZE):
+        """
+        Arguments
+
+        max_count
+            The maximum number of trees.
+        max_size
+            The maximum approximate size of all trees in bytes, as
+            estimated from the size of their source texts (see
+            TREE_SIZE_FACTOR); trees larger than this are not stored.
+        """
+
+        self.max_count = max_count
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, text, sourcepath):
+        """
+        Return the tree for the text and sourcepath, or None if absent.
+        """
+
+        key = (digest(text), sourcepath)
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                self.misses += 1
+                return None
+            # now the most recently used.
+            self.entries[key] = entry
+            self.hits += 1
+            return entry[0]
+
+    def contains(self, text, sourcepath):
+        """
+        Return whether the tree for the text and sourcepath is present,
+        without it being counted as a hit or a miss.
+        """
+
+        with self.lock:
+            return (digest(text), sourcepath) in self.entries
+
+    def put(self, text, sourcepath, tree):
+        """
+        Store the tree parsed from the text with the sourcepath.
+        """
+
+        size = len(text) * TREE_SIZE_FACTOR
+        if size > self.max_size:
+            return
+        key = (digest(text), sourcepath)
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= previous[1]
+            self.entries[key] = (tree, size)
+            self.size += size
+            while (
+                    len(self.entries) > self.max_count or
+                    self.size > self.max_size):
+                _, (_, evicted) = self.entries.popitem(last=False)
+                self.size -= evicted
+
+
+def replace_file(src, dst):
+    try:
+        os.replace(src, dst)
+    except AttributeError:  # pragma: no cover
+        # Python 2 on Windows cannot rename over existing files.
+        if exists(dst):
+            os.unlink(dst)
+        os.rename(src, dst)
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+"""
+Resource limits for the processing of every input, for sources that
+cannot be trusted to be of a reasonable size or complexity.
+
+The size of an input is checked before it is read (where it is a file)
+and before it is parsed, and the depth of its tree before it is
+transformed or unparsed, as both recurse through the tree; trees that
+are too deep to be unparsed are rejected regardless of the limits.
+
+The wall-clock time taken and the resident set size of the process are
+checked through SIGALRM while the input is processed, which requires
+the main thread of a process on a platform that provides setitimer;
+elsewhere the time taken is only checked once the input was processed.
+The resident set size is only checked in worker processes, as that of
+the main process also accounts for everything else it holds; the
+server always processes the inputs in worker processes, as does the API
+where it is set.
+"""
+
+import os
+import signal
+import sys
+
+from contextlib import contextmanager
+from os.path import getsize
+from timeit import default_timer
+
+try:
+    RecursionError = RecursionError
+except NameError:  # pragma: no cover
+    # Python 2.
+    RecursionError = RuntimeError
+
+# the interval between the checks of the resident set size, in seconds.
+RSS_INTERVAL = 0.05
+
+
+class LimitExceeded(Exception):
+    """
+    Raised for an input that exceeds one of the limits.
+    """
+
+
+def rss():
+    """
+    Return the resident set size of the current process in bytes, or
+    the peak resident set size where the current one is unavailable.
+    """
+
+    try:
+        with open('/proc/self/statm') as fd:
+            pages = int(fd.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (IOError, OSError, IndexError, ValueError):
+        pass
+
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS, and in KiB elsewhere.
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def in_worker():
+    """
+    Return whether the current process is a worker process.
+    """
+
+    # deferred, as it is costly to import and only loaded for jobs.
+    from multiprocessing import current_process
+    return current_process().name != 'MainProcess'
+
+
+class Limits(object):
+    """
+    The limits for the processing of every input.
+    """
+
+    def __init__(
+            self, max_bytes=None, max_depth=None, timeout=None,
+            max_rss=None):
+        """
+        Arguments
+
+        max_bytes
+            The maximum size of an input, in bytes as encoded in UTF-8.
+        max_depth
+            The maximum depth of the tree of an input, in nodes.
+        timeout
+            The maximum wall-clock time to process an input, in seconds.
+        max_rss
+            The maximum resident set size of a worker process while it
+            processes an input, in bytes.
+        """
+
+        self.max_bytes = max_bytes
+        self.max_depth = max_depth
+        self.timeout = timeout
+        self.max_rss = max_rss
+
+    def check_file(self, path):
+        """
+        Raise LimitExceeded if the file at path exceeds max_bytes, such
+        that it will not be read.
+        """
+
+        if self.max_bytes and getsize(path) > self.max_bytes:
+            raise LimitExceeded(
+                'input %r exceeds the size limit of %d bytes' % (
+                    path, self.max_bytes))
+
+    def check_size(self, text, sourcepath):
+        """
+        Raise LimitExceeded if the text exceeds max_bytes.
+        """
+
+        # as no character is encoded in less than a byte, the encoding
+        # of text that is too long is skipped.
+        if self.max_bytes and (len(text) > self.max_bytes or len(
+                text.encode('utf8')) > self.max_bytes):
+            raise LimitExceeded(
+                'input %r exceeds the size limit of %d bytes' % (
+                    sourcepath, self.max_bytes))
+
+    def check_depth(self, tree, sourcepath):
+        """
+        Raise LimitExceeded if the depth of the tree exceeds max_depth.
+        """
+
+        if not self.max_depth:
+            return
+        nodes = [(tree, 1)]
+        while nodes:
+            node, depth = nodes.pop()
+            if depth > self.max_depth:
+                raise LimitExceeded(
+                    'input %r exceeds the nesting depth limit of %d' % (
+                        sourcepath, self.max_depth))
+            nodes.extend((child, depth + 1) for child in node)
+
+    @contextmanager
+    def enforce(self, sourcepath):
+        """
+        Enforce the timeout and max_rss while the input at sourcepath is
+        processed within the context, raising LimitExceeded from within
+        it once either is exceeded.  Trees too deep to be processed are
+        also reported as LimitExceeded.
+        """
+
+        start = default_timer()
+        max_rss = self.max_rss if self.max_rss and in_worker() else None
+        state = {'active': True}
+
+        def check(*args):
+            if not state['active']:
+                return
+            if self.timeout and default_timer() - start > self.timeout:
+                disarm()
+                raise LimitExceeded(
+                    'input %r exceeds the time limit of %s seconds' % (
+                        sourcepath, self.timeout))
+            if max_rss and rss() > max_rss:
+                disarm()
+                raise LimitExceeded(
+                    'input %r exceeds the memory limit of %d bytes' % (
+                        sourcepath, max_rss))
+
+        def disarm():
+            state['active'] = False
+            if armed:
+                signal.setitimer(signal.ITIMER_REAL, 0)
+
+        armed = False
+        if (self.timeout or max_rss) and hasattr(signal, 'setitimer'):
+            try:
+                previous = signal.signal(signal.SIGALRM, check)
+            except ValueError:
+                # not the main thread.
+                pass
+            else:
+                armed = True
+                if max_rss:
+                    signal.setitimer(
+                        signal.ITIMER_REAL, RSS_INTERVAL, RSS_INTERVAL)
+                else:
+                    signal.setitimer(signal.ITIMER_REAL, self.timeout)
+
+        try:
+            yield
+        except RecursionError:
+            raise LimitExceeded(
+                'input %r is nested too deeply to be processed' % (
+                    sourcepath,))
+        finally:
+            disarm()
+            if armed:
+                signal.signal(signal.SIGALRM, previous)
+        state['active'] = True
+        check()
+
+
+# the default, for no limits.
+no_limits = Limits()
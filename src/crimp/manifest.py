@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+"""
+The manifest for incremental rebuilds.
+
+A manifest is stored alongside an output, recording the size, the
+modification time and the content hash of every input that went into
+it, along with the stream fragments produced for them.  Inputs that
+remain unchanged on subsequent runs will have their recorded fragments
+reused, without being read (if the size and modification time match)
+or parsed (if the content hash matches) again.
+"""
+
+import json
+import logging
+import os
+
+from os.path import dirname
+from tempfile import mkstemp
+
+from crimp.cache import digest
+from crimp.cache import replace_file
+
+logger = logging.getLogger(__name__)
+
+VERSION = 1
+
+
+class Manifest(object):
+    """
+    The manifest.
+    """
+
+    def __init__(self, path, key):
+        """
+        Arguments
+
+        path
+            The path to the manifest file, or None for a manifest that
+            is only kept in memory.
+        key
+            The key for the options that the fragments are produced
+            with (i.e. the value from crimp.api.options_key); recorded
+            entries produced with a different key are discarded.
+        """
+
+        self.path = path
+        self.key = key
+        self.entries = {}
+        self.updated = {}
+        self.hits = 0
+
+    def load(self):
+        if self.path is None:
+            return
+        try:
+            with open(self.path, 'rb') as fd:
+                raw = json.loads(fd.read().decode('utf8'))
+        except (IOError, OSError):
+            return
+        except ValueError:
+            logger.warning("ignoring corrupted manifest '%s'", self.path)
+            return
+
+        if raw.get('version') != VERSION or raw.get('key') != self.key:
+            logger.debug("discarding outdated manifest '%s'", self.path)
+            return
+        self.entries = raw.get('inputs', {})
+
+    def stat(self, path):
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+
+    def lookup(self, path):
+        """
+        Return the recorded fragments for the input at path if its size
+        and modification time are unchanged, otherwise None.
+        """
+
+        entry = self.entries.get(path)
+        if entry is None:
+            return None
+        try:
+            size, mtime = self.stat(path)
+        except (IOError, OSError):
+            return None
+        if entry['size'] != size or entry['mtime'] != mtime:
+            return None
+        self.updated[path] = entry
+        self.hits += 1
+        return entry['fragments']
+
+    def lookup_text(self, path, text):
+        """
+        Return the recorded fragments for the input at path if the hash
+        of its content is unchanged, otherwise None.
+        """
+
+        entry = self.entries.get(path)
+        if entry is None or entry['hash'] != digest(text):
+            return None
+        # the size and modification time may be updated.
+        self.update(path, text, entry['fragments'])
+        self.hits += 1
+        return entry['fragments']
+
+    def digest(self, path):
+        """
+        Return the recorded hash of the content of the input at path,
+        for an input that has been looked up or updated.
+        """
+
+        return self.updated[path]['hash']
+
+    def update(self, path, text, fragments):
+        """
+        Record the serialized fragments for the input at path that has
+        the provided text.
+        """
+
+        try:
+            size, mtime = self.stat(path)
+        except (IOError, OSError):  # pragma: no cover
+            return
+        self.updated[path] = {
+            'size': size,
+            'mtime': mtime,
+            'hash': digest(text),
+            'fragments': fragments,
+        }
+
+    def save(self):
+        """
+        Write out the manifest with only the entries that have been
+        looked up or updated since it was loaded (or last saved).  If
+        the path is None, the entries are only kept in memory.
+        """
+
+        self.entries = self.updated
+        self.updated = {}
+        if self.path is None:
+            return
+        fd, tmp = mkstemp(dir=dirname(self.path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                stream.write(json.dumps({
+                    'version': VERSION,
+                    'key': self.key,
+                    'inputs': self.entries,
+                }, separators=(',', ':'), ensure_ascii=False).encode('utf8'))
+            # mkstemp creates the file with a restrictive mode.
+            umask = os.umask(0)
+            os.umask(umask)
+            os.chmod(tmp, 0o666 & ~umask)
+            replace_file(tmp, self.path)
+        except Exception:
+            os.unlink(tmp)
+            raise
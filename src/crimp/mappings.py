@@ -0,0 +1,502 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental encoding of source map mappings.
+
+The write function provided by calmjs.parse.sourcemap accumulates the
+raw mappings for the complete output as lists of tuples before they are
+normalized and encoded, which for large outputs will take up many times
+more memory than the output itself.  The encoder provided here accepts
+the raw segments as they are produced, such that only the encoded form
+needs to be kept.
+
+Inputs that were themselves generated may reference their own source
+maps, which may be composed with the source map produced for the output
+such that it maps back to the original sources.
+
+Alternatively, an index map may be produced with a section for every
+input, such that the section for an input may be reused as long as the
+input remains unchanged.
+"""
+
+import json
+import base64
+import logging
+import re
+
+from bisect import bisect_right
+from io import StringIO
+from os.path import dirname
+from os.path import isabs
+from os.path import join
+from os.path import normpath
+
+try:
+    from urllib.parse import unquote
+except ImportError:  # pragma: no cover
+    # Python 2
+    from urllib import unquote
+
+from calmjs.parse import sourcemap
+from calmjs.parse.sourcemap import default_encoding
+from calmjs.parse.sourcemap import verify_write_sourcemap_args
+from calmjs.parse.vlq import decode_vlqs
+from calmjs.parse.vlq import encode_vlqs
+
+logger = logging.getLogger(__name__)
+
+# the source map comment on the last line of an input.
+SOURCE_MAP_COMMENT = re.compile(br'^\s*//[#@]\s*sourceMappingURL=(\S+)\s*$')
+# the number of bytes read from the end of an input for the comment,
+# before reading the input in its entirety (e.g. for inline maps).
+TAIL_SIZE = 4096
+
+
+class MappingsEncoder(object):
+    """
+    Normalizes and encodes the raw segments produced by the write
+    function from calmjs.parse.sourcemap, with the result identical to
+    what normalize_mappings followed by encode_mappings would produce
+    for the complete list of mappings.
+    """
+
+    def __init__(self):
+        self.buffer = StringIO()
+        # the source column is carried over between lines.
+        self.column = 0
+        self.new_line()
+
+    def new_line(self):
+        self.record = [0, 0, 0, self.column]
+        self.regen_next = True
+        # the length of the previous segment written for the line.
+        self.previous = None
+
+    def emit(self, segment):
+        if self.previous is not None:
+            self.buffer.write(u',')
+        self.buffer.write(encode_vlqs(segment))
+        self.previous = len(segment)
+
+    def push(self, segment):
+        """
+        Push a raw segment for the current line.  The logic is identical
+        to normalize_mapping_line from calmjs.parse.sourcemap.
+        """
+
+        record = self.record
+        if not segment:
+            return
+        record[0] += segment[0]
+        if len(segment) == 1:
+            if self.previous is not None and self.previous != 1:
+                self.emit((record[0],))
+                record[0] = 0
+                self.regen_next = True
+            return
+
+        record[3] += segment[3]
+        if len(segment) == 5 or self.regen_next or segment[1] or (
+                segment[2]) or record[0] != record[3]:
+            self.emit(
+                (record[0], segment[1], segment[2], record[3], segment[4])
+                if len(segment) == 5 else
+                (record[0], segment[1], segment[2], record[3])
+            )
+            record[:] = [0, 0, 0, 0]
+            self.regen_next = len(segment) == 5
+
+    def push_line(self):
+        """
+        End the current line.
+        """
+
+        self.column = self.record[3]
+        self.buffer.write(u';')
+        self.new_line()
+
+    def update(self, mappings):
+        """
+        Consume the raw mappings list as produced by the write function
+        from calmjs.parse.sourcemap, where the first line is a
+        continuation of the current line, and clear it such that it may
+        be passed back for further writes.
+        """
+
+        for idx, line in enumerate(mappings):
+            if idx:
+                self.push_line()
+            for segment in line:
+                self.push(segment)
+        mappings[:] = [[]]
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+
+def write_sourcemap(
+        mappings, sources, names, output_stream, sourcemap_stream):
+    """
+    Identical to write_sourcemap from calmjs.parse.sourcemap, except the
+    mappings are provided already encoded as a string.
+    """
+
+    (filename, mappings, sources, names), output_js_map = (
+        verify_write_sourcemap_args(
+            mappings, sources, names, output_stream, sourcemap_stream))
+
+    write_encoded_sourcemap(json.dumps({
+        'version': 3,
+        'sources': sources,
+        'names': names,
+        'mappings': mappings,
+        'file': filename,
+    }, sort_keys=True, ensure_ascii=False), output_js_map,
+        output_stream, sourcemap_stream)
+
+
+def write_index_map(sections, output_stream, sourcemap_stream):
+    """
+    Write out an index map in the same manner as write_sourcemap.
+
+    Arguments
+
+    sections
+        A list of 2-tuples of the offset (a 2-tuple of the zero-based
+        line and column) and the source map of the section, as produced
+        by encode_section.
+    """
+
+    (filename, _, _, _), output_js_map = verify_write_sourcemap_args(
+        '', [], [], output_stream, sourcemap_stream)
+    results = []
+    for (line, column), section in sections:
+        # for the normalization of the sources.
+        (_, mappings, sources, names), _ = verify_write_sourcemap_args(
+            section['mappings'], section['sources'], section['names'],
+            output_stream, sourcemap_stream)
+        results.append({
+            'offset': {'line': line, 'column': column},
+            'map': {
+                'version': 3,
+                'sources': sources,
+                'names': names,
+                'mappings': mappings,
+            },
+        })
+
+    write_encoded_sourcemap(json.dumps({
+        'version': 3,
+        'file': filename,
+        'sections': results,
+    }, sort_keys=True, ensure_ascii=False), output_js_map,
+        output_stream, sourcemap_stream)
+
+
+def write_encoded_sourcemap(
+        encoded_sourcemap, output_js_map, output_stream, sourcemap_stream):
+    """
+    Write the encoded source map and the reference to it.
+    """
+
+    if sourcemap_stream is output_stream:
+        encoding = getattr(output_stream, 'encoding', None) or default_encoding
+        output_stream.writelines([
+            u'\n//# sourceMappingURL=data:application/json;base64;charset=',
+            encoding, u',', base64.b64encode(
+                encoded_sourcemap.encode(encoding)).decode('ascii'),
+        ])
+    else:
+        output_stream.writelines(
+            [u'\n//# sourceMappingURL=', output_js_map, u'\n'])
+        sourcemap_stream.write(encoded_sourcemap)
+
+
+def decode_mappings(mappings):
+    """
+    Decode the mappings string into a list of lines of segments, with
+    every field of the segments being absolute rather than relative to
+    the previous segment.
+    """
+
+    result = []
+    # the source, source line, source column and name.
+    state = [0, 0, 0, 0]
+    for line in mappings.split(';'):
+        column = 0
+        segments = []
+        for raw in line.split(','):
+            if not raw:
+                continue
+            values = decode_vlqs(raw)
+            column += values[0]
+            for idx, value in enumerate(values[1:]):
+                state[idx] += value
+            segments.append((column,) + tuple(state[:len(values) - 1]))
+        result.append(segments)
+    return result
+
+
+def encode_mappings(lines):
+    """
+    The reverse of decode_mappings.
+    """
+
+    buffer = StringIO()
+    state = [0, 0, 0, 0]
+    for idx, segments in enumerate(lines):
+        if idx:
+            buffer.write(u';')
+        column = 0
+        for pos, segment in enumerate(segments):
+            if pos:
+                buffer.write(u',')
+            values = [segment[0] - column]
+            column = segment[0]
+            for field, value in enumerate(segment[1:]):
+                values.append(value - state[field])
+                state[field] = value
+            buffer.write(encode_vlqs(values))
+    return buffer.getvalue()
+
+
+class SourceMap(object):
+    """
+    A source map of an input, for the lookup of the original positions
+    of the positions within the input.
+    """
+
+    def __init__(self, data, base_dir=None):
+        """
+        Arguments
+
+        data
+            The source map as a dict.
+        base_dir
+            The directory that relative sources are resolved against,
+            i.e. where the source map is located.
+        """
+
+        if 'sections' in data:
+            raise ValueError('index source maps are unsupported')
+        root = data.get('sourceRoot') or ''
+        self.sources = [
+            resolve_source(source, base_dir, root)
+            for source in data.get('sources', [])
+        ]
+        self.names = list(data.get('names', []))
+        self.lines = decode_mappings(data.get('mappings', ''))
+        # the generated columns for every line, for the binary search.
+        self.columns = [
+            [segment[0] for segment in line] for line in self.lines]
+
+    def lookup(self, line, column):
+        """
+        Return a 4-tuple of the original source, line, column and name
+        (or None) of the position at the line and column (both
+        zero-based), or None if that is unmapped.  The position is
+        resolved through the segment that covers it, offset by the
+        distance from the start of that segment, as the mappings may
+        have been normalized such that the columns that follow the
+        start of a segment are implied (as done by calmjs.parse).
+        """
+
+        if line >= len(self.lines):
+            return None
+        idx = bisect_right(self.columns[line], column) - 1
+        if idx < 0:
+            return None
+        segment = self.lines[line][idx]
+        if len(segment) < 4:
+            return None
+        offset = column - segment[0]
+        return (
+            self.sources[segment[1]], segment[2], segment[3] + offset,
+            # the name only applies to the start of the segment.
+            self.names[segment[4]] if len(segment) > 4 and not offset else
+            None,
+        )
+
+
+def is_absolute(source):
+    """
+    Return whether the source is an absolute path or an URL.
+    """
+
+    return isabs(source) or bool(re.match(r'^\w+:', source))
+
+
+def resolve_source(source, base_dir, root=''):
+    """
+    Resolve the source against the root and then the directory, unless
+    it is (or becomes) an absolute path or an URL, or the directory is
+    unknown.
+    """
+
+    if not is_absolute(source):
+        source = root + source
+    if base_dir is None or is_absolute(source):
+        return source
+    return normpath(join(base_dir, unquote(source)))
+
+
+def read_last_line(path):
+    """
+    Return the last non-blank line of the file at path, as bytes.
+    """
+
+    with open(path, 'rb') as fd:
+        fd.seek(0, 2)
+        size = fd.tell()
+        fd.seek(max(0, size - TAIL_SIZE))
+        data = fd.read().rstrip()
+        if b'\n' not in data and size > TAIL_SIZE:
+            fd.seek(0)
+            data = fd.read().rstrip()
+    return data[data.rfind(b'\n') + 1:]
+
+
+def load_data_url(url):
+    """
+    Return the content of the data URL as text.
+    """
+
+    header, _, data = url.partition(',')
+    if header.endswith(';base64'):
+        return base64.b64decode(data).decode('utf8')
+    return unquote(data)
+
+
+def find_source_map(path):
+    """
+    Return the SourceMap referenced by the sourceMappingURL comment at
+    the end of the input file at path, or None if it does not have one.
+    Source maps that cannot be loaded are logged and ignored.
+    """
+
+    match = SOURCE_MAP_COMMENT.match(read_last_line(path))
+    if not match:
+        return None
+    url = match.group(1).decode('utf8')
+    base_dir = dirname(path)
+    try:
+        if url.startswith('data:'):
+            data = json.loads(load_data_url(url))
+        else:
+            map_path = resolve_source(url, base_dir)
+            with open(map_path, 'rb') as fd:
+                data = json.loads(fd.read().decode('utf8'))
+            base_dir = dirname(map_path)
+        return SourceMap(data, base_dir)
+    except (IOError, OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(
+            'ignoring the source map for %r: %s', path, e)
+        return None
+
+
+def compose(mappings, sources, names, source_maps):
+    """
+    Compose the encoded mappings with the source maps of the sources,
+    returning a 3-tuple of the encoded mappings, the sources and the
+    names.  The positions within the sources that have a source map are
+    replaced with the original positions that they were generated from;
+    where unmapped, the segment will also be unmapped.
+
+    Arguments
+
+    mappings
+        The encoded mappings.
+    sources
+        The list of sources for the mappings.
+    names
+        The list of names for the mappings.
+    source_maps
+        A dict of SourceMap instances, keyed by the source they apply
+        to.
+    """
+
+    result_sources = []
+    result_names = []
+    source_ids = {}
+    name_ids = {}
+
+    def get_id(ids, values, value):
+        if value not in ids:
+            ids[value] = len(values)
+            values.append(value)
+        return ids[value]
+
+    lines = decode_mappings(mappings)
+    for segments in lines:
+        for idx, segment in enumerate(segments):
+            if len(segment) < 4:
+                continue
+            source = sources[segment[1]]
+            name = names[segment[4]] if len(segment) > 4 else None
+            source_map = source_maps.get(source)
+            if source_map is not None:
+                original = source_map.lookup(segment[2], segment[3])
+                if original is None:
+                    segments[idx] = (segment[0],)
+                    continue
+                source, line, column, original_name = original
+                name = original_name or name
+            else:
+                line, column = segment[2], segment[3]
+            segments[idx] = (
+                segment[0], get_id(source_ids, result_sources, source),
+                line, column,
+            ) + (() if name is None else (
+                get_id(name_ids, result_names, name),))
+
+    return encode_mappings(lines), result_sources, result_names
+
+
+class PositionTracker(object):
+    """
+    Wraps a stream to track the zero-based line and column that the
+    next text will be written at.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.line = 0
+        self.column = 0
+
+    def write(self, text):
+        self.stream.write(text)
+        newlines = text.count(u'\n')
+        if newlines:
+            self.line += newlines
+            self.column = len(text) - text.rfind(u'\n') - 1
+        else:
+            self.column += len(text)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
+
+
+def encode_section(fragments, stream):
+    """
+    Write the stream fragments to the stream, and return the source map
+    for them as a dict of the sources, names and encoded mappings, with
+    the positions being relative to where the first fragment was
+    written, for use as a section of an index map.
+    """
+
+    sources = sourcemap.Names()
+    names = sourcemap.Names()
+    mappings = [[]]
+    sourcemap.write(
+        fragments, stream, normalize=False, book=sourcemap.default_book(),
+        sources=sources, names=names, mappings=mappings)
+    encoder = MappingsEncoder()
+    encoder.update(mappings)
+    return {
+        'sources': [
+            sourcemap.INVALID_SOURCE if s == NotImplemented else s
+            for s in sources
+        ],
+        'names': list(names),
+        'mappings': encoder.getvalue(),
+    }
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Name obfuscation with a scope shared by all the inputs of an output.
+
+The obfuscate rule provided by calmjs.parse creates an Obfuscator for
+every tree, such that every input combined into an output is analyzed
+in isolation from the others, despite them sharing the global scope
+once combined.  The SharedObfuscator here analyzes all the trees up
+front before any of them are unparsed, such that the names referenced
+in any of the inputs are accounted for, and the replacement names are
+generated from a charset ordered by the frequency of the characters
+across all the inputs, as names made up of characters that are common
+in the rest of the output compress better.
+"""
+
+from collections import Counter
+
+from calmjs.parse.handlers.core import token_handler_unobfuscate
+from calmjs.parse.handlers.obfuscation import ID_CHARS
+from calmjs.parse.handlers.obfuscation import NameGenerator
+from calmjs.parse.handlers.obfuscation import Obfuscator
+from calmjs.parse.ruletypes import Resolve
+
+
+def frequency_charset(texts, charset=ID_CHARS):
+    """
+    Return the charset ordered by the frequency of the characters in
+    the texts, most frequent first; ties retain their original order.
+    """
+
+    counts = Counter()
+    for text in texts:
+        counts.update(text)
+    return ''.join(sorted(charset, key=lambda c: -counts[c]))
+
+
+class SharedObfuscator(Obfuscator):
+    """
+    The name obfuscator for a list of trees that share the global scope.
+    """
+
+    def __init__(self, trees, charset=ID_CHARS, **kwargs):
+        """
+        Arguments
+
+        trees
+            The list of trees that will be unparsed.
+        charset
+            The characters to generate the replacement names with, in
+            the order that they will be used.
+
+        Remaining keyword arguments are passed to the Obfuscator.
+        """
+
+        super(SharedObfuscator, self).__init__(**kwargs)
+        self.trees = trees
+        self.charset = charset
+        self.finalized = False
+
+    def finalize(self):
+        # identical to the parent, except for the charset.
+        self.global_scope.close()
+        name_generator = NameGenerator(
+            skip=self.reserved_keywords, charset=self.charset)
+        self.global_scope.build_remap_symbols(
+            name_generator,
+            children_only=not self.obfuscate_globals,
+        )
+        self.finalized = True
+
+    def prewalk_hook(self, dispatcher, node):
+        """
+        Analyze all the trees before the first of them is unparsed.
+        """
+
+        if not self.finalized:
+            for tree in self.trees:
+                self.walk(dispatcher, tree)
+            self.finalize()
+        return node
+
+    def rules(self):
+        """
+        The rule for the Unparser, in place of the obfuscate rule from
+        calmjs.parse.rules.
+        """
+
+        return {
+            'token_handler': token_handler_unobfuscate,
+            'deferrable_handlers': {
+                Resolve: self.resolve,
+            },
+            'prewalk_hooks': [
+                self.prewalk_hook,
+            ],
+        }
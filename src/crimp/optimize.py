@@ -0,0 +1,714 @@
+# -*- coding: utf-8 -*-
+"""
+An optional optimization pass over the parsed trees, applied before they
+are unparsed: constant expressions are folded, unreachable statements
+and the branches that can never be taken are dropped, and the function
+declarations that are never referenced within the function declaring
+them are removed.
+
+Only transformations that preserve the semantics of the program are
+applied, such that anything that cannot be proven (e.g. the value of a
+floating point expression, or whether a name may be looked up through
+eval or with) is left as is.  The trees are not modified, as they may
+be shared through the crimp.cache.TreeCache; the nodes that change are
+copied instead.
+"""
+
+import re
+from collections import Counter
+from copy import copy
+
+from calmjs.parse import asttypes
+
+try:
+    text_type = unicode
+except NameError:  # pragma: no cover
+    text_type = str
+
+# only the decimal integer literals are folded, as the formatting of
+# floating point numbers by JavaScript and Python differ.
+INTEGER = re.compile(r'^(0|[1-9][0-9]*)$')
+MAX_SAFE_INTEGER = 2 ** 53 - 1
+
+# the nodes where a list attribute holds a list of statements.
+STATEMENT_LISTS = (
+    asttypes.Program, asttypes.Block, asttypes.FuncBase, asttypes.Case,
+    asttypes.Default, asttypes.GetPropAssign, asttypes.SetPropAssign,
+)
+# the nodes that have their own scope for the variable declarations.
+FUNCTIONS = (
+    asttypes.FuncBase, asttypes.GetPropAssign, asttypes.SetPropAssign)
+# the statements that are never followed by the next statement.
+JUMPS = (
+    asttypes.Return, asttypes.Throw, asttypes.Break, asttypes.Continue)
+# the attributes that are not part of the tree being transformed.
+SKIPPED = ('comments', '_token_map')
+# the attributes of the nodes where an identifier is not a reference.
+BINDINGS = {
+    'identifier': (
+        asttypes.VarDecl, asttypes.FuncBase, asttypes.Catch, asttypes.Label,
+        asttypes.Break, asttypes.Continue, asttypes.DotAccessor),
+    'parameters': (asttypes.FuncBase,),
+    'parameter': (asttypes.SetPropAssign,),
+    'prop_name': (asttypes.GetPropAssign, asttypes.SetPropAssign),
+    'left': (asttypes.Assign,),
+    'item': (asttypes.ForIn,),
+}
+
+# the value for an expression that cannot be evaluated.
+UNKNOWN = object()
+
+# the literal nodes for the source text of the defines.
+_literals = {}
+
+
+def optimize(tree, defines=None):
+    """
+    Return the optimized version of the tree, leaving it unmodified.
+
+    Arguments
+
+    tree
+        The tree to optimize.
+    defines
+        An optional mapping of names to the source text of literals
+        (e.g. {'DEBUG': 'false'}), such that the references to the
+        global variables of those names are replaced by the literals,
+        which allows the branches that depend on them to be dropped.
+    """
+
+    return transform(tree, dict(
+        (name, define_literal(value))
+        for name, value in (defines or {}).items()
+    ))
+
+
+def define_literal(text):
+    """
+    Return the literal node for the source text of a define, i.e. a
+    string, number, boolean or null, or raise a ValueError if it is not
+    a literal.
+    """
+
+    from calmjs.parse.exceptions import ECMASyntaxError
+    from crimp.api import parse_text
+
+    if text not in _literals:
+        try:
+            statements = parse_text(text, None).children()
+        except ECMASyntaxError:
+            statements = []
+        node = (
+            statements[0].expr
+            if len(statements) == 1 and
+            isinstance(statements[0], asttypes.ExprStatement) else None
+        )
+        if isinstance(node, asttypes.UnaryExpr) and node.op == '-':
+            valid = isinstance(node.value, asttypes.Number)
+        else:
+            valid = isinstance(node, (
+                asttypes.Boolean, asttypes.Null, asttypes.Number,
+                asttypes.String))
+        if not valid:
+            raise ValueError('%r is not a literal' % text)
+        _literals[text] = node
+    return _literals[text]
+
+
+def is_binding(node, key):
+    """
+    Return whether an identifier at the key of the node is the target
+    of a declaration or an assignment, or otherwise not a reference.
+    """
+
+    if isinstance(node, asttypes.UnaryExpr) and node.op in (
+            '++', '--', 'delete'):
+        return key == 'value'
+    return isinstance(node, BINDINGS.get(key, ()))
+
+
+def scope_names(node):
+    """
+    Return the set of names declared by the scope of the function or
+    the program, including the parameters of the function.
+    """
+
+    names = set()
+    if isinstance(node, asttypes.FuncExpr) and node.identifier:
+        names.add(node.identifier.value)
+    if isinstance(node, asttypes.Program):
+        nodes = list(node)
+    else:
+        parameters = getattr(node, 'parameters', None) or []
+        parameter = getattr(node, 'parameter', None)
+        nodes = list(node.elements) + parameters + (
+            [parameter] if parameter else [])
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, asttypes.Identifier):
+            names.add(node.value)
+        elif isinstance(node, asttypes.FuncDecl):
+            names.add(node.identifier.value)
+        elif not isinstance(node, FUNCTIONS):
+            if isinstance(node, asttypes.VarDecl):
+                names.add(node.identifier.value)
+            nodes.extend(
+                child for child in node
+                if not isinstance(child, asttypes.Identifier))
+    return names
+
+
+def scoped(node, defines):
+    """
+    Return the defines that apply within the node, which excludes the
+    names that it declares in a new scope.
+    """
+
+    if isinstance(node, asttypes.With):
+        return {}
+    if isinstance(node, asttypes.Catch):
+        names = set([node.identifier.value])
+    elif isinstance(node, FUNCTIONS):
+        if is_dynamic(node):
+            return {}
+        names = scope_names(node)
+    elif isinstance(node, asttypes.Program):
+        names = scope_names(node)
+    else:
+        return defines
+    if not names.intersection(defines):
+        return defines
+    return dict(
+        (name, value) for name, value in defines.items()
+        if name not in names
+    )
+
+
+def transform_node(node, defines, names):
+    """
+    Return the optimized version of the node, or the literal to replace
+    it with if it is a reference to one of the names of the defines.
+    """
+
+    if not names or not isinstance(node, asttypes.Identifier) or isinstance(
+            node, asttypes.PropIdentifier) or node.value not in names:
+        return transform(node, defines)
+    result = at(copy(names[node.value]), node)
+    if isinstance(result, asttypes.UnaryExpr):
+        return at(asttypes.GroupingOp(result), node)
+    return result
+
+
+def transform(node, defines=None):
+    """
+    Return the optimized version of the node, which is a copy of the
+    node where any of its children changed.
+    """
+
+    if defines:
+        defines = scoped(node, defines)
+    result = node
+    for key, value in vars(node).items():
+        if key in SKIPPED:
+            continue
+        names = None if is_binding(node, key) else defines
+        if isinstance(value, asttypes.Node):
+            new = transform_node(value, defines, names)
+        elif isinstance(value, list):
+            new = transform_list(
+                value, isinstance(node, STATEMENT_LISTS), defines, names)
+        else:
+            continue
+        if new is not value:
+            if result is node:
+                result = copy(node)
+            setattr(result, key, new)
+    if (result is not node and isinstance(node, asttypes.ExprStatement) and
+            isinstance(result.expr, asttypes.String)):
+        # a string produced as a statement would be taken as a directive.
+        result.expr = at(asttypes.GroupingOp(result.expr), result.expr)
+    return simplify(result)
+
+
+def transform_list(values, statements, defines=None, names=None):
+    """
+    Return the list of the optimized versions of the values, which may
+    be a list of statements, or the values if none of them changed; the
+    names are the defines that apply to the identifiers in the list.
+    """
+
+    results = []
+    for value in values:
+        if not isinstance(value, asttypes.Node):
+            results.append(value)
+            continue
+        value = transform_node(value, defines, names)
+        if statements:
+            results.extend(splice(value))
+        else:
+            results.append(value)
+    if statements:
+        results = prologue(drop_unreachable(results), values)
+    if len(results) == len(values) and all(
+            result is value for result, value in zip(results, values)):
+        return values
+    return results
+
+
+def is_directive(node):
+    return isinstance(node, asttypes.ExprStatement) and isinstance(
+        node.expr, asttypes.String)
+
+
+def prologue(results, values):
+    """
+    Return the results with the strings that became the leading
+    statements of the list (e.g. from a block spliced into it) wrapped
+    in a GroupingOp, as they would be taken as directives otherwise.
+    """
+
+    directives = set()
+    for value in values:
+        if not is_directive(value):
+            break
+        directives.add(id(value))
+    for idx, result in enumerate(results):
+        if not is_directive(result):
+            break
+        if id(result) not in directives:
+            result = results[idx] = copy(result)
+            result.expr = at(asttypes.GroupingOp(result.expr), result.expr)
+    return results
+
+
+def splice(statement):
+    """
+    Return the list of statements to splice into a list of statements
+    in place of the statement, which are those within it if it is a
+    block that does not declare any functions, as blocks do not have
+    their own scope.
+    """
+
+    if (not isinstance(statement, asttypes.Block) or
+            isinstance(statement, asttypes.CaseBlock) or any(
+                isinstance(child, asttypes.FuncDecl)
+                for child in statement)):
+        return [statement]
+    return [
+        result for child in statement.children() for result in splice(child)]
+
+
+def at(new, node):
+    """
+    Return the new node, at the position of the node it replaces.
+    """
+
+    new.lexpos, new.lineno, new.colno = node.lexpos, node.lineno, node.colno
+    if isinstance(getattr(new, 'value', None), (str, text_type)):
+        # the positions of the tokens of literals are looked up by their
+        # text, for the source map.
+        new._token_map = {new.value: [(
+            node.lexpos, node.lineno, node.colno)]}
+    return new
+
+
+def declarations(node):
+    """
+    Return a 2-tuple of the list of the identifiers of the variables
+    declared by the statement (excluding those within functions), and
+    whether it also contains any function declarations.
+    """
+
+    identifiers = []
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, asttypes.FuncDecl):
+            return identifiers, True
+        if isinstance(node, FUNCTIONS):
+            continue
+        if isinstance(node, asttypes.VarDecl):
+            identifiers.append(node.identifier)
+        nodes.extend(reversed(list(node)))
+    return identifiers, False
+
+
+def hoisted(statements, node):
+    """
+    Return the list of statements that preserves the variable and the
+    function declarations within the statements that will be dropped,
+    as those are hoisted to the top of their scope; or None if these
+    cannot be preserved without the statements.
+    """
+
+    results = []
+    identifiers = {}
+    for statement in statements:
+        if isinstance(statement, asttypes.FuncDecl):
+            results.append(statement)
+            continue
+        names, functions = declarations(statement)
+        if functions:
+            return None
+        for identifier in names:
+            identifiers.setdefault(identifier.value, identifier)
+    if identifiers:
+        # the identifiers are reused, as they are no longer in the tree.
+        results.insert(0, at(asttypes.VarStatement([
+            asttypes.VarDecl(identifier)
+            for identifier in sorted(
+                identifiers.values(), key=lambda i: (i.lexpos or 0))
+        ]), node))
+    return results
+
+
+def drop_unreachable(statements):
+    """
+    Return the list of statements without those that follow a return,
+    throw, break or continue statement.
+    """
+
+    for idx, statement in enumerate(statements):
+        if isinstance(statement, JUMPS):
+            break
+    else:
+        return statements
+    tail = statements[idx + 1:]
+    if not tail:
+        return statements
+    results = hoisted(tail, statements[idx])
+    if results is None:
+        return statements
+    return statements[:idx + 1] + results
+
+
+def replace(statements, node):
+    """
+    Return the statement to replace the node with, for the list of
+    statements that are to be retained.
+    """
+
+    if len(statements) == 1:
+        return statements[0]
+    return at(asttypes.Block(statements), node)
+
+
+def simplify(node):
+    """
+    Return the simplified version of the node, whose children have been
+    optimized already.
+    """
+
+    if isinstance(node, asttypes.BinOp):
+        return fold_binop(node)
+    if isinstance(node, asttypes.UnaryExpr) and not isinstance(
+            node, asttypes.PostfixExpr):
+        return fold_unary(node)
+    if isinstance(node, asttypes.GroupingOp):
+        if isinstance(node.expr, (
+                asttypes.Boolean, asttypes.Null, asttypes.Number,
+                asttypes.String)):
+            return node.expr
+        return node
+    if isinstance(node, asttypes.DotAccessor):
+        if isinstance(node.node, asttypes.Number) and (
+                node.node.value.isdigit()):
+            # a period following an integer (such as one produced by
+            # folding) would be taken as its decimal point, unlike one
+            # that has a decimal point, an exponent or is hexadecimal.
+            node = copy(node)
+            node.node = at(asttypes.GroupingOp(node.node), node.node)
+        return node
+    if isinstance(node, asttypes.Conditional):
+        return fold_branch(
+            node, node.predicate, node.consequent, node.alternative)
+    if isinstance(node, asttypes.If):
+        value = literal_value(node.predicate)
+        if value is UNKNOWN:
+            return node
+        taken, dropped = (
+            (node.consequent, node.alternative) if value else
+            (node.alternative, node.consequent)
+        )
+        results = hoisted([dropped] if dropped else [], node)
+        if results is None:
+            return node
+        if taken is not None:
+            results.insert(0, taken)
+        return replace(results, node)
+    if isinstance(node, asttypes.While):
+        value = literal_value(node.predicate)
+        if value is UNKNOWN or value:
+            return node
+        results = hoisted([node.statement], node)
+        if results is None:
+            return node
+        return replace(results, node)
+    if isinstance(node, FUNCTIONS):
+        return drop_unused_functions(node)
+    return node
+
+
+def literal_value(node):
+    """
+    Return the value of the node as a Python value if it is a literal
+    that can be evaluated, otherwise UNKNOWN.
+    """
+
+    while isinstance(node, asttypes.GroupingOp):
+        node = node.expr
+    if isinstance(node, asttypes.Boolean):
+        return node.value == 'true'
+    if isinstance(node, asttypes.Null):
+        return None
+    if isinstance(node, asttypes.Number):
+        if INTEGER.match(node.value):
+            value = int(node.value)
+            if value <= MAX_SAFE_INTEGER:
+                return value
+        return UNKNOWN
+    if isinstance(node, asttypes.String):
+        # only the strings without escape sequences are evaluated.
+        if '\\' not in node.value:
+            return node.value[1:-1]
+        return UNKNOWN
+    if (isinstance(node, asttypes.UnaryExpr) and node.op == '-' and
+            not isinstance(node, asttypes.PostfixExpr)):
+        value = literal_value(node.value)
+        if is_integer(value) and value:
+            return -value
+    return UNKNOWN
+
+
+def is_integer(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def js_type(value):
+    """
+    Return the name of the type of the value in JavaScript.
+    """
+
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'boolean'
+    if is_integer(value):
+        return 'number'
+    return 'string'
+
+
+def js_string(value):
+    """
+    Return the value converted to a string in the manner of JavaScript.
+    """
+
+    if value is None:
+        return 'null'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return text_type(value)
+
+
+def literal(value, node):
+    """
+    Return the literal node for the value in place of the node, or None
+    if it cannot be represented as a literal without escape sequences.
+    """
+
+    if value is None:
+        return at(asttypes.Null('null'), node)
+    if isinstance(value, bool):
+        return at(asttypes.Boolean('true' if value else 'false'), node)
+    if is_integer(value):
+        if 0 <= value <= MAX_SAFE_INTEGER:
+            return at(asttypes.Number(text_type(value)), node)
+        return None
+    for quote in ("'", '"'):
+        if quote not in value:
+            return at(asttypes.String(quote + value + quote), node)
+    return None
+
+
+def leftmost(node):
+    """
+    Return the leftmost node of the expression, i.e. the one that will
+    be unparsed first.
+    """
+
+    while True:
+        if isinstance(node, (
+                asttypes.BinOp, asttypes.Assign, asttypes.Comma)):
+            node = node.left
+        elif isinstance(node, (
+                asttypes.DotAccessor, asttypes.BracketAccessor)):
+            node = node.node
+        elif isinstance(node, asttypes.FunctionCall):
+            node = node.identifier
+        elif isinstance(node, asttypes.Conditional):
+            node = node.predicate
+        elif isinstance(node, asttypes.PostfixExpr):
+            node = node.value
+        else:
+            return node
+
+
+def fold_branch(node, predicate, consequent, alternative):
+    """
+    Return the consequent or the alternative depending on the predicate,
+    or the node itself if the predicate is not a literal.
+    """
+
+    value = literal_value(predicate)
+    if value is UNKNOWN:
+        return node
+    result = consequent if value else alternative
+    if isinstance(leftmost(result), (asttypes.FuncExpr, asttypes.Object)):
+        # which may be taken as a statement in place of the expression.
+        return node
+    return result
+
+
+def compare(op, left, right):
+    """
+    Return the result of the comparison of the values, or UNKNOWN.
+    """
+
+    same = js_type(left) == js_type(right)
+    if op in ('===', '!=='):
+        return (same and left == right) == (op == '===')
+    if op in ('==', '!='):
+        if not same:
+            return UNKNOWN
+        return (left == right) == (op == '==')
+    if not same or js_type(left) not in ('number', 'string'):
+        return UNKNOWN
+    if js_type(left) == 'string' and any(
+            ord(c) > 0xffff for c in left + right):
+        # JavaScript compares strings by their UTF-16 code units.
+        return UNKNOWN
+    return {
+        '<': left < right,
+        '>': left > right,
+        '<=': left <= right,
+        '>=': left >= right,
+    }[op]
+
+
+def fold_binop(node):
+    left = literal_value(node.left)
+    if node.op == '&&':
+        if left is UNKNOWN:
+            return node
+        return fold_branch(node, node.left, node.right, node.left)
+    if node.op == '||':
+        if left is UNKNOWN:
+            return node
+        return fold_branch(node, node.left, node.left, node.right)
+    right = literal_value(node.right)
+    if left is UNKNOWN or right is UNKNOWN:
+        return node
+
+    value = UNKNOWN
+    if node.op == '+':
+        if js_type(left) == 'string' or js_type(right) == 'string':
+            value = js_string(left) + js_string(right)
+        elif is_integer(left) and is_integer(right):
+            value = left + right
+    elif node.op in ('-', '*', '%'):
+        if is_integer(left) and is_integer(right):
+            if node.op == '-':
+                value = left - right
+            elif node.op == '*':
+                # the product of zero with a negative number is -0.
+                if left * right or (left >= 0 and right >= 0):
+                    value = left * right
+            elif left >= 0 and right > 0:
+                # the sign of the result differs for negative operands.
+                value = left % right
+    elif node.op in ('==', '!=', '===', '!==', '<', '>', '<=', '>='):
+        value = compare(node.op, left, right)
+
+    if value is UNKNOWN:
+        return node
+    return literal(value, node) or node
+
+
+def fold_unary(node):
+    value = literal_value(node.value)
+    if value is UNKNOWN:
+        return node
+    if node.op == '!':
+        return literal(not value, node)
+    if node.op == 'typeof':
+        return literal(
+            'object' if value is None else js_type(value), node)
+    return node
+
+
+def references(nodes):
+    """
+    Return the Counter of the names of the identifiers within the nodes.
+    """
+
+    results = Counter()
+    nodes = list(nodes)
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, asttypes.Identifier):
+            results[node.value] += 1
+        nodes.extend(node)
+    return results
+
+
+def is_dynamic(node):
+    """
+    Return whether the names within the node may be looked up in a
+    manner that cannot be determined statically, i.e. through eval or
+    the with statement.
+    """
+
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, asttypes.With) or (
+                isinstance(node, asttypes.Identifier) and
+                node.value == 'eval'):
+            return True
+        nodes.extend(node)
+    return False
+
+
+def drop_unused_functions(node):
+    """
+    Return the function without the function declarations within its
+    body that are not referenced anywhere else in the function.
+    """
+
+    if not any(isinstance(e, asttypes.FuncDecl) for e in node.elements):
+        return node
+    if is_dynamic(node):
+        return node
+    parameters = getattr(node, 'parameters', None) or []
+    if not isinstance(parameters, list):
+        parameters = [parameters]
+    elements = node.elements
+    while True:
+        names = references(parameters + elements)
+        unused = [
+            element for element in elements
+            if isinstance(element, asttypes.FuncDecl) and not (
+                names[element.identifier.value] -
+                references([element])[element.identifier.value])
+        ]
+        if not unused:
+            break
+        elements = [
+            element for element in elements
+            if not any(element is function for function in unused)
+        ]
+    if elements is node.elements:
+        return node
+    node = copy(node)
+    node.elements = elements
+    return node
@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Output streams that replace their destination atomically.
+
+Compressed copies of the output (e.g. for web servers that serve them
+in place of the original) may be written alongside as sidecar files,
+with the content compressed as it is written rather than read back from
+the output file afterwards; brotli is supported if the optional brotli
+package is available.
+"""
+
+import codecs
+import filecmp
+import os
+import stat
+import threading
+import zlib
+
+from os.path import basename
+from os.path import dirname
+from os.path import exists
+from tempfile import mkstemp
+
+try:
+    from queue import Queue
+except ImportError:  # pragma: no cover
+    # Python 2
+    from Queue import Queue
+
+from crimp.cache import replace_file
+
+# the size of the buffer for the underlying file, in bytes.
+DEFAULT_BUFFER_SIZE = 1024 * 1024
+# the size of the chunks passed to the compressors, in bytes.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# the extensions of the sidecar files for the supported compressions,
+# of which br requires the optional brotli package.
+COMPRESSIONS = ('gz', 'br')
+
+
+def load_brotli():
+    """
+    Return the brotli module, or None if it is unavailable; only
+    imported once needed, as it is costly to import.
+    """
+
+    try:
+        import brotli
+    except ImportError:  # pragma: no cover
+        return None
+    return brotli
+
+
+def available_compressions():
+    """
+    Return the extensions of the compressions that are available.
+    """
+
+    return tuple(
+        ext for ext in COMPRESSIONS if ext != 'br' or load_brotli())
+
+
+def create_compressor(ext):
+    """
+    Return a 2-tuple of the compress and finish functions of a new
+    compressor for the sidecar file extension.  The output is
+    deterministic, such that unchanged content will be compressed to
+    identical files.
+    """
+
+    if ext == 'gz':
+        # the gzip container, without a timestamp or filename.
+        compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+    brotli = load_brotli() if ext == 'br' else None
+    if brotli is not None:
+        compressor = brotli.Compressor(quality=11)
+        return compressor.process, compressor.finish
+    raise ValueError('unsupported compression: %r' % ext)
+
+
+class Sink(object):
+    """
+    The binary stream for the underlying file of an AtomicWriter, which
+    also passes the data through to the compressed sidecars in chunks,
+    optionally through a background thread such that the compression
+    will not hold up the writing of the output.
+    """
+
+    def __init__(
+            self, fileobj, sidecars=(), threaded=False,
+            chunk_size=DEFAULT_CHUNK_SIZE):
+        self.fileobj = fileobj
+        self.sidecars = sidecars
+        self.chunk_size = chunk_size
+        # the number of bytes written.
+        self.size = 0
+        self.pending = []
+        self.pending_size = 0
+        self.error = None
+        self.queue = self.thread = None
+        if sidecars and threaded:
+            # bounded, such that memory use remains bounded if the
+            # compression falls behind.
+            self.queue = Queue(maxsize=16)
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def write(self, data):
+        self.fileobj.write(data)
+        self.size += len(data)
+        if self.sidecars:
+            self.pending.append(data)
+            self.pending_size += len(data)
+            if self.pending_size >= self.chunk_size:
+                self.dispatch()
+
+    def dispatch(self):
+        chunk = b''.join(self.pending)
+        self.pending = []
+        self.pending_size = 0
+        if self.queue is not None:
+            self.queue.put(chunk)
+        else:
+            self.compress(chunk)
+
+    def compress(self, chunk):
+        for sidecar in self.sidecars:
+            sidecar.write(chunk)
+
+    def run(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is None:
+                return
+            if self.error is None:
+                try:
+                    self.compress(chunk)
+                except Exception as e:
+                    # raised by close; keep consuming the queue such
+                    # that the writer will not be blocked.
+                    self.error = e
+
+    def flush(self):
+        self.fileobj.flush()
+
+    def close(self):
+        """
+        Close the file, once the pending data has been passed to the
+        sidecars (which remain open).
+        """
+
+        try:
+            if self.pending:
+                self.dispatch()
+            if self.thread is not None:
+                self.queue.put(None)
+                self.thread.join()
+                self.thread = None
+        finally:
+            self.fileobj.close()
+        if self.error is not None:
+            raise self.error
+
+
+class Sidecar(object):
+    """
+    A compressed copy of the output, written through an AtomicWriter to
+    the path of the output with the extension of the compression
+    appended.
+    """
+
+    def __init__(self, path, ext, skip_unchanged=False):
+        self.ext = ext
+        self.compress, self.finish = create_compressor(ext)
+        self.writer = AtomicWriter(
+            path + '.' + ext, encoding=None, skip_unchanged=skip_unchanged)
+
+    @property
+    def size(self):
+        return self.writer.size
+
+    def write(self, data):
+        self.writer.write(self.compress(data))
+
+    def discard(self):
+        self.writer.discard()
+
+    def close(self):
+        try:
+            self.writer.write(self.finish())
+        except Exception:
+            self.writer.discard()
+            raise
+        self.writer.close()
+
+
+class AtomicWriter(object):
+    """
+    A text stream that is written to a temporary file in the same
+    directory as the destination, which will only replace the
+    destination once closed such that readers will never see a partial
+    file.  Destinations that exist but are not regular files (e.g.
+    /dev/null or a named pipe) are written to directly.
+    """
+
+    def __init__(
+            self, path, encoding='utf8', skip_unchanged=False,
+            buffer_size=DEFAULT_BUFFER_SIZE, compress=(),
+            compress_thread=False):
+        """
+        Arguments
+
+        path
+            The path to the destination file.
+        encoding
+            The encoding to write the text with; if None, bytes are to
+            be written instead.
+        skip_unchanged
+            If the content written is identical to the existing
+            destination, leave it (and its modification time) untouched.
+            This also applies to the sidecars.
+        buffer_size
+            The size of the buffer for the underlying file.
+        compress
+            The extensions of the compressed sidecars to be written
+            alongside the destination (see available_compressions);
+            ignored if the destination is not a regular file.
+        compress_thread
+            Compress the sidecars in a background thread.
+        """
+
+        self.path = self.name = path
+        self.encoding = encoding
+        self.skip_unchanged = skip_unchanged
+        # set to the outcome once closed: True if the destination was
+        # written, False if it was left untouched or discarded.
+        self.changed = None
+
+        try:
+            self.mode = os.stat(path).st_mode
+        except (IOError, OSError):
+            self.mode = None
+
+        for ext in compress:
+            if ext not in available_compressions():
+                raise ValueError('unsupported compression: %r' % ext)
+
+        self.sidecars = []
+        if self.mode is not None and not stat.S_ISREG(self.mode):
+            self.tmp = None
+            fd = os.open(path, os.O_WRONLY)
+        else:
+            self.sidecars = [
+                Sidecar(path, ext, skip_unchanged) for ext in compress]
+            fd, self.tmp = mkstemp(
+                dir=dirname(path), prefix='.' + basename(path) + '.',
+                suffix='.tmp')
+        self.sink = Sink(
+            os.fdopen(fd, 'wb', buffer_size), self.sidecars,
+            threaded=compress_thread)
+        self.stream = (
+            self.sink if encoding is None else
+            codecs.getwriter(encoding)(self.sink)
+        )
+
+    @property
+    def size(self):
+        """
+        The number of bytes written.
+        """
+
+        return self.sink.size
+
+    def write(self, text):
+        self.stream.write(text)
+
+    def writelines(self, lines):
+        self.stream.writelines(lines)
+
+    def flush(self):
+        self.stream.flush()
+
+    def discard(self):
+        """
+        Remove the temporary file, leaving the destination untouched.
+        """
+
+        if self.changed is None:
+            self.changed = False
+            try:
+                self.stream.close()
+            finally:
+                for sidecar in self.sidecars:
+                    sidecar.discard()
+                if self.tmp is not None:
+                    os.unlink(self.tmp)
+
+    def close(self):
+        if self.changed is not None:
+            return
+        if self.tmp is None:
+            self.changed = True
+            self.stream.close()
+            return
+        try:
+            self.stream.close()
+            for sidecar in self.sidecars:
+                sidecar.close()
+            if self.skip_unchanged and self.mode is not None and (
+                    filecmp.cmp(self.tmp, self.path, shallow=False)):
+                self.changed = False
+                os.unlink(self.tmp)
+                return
+            if self.mode is None:
+                # mkstemp creates the file with a restrictive mode.
+                umask = os.umask(0)
+                os.umask(umask)
+                os.chmod(self.tmp, 0o666 & ~umask)
+            else:
+                os.chmod(self.tmp, stat.S_IMODE(self.mode))
+            replace_file(self.tmp, self.path)
+        except Exception:
+            self.changed = False
+            # sidecars that were closed are unaffected.
+            for sidecar in self.sidecars:
+                sidecar.discard()
+            if exists(self.tmp):
+                os.unlink(self.tmp)
+            raise
+        self.changed = True
+
+
+def size_report(writer):
+    """
+    Return a line reporting the number of bytes written through the
+    AtomicWriter along with the sizes of its compressed sidecars.
+    """
+
+    return '%s: %d bytes%s\n' % (writer.path, writer.size, ''.join(
+        ', %s: %d bytes (%.1f%%)' % (
+            sidecar.ext, sidecar.size,
+            100.0 * sidecar.size / writer.size if writer.size else 0,
+        ) for sidecar in writer.sidecars
+    ))
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+Management of the ES5 parser and its tables.
+
+The parse function provided by calmjs.parse constructs a new Parser for
+every invocation, which builds the lexer twice (once without the lexer
+table, validating all the rules) and reads the parser tables again; for
+small inputs, this takes up more time than the actual parsing.  Here,
+the lexer is built once as a template that is cloned for every parse,
+and the parser is constructed once for every thread.
+
+The tables are normally shipped by calmjs.parse for the known versions
+of ply; if those for the installed version are unavailable, they would
+be generated on every run (failing to be written into the package
+directory if it is read-only), so instead they will be generated once
+into a cache directory, keyed by the versions of calmjs.parse, ply and
+Python, and loaded from there on subsequent runs.
+"""
+
+import logging
+import os
+import sys
+import threading
+
+from importlib import import_module
+from os.path import exists
+from os.path import expanduser
+from os.path import join
+
+import ply.lex
+import ply.yacc
+
+from calmjs.parse.lexers.es5 import Lexer as BaseLexer
+from calmjs.parse.parsers import es5
+from calmjs.parse.parsers.es5 import Parser as BaseParser
+
+from crimp.api import pkg_version
+from crimp.cache import digest
+
+logger = logging.getLogger(__name__)
+
+# the names of the table modules generated into the cache directory.
+LEXTAB = 'crimp_lextab_es5'
+YACCTAB = 'crimp_yacctab_es5'
+
+_local = threading.local()
+_lock = threading.Lock()
+# the resolved tables and the lexer template.
+_state = {}
+# where the tables came from ('shipped', 'cached' or 'generated'), and
+# the number of parses that created or reused a parser.
+stats = {'tables': None, 'created': 0, 'reused': 0}
+
+
+def default_tables_dir():
+    """
+    The directory for the generated tables, which may be specified by
+    the CRIMP_TABLES_DIR environment variable, otherwise it will be
+    within the user cache directory.
+    """
+
+    return os.environ.get('CRIMP_TABLES_DIR') or join(
+        os.environ.get('XDG_CACHE_HOME') or join(expanduser('~'), '.cache'),
+        'crimp', 'tables',
+    )
+
+
+def load_module(name, path):
+    """
+    Load the module at path without it being importable by name; the
+    compiled bytecode is cached as with any other import.
+    """
+
+    try:
+        from importlib.util import module_from_spec
+        from importlib.util import spec_from_file_location
+    except ImportError:  # pragma: no cover
+        import imp
+        return imp.load_source(name, path)
+    spec = spec_from_file_location(name, path)
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def resolve_table(name, directory):
+    """
+    Return the table module at the directory, or the name to generate
+    it under if it is unavailable.
+    """
+
+    path = join(directory, name + '.py')
+    if exists(path):
+        try:
+            return load_module(name, path)
+        except Exception as e:
+            # e.g. partially written by a concurrent process.
+            logger.warning('regenerating invalid table %r: %s', path, e)
+    return name
+
+
+def resolve_tables(tables_dir=None):
+    """
+    Return a 4-tuple of the lexer table, the parser table, the output
+    directory for the tables that require generation and where they
+    came from.  Tables are either names of modules (to be imported or
+    generated) or modules.
+    """
+
+    try:
+        import_module(es5.lextab)
+        import_module(es5.yacctab)
+    except ImportError:
+        pass
+    else:
+        return es5.lextab, es5.yacctab, None, 'shipped'
+
+    directory = join(tables_dir or default_tables_dir(), digest(
+        '%s %s' % pkg_version('calmjs.parse')[:2],
+        '%s %s' % pkg_version('ply')[:2],
+        str(sys.version_info[0]),
+    )[:16])
+    lextab = resolve_table(LEXTAB, directory)
+    yacctab = resolve_table(YACCTAB, directory)
+    if isinstance(lextab, str) or isinstance(yacctab, str):
+        if not exists(directory):
+            os.makedirs(directory)
+        return lextab, yacctab, directory, 'generated'
+    return lextab, yacctab, directory, 'cached'
+
+
+class Lexer(BaseLexer):
+    """
+    The lexer, with the ply lexer cloned from the template.
+    """
+
+    def build(self, **kwargs):
+        template = _state.get('template')
+        if template is not None:
+            self.lexer = template.clone(self)
+            # the clone only rebinds the rules of the states to this
+            # lexer; those of the current state (most notably the error
+            # handler) remain bound to the template unless reselected.
+            self.lexer.begin(self.lexer.lexstate)
+        elif kwargs:
+            # only build the template with the tables.
+            super(Lexer, self).build(**kwargs)
+
+
+class Parser(BaseParser):
+    """
+    The parser, with a new lexer for every parse such that it may be
+    reused.
+    """
+
+    def __init__(self, lextab, yacctab, outputdir=None):
+        # identical to the parent, except for the lexer and that the
+        # output directory may be specified for the generated tables.
+        self.lex_optimize = True
+        self.lextab = lextab
+        self.yacc_optimize = True
+        self.yacctab = yacctab
+        self.yacc_debug = False
+        self.yacc_tracking = True
+
+        self.lexer = Lexer()
+        self.tokens = self.lexer.tokens
+        self.parser = ply.yacc.yacc(
+            module=self, optimize=True, debug=False, tabmodule=yacctab,
+            outputdir=outputdir, start='program',
+            # silence the warnings about the conflicts in the grammar
+            # that are otherwise emitted while generating the tables.
+            errorlog=ply.yacc.NullLogger() if outputdir else None)
+
+        self.asttypes = es5.asttypes
+
+    def parse(self, text, debug=False):
+        self.lexer = Lexer()
+        return super(Parser, self).parse(text, debug=debug)
+
+
+def setup(tables_dir=None):
+    """
+    Resolve the tables and build the lexer template, if not done.
+    """
+
+    with _lock:
+        if _state:
+            return
+        lextab, yacctab, outputdir, source = resolve_tables(tables_dir)
+        lexer = Lexer()
+        lexer.build(optimize=True, lextab=lextab, outputdir=outputdir)
+        _state.update(template=lexer.lexer)
+        if outputdir and isinstance(yacctab, str):
+            # generate the table once, so that parsers created for other
+            # threads will load it.
+            Parser(None, yacctab, outputdir)
+            yacctab = resolve_table(yacctab, outputdir)
+        _state.update(yacctab=yacctab, outputdir=outputdir)
+        stats['tables'] = source
+        logger.debug('parser tables: %s', source)
+
+
+def get_parser():
+    """
+    Return the parser for the current thread.
+    """
+
+    parser = getattr(_local, 'parser', None)
+    if parser is None:
+        setup()
+        parser = _local.parser = Parser(
+            None, _state['yacctab'], _state['outputdir'])
+        stats['created'] += 1
+    else:
+        stats['reused'] += 1
+    return parser
+
+
+def parse(text):
+    """
+    Parse the text into an AST.
+    """
+
+    return get_parser().parse(text)
+
+
+def report():
+    """
+    Return the summary of the stats.
+    """
+
+    return 'parser tables: %s; parsers created: %d, reused: %d\n' % (
+        stats['tables'] or 'not loaded', stats['created'], stats['reused'])
@@ -8,6 +8,9 @@ import sys
 import logging
 import locale
 import codecs
+import json
+import re
+import socket
 
 from argparse import Action
 from argparse import ArgumentParser
@@ -17,21 +20,50 @@ from io import TextIOWrapper
 from io import StringIO
 from os.path import abspath
 from os.path import basename
+from os.path import commonprefix
 from os.path import dirname
+from os.path import exists
+from os.path import join
+from os.path import pardir
 from os.path import pathsep
-
-from pkg_resources import Requirement
-from pkg_resources import working_set
-
-from calmjs.parse import io
-from calmjs.parse import rules
-from calmjs.parse.exceptions import ECMASyntaxError
-from calmjs.parse.lexers.es5 import Lexer
-from calmjs.parse.parsers.es5 import parse
-from calmjs.parse.unparsers.es5 import Unparser
+from os.path import relpath
+from os.path import sep
+from os.path import splitext
+
+from crimp.api import InputFile
+from crimp.api import minify_targets
+from crimp.api import pkg_version
+from crimp.api import printer_options
+from crimp.api import options_key
+from crimp.api import passthrough_matcher
+from crimp.api import passthrough_patterns
+from crimp.cache import Cache
+from crimp.cache import TreeCache
+from crimp.limits import LimitExceeded
+from crimp.limits import Limits
+from crimp.manifest import Manifest
+from crimp.output import AtomicWriter
+from crimp.output import available_compressions
+from crimp.output import size_report
+from crimp.timing import Stats
+from crimp.timing import Timings
+from crimp.timing import null_timings
 
 logger = logging.getLogger(__name__)
 
+# default size for the cache, in MiB.
+DEFAULT_CACHE_SIZE = 64
+# the manifest for incremental mode is stored at the output path with
+# this extension appended, or with this name in the output directory.
+MANIFEST_EXT = '.manifest'
+MANIFEST_NAME = '.crimp.manifest'
+# the name of the manifest for the pretty printed outputs in batch mode.
+PRETTY_MANIFEST_NAME = '.crimp.pretty.manifest'
+# the names that may be defined through --define.
+DEFINE_NAME = re.compile(r'^[A-Za-z_$][A-Za-z0-9_$]*$')
+# the exit code for inputs that exceed the resource limits.
+LIMIT_EXIT_CODE = 3
+
 
 class _HelpFormatter(HelpFormatter):
     """
@@ -64,11 +96,7 @@ class Version(Action):
         super(Version, self).__init__(*a, **kw)
 
     def pkg_version(self, name, default_name='?'):
-        dist = working_set.find(Requirement.parse(name))
-        name = getattr(dist, 'project_name', name)
-        version = getattr(dist, 'version', '?')
-        location = getattr(dist, 'location', '?')
-        return name, version, location
+        return pkg_version(name)
 
     def __call__(self, parser, namespace, values, option_string=None):
         sys.stdout.write('%s %s from %s\n' % self.pkg_version('crimp'))
@@ -123,6 +151,16 @@ def create_argparser(program):
         help='enable source map; filename defaults to <output_path>.map, '
              'if identical to <output_path> it will be written inline as '
              'a data url')
+    argparser.add_argument(
+        '--input-source-maps', dest='input_source_maps',
+        action='store_true', default=False,
+        help='compose the source map with the source maps referenced by '
+             'the input files through their sourceMappingURL comments')
+    argparser.add_argument(
+        '--index-map', dest='index_map', action='store_true',
+        default=False,
+        help='write the source map as an index map with a section for '
+             'every input file; sections are cached with --cache-dir')
     argparser.add_argument(
         '--version', action=Version,
         help='show version information')
@@ -132,20 +170,212 @@ def create_argparser(program):
         '-o', '--obfuscate', dest='obfuscate', action='store_true',
         default=False,
         help='obfuscate (mangle) names')
+    mangle_group.add_argument(
+        '--shared-scope', dest='shared_scope', action='store_true',
+        default=False,
+        help='obfuscate the names of all input files combined into an '
+             'output with a single shared scope, with the replacement '
+             'names favouring the characters most frequent across them; '
+             '-j and --stream are ignored')
     mangle_group.add_argument(
         '--drop-semi', dest='drop_semi', action='store_true',
         default=False,
         help='drop unneeded semicolons (minify printer only)')
+    mangle_group.add_argument(
+        '--optimize', dest='optimize', action='store_true',
+        default=False,
+        help='fold constant expressions, drop unreachable code and '
+             'branches, and remove unused local function declarations')
+    mangle_group.add_argument(
+        '--define', dest='define', action='append', default=[],
+        metavar='<name>=<value>',
+        help='replace the references to the global variable <name> with '
+             'the literal <value> (a string, number, boolean or null), '
+             'and drop the branches that become unreachable; implies '
+             '--optimize; may be specified multiple times')
 
     argparser.add_argument(
         '--indent-width', dest='indent_width', action='store', type=int,
         default=4, metavar='n',
         help='indentation width for pretty printer')
+    argparser.add_argument(
+        '--pretty-output', dest='pretty_output', action='store',
+        default=None, metavar='<pretty_path>',
+        help='also write the pretty printed output (without name '
+             'obfuscation) to <pretty_path>, from the same parse of the '
+             'input files as the output; the input files processed by '
+             'other processes (-j, --max-rss or --connect) are parsed '
+             'again, unless --bundle is also specified')
+    argparser.add_argument(
+        '-j', '--jobs', dest='jobs', action='store', type=int,
+        default=1, metavar='n',
+        help='number of processes for processing multiple input files; '
+             '0 to use one for every available CPU (default: 1)')
+    argparser.add_argument(
+        '--stream', dest='stream', action='store_true', default=False,
+        help='process and write out the input files one at a time, such '
+             'that the memory required is bounded by the largest input '
+             'file rather than the total of all of them; -j is ignored')
+    argparser.add_argument(
+        '--passthrough', dest='passthrough', action='append', default=[],
+        metavar='<pattern>',
+        help='copy the input files matching the glob pattern into the '
+             'output verbatim without parsing them, with a source map '
+             'segment for every line; patterns without a path separator '
+             'match the filename only; may be repeated')
+    argparser.add_argument(
+        '--passthrough-minified', dest='passthrough_minified',
+        action='store_true', default=False,
+        help='copy the input files that appear to be minified already '
+             '(named *.min.js, or with long lines and little whitespace) '
+             'into the output verbatim as per --passthrough')
+    argparser.add_argument(
+        '--skip-unchanged', dest='skip_unchanged', action='store_true',
+        default=False,
+        help='leave output files (and their modification times) '
+             'untouched if their content would be unchanged')
+    argparser.add_argument(
+        '--compress', dest='compress', action='append', default=[],
+        choices=('gz', 'br'),
+        help='also write a compressed copy of every output file with '
+             'the extension appended, and report the sizes to stderr; '
+             'br requires the brotli package; may be repeated')
+    argparser.add_argument(
+        '--compress-thread', dest='compress_thread', action='store_true',
+        default=False,
+        help='compress in a background thread while the output is '
+             'being written')
+    argparser.add_argument(
+        '--profile', dest='profile', nargs='?', default=None, const='',
+        metavar='<profile_path>',
+        help='report the time spent in every phase to stderr, and if '
+             '<profile_path> is provided, write the cProfile statistics '
+             'to it; all inputs will be processed in this process')
+    argparser.add_argument(
+        '--stats-json', dest='stats_json', action='store', default=None,
+        metavar='<stats_path>',
+        help='write the time spent in every phase and the sizes for every '
+             'input, along with the sizes of the outputs and their '
+             'compressed copies, as JSON to <stats_path>; all inputs will '
+             'be processed in this process')
     argparser.add_argument(
         '--encoding', dest='encoding', action='store',
         default=locale.getpreferredencoding(), metavar='<codec>',
         help='the encoding for file-based I/O; stdio relies on system locale')
 
+    batch_group = argparser.add_argument_group(
+        'batch options',
+        'write every input file to its own output file in <output_dir>, '
+        'rather than combining them into a single output; if -s is '
+        'specified, a source map for every output will be written to '
+        '<output>.map')
+    batch_group.add_argument(
+        '-D', '--output-dir', dest='output_dir', action='store',
+        default=None, metavar='<output_dir>',
+        help='output directory for batch mode')
+    batch_group.add_argument(
+        '--base-dir', dest='base_dir', action='store',
+        default=None, metavar='<base_dir>',
+        help='the directory that the paths of the input files are made '
+             'relative to before joining with <output_dir>; defaults to '
+             'the common directory of all input files')
+    batch_group.add_argument(
+        '--output-ext', dest='output_ext', action='store',
+        default=None, metavar='<ext>',
+        help="replace the extension of the input files with this for "
+             "the output files (e.g. '.min.js')")
+    batch_group.add_argument(
+        '--pretty-ext', dest='pretty_ext', action='store',
+        default=None, metavar='<ext>',
+        help="also write the pretty printed output for every input file "
+             "to <output_dir>, with the extension of the input file "
+             "replaced with this (e.g. '.js'); as with --pretty-output, "
+             "the input files processed by other processes are parsed "
+             "again")
+
+    bundle_group = argparser.add_argument_group(
+        'bundle options',
+        'treat the input files as entry points, with the modules that '
+        'they depend on through the string literals passed to define or '
+        'require included before them, every module included once')
+    bundle_group.add_argument(
+        '--bundle', dest='bundle', action='store_true', default=False,
+        help='include the modules that the input files depend on')
+    bundle_group.add_argument(
+        '--bundle-root', dest='bundle_root', action='store',
+        default=None, metavar='<root_dir>',
+        help='the directory that module ids which are not relative are '
+             'resolved against; defaults to the directory of the first '
+             'input file')
+
+    server_group = argparser.add_argument_group(
+        'server options',
+        'a server keeps the parser and printers loaded between requests '
+        'from clients, which avoids the startup cost for every invocation')
+    server_group.add_argument(
+        '--serve', dest='serve', action='store', default=None,
+        metavar='<socket_path>',
+        help='run as a server listening on the unix domain socket at '
+             '<socket_path>, processing the requests with -j worker '
+             'processes within the resource limits; all other options '
+             'are ignored')
+    server_group.add_argument(
+        '--connect', dest='connect', action='store',
+        default=os.environ.get('CRIMP_SERVER'), metavar='<socket_path>',
+        help='have the server listening on <socket_path> process the '
+             'inputs, falling back to processing them in this process if '
+             'no server is available; defaults to the value of the '
+             'CRIMP_SERVER environment variable')
+
+    limits_group = argparser.add_argument_group(
+        'resource limits',
+        'limits for the processing of every input file, for inputs that '
+        'cannot be trusted; exceeding any of them is an error')
+    limits_group.add_argument(
+        '--max-bytes', dest='max_bytes', action='store', type=int,
+        default=None, metavar='n',
+        help='maximum size of an input file in bytes')
+    limits_group.add_argument(
+        '--max-depth', dest='max_depth', action='store', type=int,
+        default=None, metavar='n',
+        help='maximum nesting depth of the syntax tree of an input file')
+    limits_group.add_argument(
+        '--timeout', dest='timeout', action='store', type=float,
+        default=None, metavar='<seconds>',
+        help='maximum time to process an input file')
+    limits_group.add_argument(
+        '--max-rss', dest='max_rss', action='store', type=int,
+        default=None, metavar='<MiB>',
+        help='maximum resident memory of the worker process that '
+             'processes an input file; input files are then always '
+             'processed by worker processes, except with --shared-scope')
+
+    cache_group = argparser.add_argument_group('caching options')
+    cache_group.add_argument(
+        '--cache-dir', dest='cache_dir', action='store', default=None,
+        metavar='<cache_dir>',
+        help='directory for caching the minified output of every input; '
+             'unchanged inputs processed with identical options will not '
+             'be parsed again')
+    cache_group.add_argument(
+        '--cache-size', dest='cache_size', action='store', type=int,
+        default=DEFAULT_CACHE_SIZE, metavar='n',
+        help='maximum size of the cache directory in MiB; least recently '
+             'used entries are evicted beyond this size')
+    cache_group.add_argument(
+        '--incremental', dest='incremental', action='store_true',
+        default=False,
+        help='record the inputs along with their processed results in a '
+             'manifest alongside the output (or in <output_dir>), such '
+             'that inputs unchanged since the previous run will not be '
+             'read nor parsed again')
+
+    argparser.add_argument(
+        '--watch', dest='watch', action='store_true', default=False,
+        help='keep running and process the input files again whenever '
+             'they are modified, until interrupted; outputs are only '
+             'replaced if changed')
+
     return argparser
 
 
@@ -159,12 +389,139 @@ def parse_args(*argv):
     return values
 
 
+def batch_paths(inputs, output_dir, base_dir=None, output_ext=None):
+    """
+    Return the list of output paths for the input paths for batch mode,
+    where every input is mapped from its path relative to base_dir to
+    the same relative path in output_dir, with its extension replaced by
+    output_ext if provided.  A ValueError will be raised for an input
+    that lies outside of base_dir, or if any output path is identical to
+    an input path.
+    """
+
+    abs_inputs = [abspath(p) for p in inputs]
+    base_dir = abspath(base_dir) if base_dir else dirname(
+        commonprefix([dirname(p) + sep for p in abs_inputs]))
+    abs_output_dir = abspath(output_dir)
+
+    results = []
+    for path in abs_inputs:
+        target = relpath(path, base_dir)
+        if target.split(sep)[0] == pardir:
+            raise ValueError(
+                'input file %r is not located within the base directory %r' % (
+                    path, base_dir))
+        if output_ext is not None:
+            target = splitext(target)[0] + output_ext
+        target = join(abs_output_dir, target)
+        if target in abs_inputs:
+            raise ValueError(
+                'output file %r would overwrite an input file' % target)
+        results.append(target)
+    return results
+
+
+def parse_defines(defines):
+    """
+    Return the dict of names to the source text of the literals for the
+    list of NAME=value strings, raising a ValueError for any that is not
+    an identifier assigned to a literal.
+    """
+
+    from crimp.optimize import define_literal
+
+    results = {}
+    for define in defines:
+        name, sep, value = define.partition('=')
+        if not sep or not DEFINE_NAME.match(name):
+            raise ValueError(
+                'define %r must be in the form of NAME=value' % define)
+        try:
+            define_literal(value)
+        except ValueError:
+            raise ValueError(
+                'the value %r for the define %r must be a string, number, '
+                'boolean or null literal' % (value, name))
+        results[name] = value
+    return results
+
+
+def run_server(path, jobs=1, limits=None):
+    """
+    Run the server on the socket path with the pool of jobs worker
+    processes within the limits until interrupted; sys.exit is called.
+    """
+
+    if not hasattr(socket, 'AF_UNIX'):
+        logger.error('unix domain sockets are unsupported on this platform')
+        sys.exit(1)
+    try:
+        from crimp.server import serve
+        serve(path, jobs=jobs, limits=limits or Limits())
+    except (IOError, OSError) as e:
+        logger.error('%s', e)
+        sys.exit(e.args[0] if e.args and isinstance(e.args[0], int) else 5)
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
+
+
+def run_watch(paths, process):
+    """
+    Call process, and call it again whenever any of the paths have been
+    modified until interrupted.  Errors raised by process are logged.
+    """
+
+    from calmjs.parse.exceptions import ECMASyntaxError
+    from crimp.watch import Watcher
+    watcher = Watcher(paths)
+    try:
+        while True:
+            try:
+                process()
+            except (ECMASyntaxError, LimitExceeded) as e:
+                logger.error('%s', e)
+            except (IOError, OSError) as e:
+                logger.error('%s', e)
+            except UnicodeDecodeError as e:
+                logger.error('read error: %s', e)
+            except UnicodeEncodeError as e:
+                logger.error('write error: %s', e)
+            changed = watcher.next()
+            logger.info('modified: %s', ', '.join(sorted(changed)))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+
+
 def run(inputs, output, mangle, obfuscate, pretty, source_map, indent_width,
-        drop_semi, encoding, version):
+        drop_semi, encoding, version, cache_dir=None,
+        cache_size=DEFAULT_CACHE_SIZE, jobs=1, output_dir=None,
+        base_dir=None, output_ext=None, serve=None, connect=None,
+        profile=None, incremental=False, watch=False, stream=False,
+        skip_unchanged=False, shared_scope=False, compress=(),
+        compress_thread=False, input_source_maps=False, index_map=False,
+        stats_json=None, hooks=(), pretty_output=None, pretty_ext=None,
+        passthrough=(), passthrough_minified=False, bundle=False,
+        bundle_root=None, optimize=False, define=(), max_bytes=None,
+        max_depth=None, timeout=None, max_rss=None):
     """
-    Not a general use method, as sys.exit is called.
+    Not a general use method, as sys.exit is called; the functions
+    provided by crimp.api should be used instead.
+
+    The hooks are passed to the Timings (see crimp.timing), to be
+    notified as every phase starts and ends for every input.  Inputs
+    that exceed the resource limits exit with LIMIT_EXIT_CODE.
     """
 
+    limits = Limits(
+        max_bytes=max_bytes, max_depth=max_depth, timeout=timeout,
+        max_rss=max_rss * 1024 * 1024 if max_rss else None,
+    )
+    if serve:
+        run_server(serve, jobs, limits)
+
     def stdin():
         return (
             sys.stdin
@@ -179,16 +536,97 @@ def run(inputs, output, mangle, obfuscate, pretty, source_map, indent_width,
             codecs.getwriter(sys.stdout.encoding or encoding)(sys.stdout)
         )
 
+    if watch and not (inputs and (output or output_dir)):
+        logger.error('watch mode requires input files and an output path')
+        sys.exit(2)
+
+    # the available compressions are only looked up once requested.
+    unsupported = sorted(
+        set(compress) - set(available_compressions())) if compress else []
+    if unsupported:
+        logger.error(
+            'unsupported compression: %s (the brotli package is required '
+            'for br)', ', '.join(unsupported))
+        sys.exit(2)
+
+    if bundle and not inputs:
+        logger.error('bundle mode requires input files')
+        sys.exit(2)
+
+    try:
+        define = parse_defines(define)
+    except ValueError as e:
+        logger.error('%s', e)
+        sys.exit(2)
+
+    cache = (
+        Cache(abspath(cache_dir), max_size=cache_size * 1024 * 1024)
+        if cache_dir else
+        None
+    )
+    # the inputs passed through are recorded as such in the manifests,
+    # as are the fragments decoded from them, which must not be reused
+    # for different passthrough settings or encoding.
+    manifest_options = (
+        ('passthrough', tuple(passthrough_patterns(passthrough))),
+        ('passthrough_minified', passthrough_minified),
+        ('encoding', encoding),
+    )
+    passthrough = passthrough_matcher(passthrough, passthrough_minified)
+    # the trees parsed for the bundle, or for the outputs that the pretty
+    # printed outputs are printed from, are retained until they are
+    # printed.
+    tree_cache = (
+        TreeCache(max_count=sys.maxsize, max_size=sys.maxsize)
+        if bundle or pretty_output or pretty_ext else
+        None
+    )
+
+    if bundle:
+        from calmjs.parse.exceptions import ECMASyntaxError
+        from crimp.bundle import bundle as bundle_inputs
+        try:
+            inputs = bundle_inputs(
+                inputs, root=bundle_root, encoding=encoding, cache=cache,
+                tree_cache=tree_cache, passthrough=passthrough,
+                limits=limits)
+        except ECMASyntaxError as e:
+            logger.error('%s', e)
+            sys.exit(1)
+        except LimitExceeded as e:
+            logger.error('%s', e)
+            sys.exit(LIMIT_EXIT_CODE)
+        except (IOError, OSError, UnicodeDecodeError) as e:
+            logger.error('%s', e)
+            sys.exit(1)
+    if tree_cache is not None:
+        # one for every input, such that those replaced in watch mode
+        # will be evicted.
+        tree_cache.max_count = len(inputs)
+
+    # the writers opened for the current run, for the size report.
+    writers = []
+
+    def open_writer(path):
+        # outputs are only replaced once completely written; in watch
+        # mode they are always left untouched if unchanged.
+        writer = AtomicWriter(
+            path, encoding=encoding, skip_unchanged=skip_unchanged or watch,
+            compress=compress, compress_thread=compress_thread,
+        )
+        writers.append(writer)
+        return writer
+
     abs_output = abspath(output) if output else output
     abs_source_map = abspath(source_map) if source_map else source_map
 
     input_streams = (
-        [partial(codecs.open, abspath(p), encoding=encoding) for p in inputs]
+        [InputFile(abspath(p), encoding) for p in inputs]
         if inputs else
         [stdin]
     )
     output_stream = (
-        partial(codecs.open, abs_output, 'w', encoding=encoding)
+        partial(open_writer, abs_output)
         if abs_output else
         stdout
     )
@@ -211,29 +649,183 @@ def run(inputs, output, mangle, obfuscate, pretty, source_map, indent_width,
         # generate a callable if the source_map_path is not an empty
         # string.
         sourcemap_stream = None if source_map_path is None else (
-            partial(codecs.open, source_map_path, 'w', encoding=encoding)
+            partial(open_writer, source_map_path)
             if source_map_path else
             stdout
         )
 
-    enabled_rules = [rules.minify(drop_semi=drop_semi or mangle)]
-    if obfuscate or mangle:
-        enabled_rules.append(rules.obfuscate(
-            reserved_keywords=Lexer.keywords_dict.keys()
-        ))
-
-    if pretty:
-        enabled_rules.append(rules.indent(indent_str=' ' * indent_width))
-
-    printer = Unparser(rules=enabled_rules)
+    def open_output(path):
+        target = dirname(path)
+        if not exists(target):
+            os.makedirs(target)
+        return open_writer(path)
+
+    # a list of targets, each being a 3-tuple of the input streams, the
+    # output stream and the sourcemap stream.
+    targets = [(input_streams, output_stream, sourcemap_stream)]
+    if output_dir:
+        if not inputs or output or source_map:
+            logger.error(
+                'batch mode requires input files and cannot be used with '
+                'an output path or an explicit source map path')
+            sys.exit(2)
+        try:
+            output_paths = batch_paths(
+                inputs, output_dir, base_dir=base_dir, output_ext=output_ext)
+        except ValueError as e:
+            logger.error('%s', e)
+            sys.exit(2)
+        targets = [(
+            [InputFile(abspath(p), encoding)],
+            partial(open_output, target),
+            (
+                partial(open_output, target + '.map')
+                if source_map == '' else
+                None
+            ),
+        ) for p, target in zip(inputs, output_paths)]
+
+    # the targets for the pretty printed outputs.
+    pretty_targets = []
+    if pretty_output:
+        if output_dir or not inputs:
+            logger.error(
+                'pretty output requires input files and cannot be used in '
+                'batch mode; use --pretty-ext instead')
+            sys.exit(2)
+        if abspath(pretty_output) in (abs_output, abs_source_map):
+            logger.error('pretty output path must differ from the output')
+            sys.exit(2)
+        pretty_targets = [(
+            input_streams, partial(open_writer, abspath(pretty_output)),
+            None,
+        )]
+    elif pretty_ext:
+        if not output_dir:
+            logger.error('pretty extension requires batch mode')
+            sys.exit(2)
+        try:
+            pretty_paths = batch_paths(
+                inputs, output_dir, base_dir=base_dir, output_ext=pretty_ext)
+        except ValueError as e:
+            logger.error('%s', e)
+            sys.exit(2)
+        if set(pretty_paths) & set(output_paths):
+            logger.error(
+                'pretty extension must differ from the output extension')
+            sys.exit(2)
+        pretty_targets = [(
+            [InputFile(abspath(p), encoding)],
+            partial(open_output, target),
+            None,
+        ) for p, target in zip(inputs, pretty_paths)]
+
+    if not jobs:
+        from multiprocessing import cpu_count
+        jobs = cpu_count()
+
+    options = printer_options(
+        mangle=mangle, obfuscate=obfuscate, pretty=pretty,
+        indent_width=indent_width, drop_semi=drop_semi, optimize=optimize,
+        define=define,
+    )
+    pretty_options = printer_options(pretty=True, indent_width=indent_width)
+
+    if incremental and not (abs_output or output_dir):
+        logger.error('incremental mode requires an output path')
+        sys.exit(2)
+
+    def create_manifest(path, options):
+        key = options_key(tuple(options) + manifest_options)
+        if incremental:
+            manifest = Manifest(path, key)
+            manifest.load()
+            return manifest
+        elif watch:
+            # keep the results for the unchanged inputs between runs.
+            return Manifest(None, key)
+        return None
+
+    manifest = create_manifest(
+        join(abspath(output_dir), MANIFEST_NAME)
+        if output_dir else
+        abs_output and abs_output + MANIFEST_EXT,
+        options,
+    )
+    pretty_manifest = create_manifest(
+        join(abspath(output_dir), PRETTY_MANIFEST_NAME)
+        if output_dir else
+        abspath(pretty_output) + MANIFEST_EXT,
+        pretty_options,
+    ) if pretty_targets else None
+
+    timings = null_timings
+    profiler = None
+    stats = Stats() if stats_json else None
+    hooks = list(hooks) + ([stats] if stats else [])
+    if profile is not None or hooks:
+        # minify_targets will then do all processing in this process,
+        # such that it will be accounted.
+        timings = Timings(hooks=hooks)
+        if profile:
+            import cProfile
+            profiler = cProfile.Profile()
+
+    def write_stats():
+        # the outputs written by the current run only.
+        del stats.outputs[:]
+        for writer in writers:
+            stats.add_output(writer.path, writer.size, [
+                (sidecar.ext, sidecar.size) for sidecar in writer.sidecars])
+        writer = AtomicWriter(abspath(stats_json), encoding='utf8')
+        try:
+            writer.write(json.dumps(stats.report(timings), indent=2))
+        except Exception:
+            writer.discard()
+            raise
+        writer.close()
+
+    def process():
+        try:
+            minify_targets(
+                targets, options, cache=cache, jobs=jobs, server=connect,
+                timings=timings, manifest=manifest, stream=stream,
+                shared_scope=shared_scope,
+                input_source_maps=input_source_maps, index_map=index_map,
+                tree_cache=tree_cache, passthrough=passthrough,
+                limits=limits,
+            )
+            if pretty_targets:
+                minify_targets(
+                    pretty_targets, pretty_options, cache=cache, jobs=jobs,
+                    server=connect, timings=timings,
+                    manifest=pretty_manifest, stream=stream,
+                    tree_cache=tree_cache, passthrough=passthrough,
+                    limits=limits,
+                )
+            if compress:
+                for writer in writers:
+                    sys.stderr.write(size_report(writer))
+            if stats:
+                write_stats()
+        finally:
+            del writers[:]
+
+    # only imported now, as calmjs.parse will be loaded in its entirety.
+    from calmjs.parse.exceptions import ECMASyntaxError
     try:
-        io.write(
-            printer, (io.read(parse, f) for f in input_streams),
-            output_stream, sourcemap_stream,
-        )
+        if profiler:
+            profiler.enable()
+        if watch:
+            run_watch([abspath(p) for p in inputs], process)
+        else:
+            process()
     except ECMASyntaxError as e:
         logger.error('%s', e)
         sys.exit(1)
+    except LimitExceeded as e:
+        logger.error('%s', e)
+        sys.exit(LIMIT_EXIT_CODE)
     except (IOError, OSError) as e:
         logger.error('%s', e)
         if e.args and isinstance(e.args[0], int):
@@ -247,7 +839,17 @@ def run(inputs, output, mangle, obfuscate, pretty, source_map, indent_width,
         sys.exit(1)
     except KeyboardInterrupt:
         sys.exit(130)
-    # no need to close any streams as they are callables and that the io
+    finally:
+        if cache is not None:
+            cache.prune()
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(profile)
+        if profile is not None:
+            from crimp.parser import report
+            sys.stderr.write(timings.report())
+            sys.stderr.write(report())
+    # no need to close any streams as they are callables and that the
     # read/write functions take care of that.
 
     sys.exit(0)
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""
+A long running server for keeping the parser and printers loaded, such
+that clients may submit sources to be minified over a Unix domain socket
+without paying the startup costs.
+
+The protocol is a single line of JSON sent by the client, followed by a
+single line of JSON sent by the server as the response, after which the
+connection is closed.  A request is an object with the following keys:
+
+sources
+    A list of 2-tuples of the source text and its sourcepath.
+options
+    The list of key, value pairs as produced by printer_options.
+limits
+    An optional object with the arguments for crimp.limits.Limits, which
+    may only tighten the limits that the server was started with.
+
+Requests are handled in threads, with the sources processed by a pool
+of worker processes (where available) such that the limits, most
+notably the timeout and max_rss, are enforced as they are processed.
+
+The response will be an object with the key 'fragments' containing a
+list of the serialized stream fragments (as produced by the function
+dump_fragments) for every source, or an object with the key 'error'
+containing the name of the exception type and its message.
+"""
+
+import errno
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+
+from os.path import exists
+
+try:
+    import socketserver
+except ImportError:  # pragma: no cover
+    import SocketServer as socketserver
+
+from calmjs.parse.exceptions import ECMASyntaxError
+
+from crimp.api import dump_fragments
+from crimp.api import load_fragments
+from crimp.api import minify_text
+from crimp.api import parse_text
+from crimp.limits import LimitExceeded
+from crimp.limits import Limits
+from crimp.limits import no_limits
+
+logger = logging.getLogger(__name__)
+
+# the errors that a client may encounter while connecting to a server
+# that is not running, such that the local fallback should be used.
+UNAVAILABLE = (errno.ENOENT, errno.ECONNREFUSED, errno.ENOTSOCK)
+ERRORS = {
+    'ECMASyntaxError': ECMASyntaxError,
+    'LimitExceeded': LimitExceeded,
+}
+
+
+def encode(value):
+    return (json.dumps(value, separators=(',', ':')) + '\n').encode('utf8')
+
+
+def decode(line):
+    return json.loads(line.decode('utf8'))
+
+
+def freeze(value):
+    """
+    Return the value decoded from JSON with the lists converted to
+    tuples, such that the options will be hashable once again.
+    """
+
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+def merge_limits(limits, values):
+    """
+    Return the Limits for the dict of the values of a request, which may
+    only be tighter than the limits of the server.
+    """
+
+    merged = {}
+    for key, limit in vars(limits).items():
+        value = values.get(key)
+        merged[key] = limit if value is None else (
+            value if limit is None else min(value, limit))
+    return Limits(**merged)
+
+
+def minify_request(sources, options, limits):
+    """
+    Produce the serialized stream fragments for the sources of a
+    request; the unit of work that is done in the worker processes.
+    """
+
+    return [
+        dump_fragments(minify_text(text, sourcepath, options, limits=limits))
+        for text, sourcepath in sources
+    ]
+
+
+def load_parser():
+    parse_text('', None)
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """
+    Handle a single request.
+    """
+
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        try:
+            request = decode(line)
+            options = freeze(request['options'])
+            limits = merge_limits(
+                self.server.limits, request.get('limits') or {})
+            result = {'fragments': self.server.process(
+                request['sources'], options, limits)}
+        except (ECMASyntaxError, LimitExceeded) as e:
+            result = {'error': [type(e).__name__, str(e)]}
+        except Exception as e:
+            logger.exception('failed to process request')
+            result = {'error': [type(e).__name__, str(e)]}
+        self.wfile.write(encode(result))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, handler, jobs=1, limits=no_limits):
+        socketserver.UnixStreamServer.__init__(self, path, handler)
+        self.jobs = jobs
+        self.limits = limits
+        self.lock = threading.Lock()
+        self.executor = self.create_executor()
+
+    def create_executor(self):
+        """
+        Return the pool of worker processes with the parser loaded, or
+        None if it is unavailable.
+        """
+
+        try:
+            from concurrent.futures import ProcessPoolExecutor
+        except ImportError:  # pragma: no cover
+            # Python 2 without the futures backport.
+            logger.warning(
+                'worker processes are unavailable; the timeout will only '
+                'be checked once processed, and max_rss is ignored')
+            return None
+        executor = ProcessPoolExecutor(max_workers=self.jobs)
+        # start every worker up front, rather than from the threads of
+        # the requests.
+        for future in [
+                executor.submit(load_parser) for _ in range(self.jobs)]:
+            future.result()
+        return executor
+
+    def process(self, sources, options, limits):
+        """
+        Return the serialized stream fragments for the sources, as
+        processed by a worker process.
+        """
+
+        executor = self.executor
+        if executor is None:  # pragma: no cover
+            return minify_request(sources, options, limits)
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            return executor.submit(
+                minify_request, sources, options, limits).result()
+        except BrokenProcessPool:
+            # a worker died (e.g. killed for the memory it used), which
+            # leaves the pool unusable; replace it for later requests.
+            with self.lock:
+                if self.executor is executor:
+                    self.executor = self.create_executor()
+            executor.shutdown(wait=False)
+            raise
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        if self.executor is not None:
+            self.executor.shutdown()
+
+
+def create_server(path, jobs=1, limits=no_limits):
+    """
+    Create the server bound to the Unix domain socket at path, with the
+    parser loaded, which processes the requests with the pool of jobs
+    worker processes (one for every CPU if 0) within the limits.
+    """
+
+    if exists(path):
+        if available(path):
+            raise OSError(
+                errno.EADDRINUSE, 'a server is already listening on %r' % (
+                    path,))
+        # remove the stale socket.
+        os.unlink(path)
+
+    if not jobs:
+        from multiprocessing import cpu_count
+        jobs = cpu_count()
+    # load the parser tables before accepting requests, such that the
+    # worker processes will also have them.
+    load_parser()
+    return Server(path, Handler, jobs=jobs, limits=limits)
+
+
+def serve(path, jobs=1, limits=no_limits):
+    """
+    Serve requests on the Unix domain socket at path until interrupted,
+    with the arguments as per create_server.
+    """
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    server = create_server(path, jobs=jobs, limits=limits)
+    # ensure the socket is cleaned up when terminated.
+    signal.signal(signal.SIGTERM, terminate)
+    logger.info('listening on %r', path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if exists(path):
+            os.unlink(path)
+
+
+def connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except Exception:
+        sock.close()
+        raise
+    return sock
+
+
+def available(path):
+    """
+    Return whether a server is accepting connections at path.
+    """
+
+    try:
+        connect(path).close()
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def request(path, payload):
+    """
+    Send the payload to the server at path and return the response.
+    """
+
+    sock = connect(path)
+    try:
+        stream = sock.makefile('rwb')
+        try:
+            stream.write(encode(payload))
+            stream.flush()
+            response = stream.readline()
+        finally:
+            stream.close()
+    finally:
+        sock.close()
+    if not response:
+        raise IOError(errno.ECONNRESET, 'no response from server')
+    return decode(response)
+
+
+def minify(path, sources, options, limits=no_limits):
+    """
+    Produce the stream fragments lists for the list of 2-tuples of source
+    text and sourcepath using the server at path, within the limits.
+    Returns None if the server is not available so that the caller may
+    fall back to doing the work in process.
+    """
+
+    try:
+        response = request(path, {
+            'sources': sources,
+            'options': options,
+            'limits': vars(limits),
+        })
+    except (IOError, OSError) as e:
+        if getattr(e, 'errno', None) not in UNAVAILABLE:
+            raise
+        logger.debug('server at %r is unavailable: %s', path, e)
+        return None
+
+    if 'error' in response:
+        name, message = response['error']
+        if name in ERRORS:
+            raise ERRORS[name](message)
+        raise IOError(errno.EIO, 'server error: %s: %s' % (name, message))
+
+    return [
+        load_fragments(raw, sourcepath)
+        for raw, (text, sourcepath) in zip(response['fragments'], sources)
+    ]
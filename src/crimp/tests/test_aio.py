@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+Asyncio API tests
+"""
+
+import json
+import threading
+import unittest
+
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+import crimp
+
+try:
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    from crimp import aio
+except (ImportError, SyntaxError):  # pragma: no cover
+    aio = None
+
+
+@unittest.skipIf(aio is None, 'the asyncio API requires Python 3.5')
+class AioTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.addCleanup(self.executor.shutdown)
+        self.calls = []
+        self.event = threading.Event()
+
+    def job(self, value):
+        self.calls.append(value)
+        self.event.wait(5)
+        return value * 2
+
+    def test_aminify(self):
+        source = u'var foo = function(bar) { return bar; };'
+        self.assertEqual(
+            crimp.minify(source, 'foo.js', source_map=True, mangle=True),
+            self.loop.run_until_complete(crimp.aminify(
+                source.encode('utf8'), 'foo.js', source_map=True,
+                mangle=True, executor=self.executor)),
+        )
+
+    def test_aminify_limits(self):
+        with self.assertRaises(crimp.LimitExceeded):
+            self.loop.run_until_complete(crimp.aminify(
+                u'var a = 1;', 'a.js', executor=self.executor,
+                limits=crimp.Limits(max_bytes=5)))
+
+    def test_aminify_files(self):
+        root = mkdtemp()
+        self.addCleanup(rmtree, root)
+        sources = []
+        for name in ('a.js', 'b.js'):
+            sources.append(join(root, name))
+            with open(sources[-1], 'w') as fd:
+                fd.write('var %s = "%s";' % (name[0], name))
+        self.loop.run_until_complete(crimp.aminify_files(
+            sources, join(root, 'out.js'), source_map_path='',
+            executor=self.executor))
+        with open(join(root, 'out.js')) as fd:
+            self.assertEqual(
+                'var a="a.js";var b="b.js";\n'
+                '//# sourceMappingURL=out.js.map\n', fd.read())
+        with open(join(root, 'out.js.map')) as fd:
+            self.assertEqual(['a.js', 'b.js'], json.loads(fd.read())[
+                'sources'])
+
+    def test_run_job_coalesced(self):
+        self.loop.call_later(0.05, self.event.set)
+        self.assertEqual([2, 2, 4], self.loop.run_until_complete(
+            asyncio.gather(*[asyncio.ensure_future(
+                aio.run_job(key, self.job, value, executor=self.executor),
+                loop=self.loop,
+            ) for key, value in (('a', 1), ('a', 1), ('b', 2))])))
+        self.assertEqual([1, 2], self.calls)
+        self.assertEqual({}, aio._jobs[self.loop])
+
+    def test_run_job_cancel_one(self):
+        first = asyncio.ensure_future(
+            aio.run_job('a', self.job, 1, executor=self.executor),
+            loop=self.loop)
+        second = asyncio.ensure_future(
+            aio.run_job('a', self.job, 1, executor=self.executor),
+            loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        first.cancel()
+        self.event.set()
+        self.assertEqual(2, self.loop.run_until_complete(second))
+        self.assertTrue(first.cancelled())
+        self.assertEqual([1], self.calls)
+
+    def test_run_job_cancel_all(self):
+        # the executor is occupied by the first job, such that the
+        # second will not have started once its request is cancelled.
+        first = asyncio.ensure_future(
+            aio.run_job('a', self.job, 1, executor=self.executor),
+            loop=self.loop)
+        second = asyncio.ensure_future(
+            aio.run_job('b', self.job, 2, executor=self.executor),
+            loop=self.loop)
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        second.cancel()
+        # the cancellation is propagated to the executor by the loop.
+        self.loop.run_until_complete(asyncio.sleep(0.01))
+        self.event.set()
+        self.assertEqual(2, self.loop.run_until_complete(first))
+        self.assertTrue(second.cancelled())
+        self.assertEqual([1], self.calls)
+        self.assertEqual({}, aio._jobs[self.loop])
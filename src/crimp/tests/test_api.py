@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+"""
+API tests
+"""
+
+import unittest
+import codecs
+import io
+import json
+import os
+
+from functools import partial
+from itertools import chain
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from calmjs.parse import sourcemap
+from calmjs.parse.exceptions import ECMASyntaxError
+
+import crimp
+from crimp import api
+from crimp.cache import Cache
+from crimp.cache import TreeCache
+from crimp.output import AtomicWriter
+from crimp.timing import Stats
+from crimp.timing import Timings
+
+
+class PrinterTestCase(unittest.TestCase):
+
+    def test_printer_options(self):
+        self.assertEqual(
+            api.printer_options(mangle=True),
+            api.printer_options(obfuscate=True, drop_semi=True),
+        )
+        self.assertEqual(
+            api.printer_options(indent_width=2),
+            api.printer_options(indent_width=8),
+        )
+        self.assertNotEqual(
+            api.printer_options(pretty=True, indent_width=2),
+            api.printer_options(pretty=True, indent_width=8),
+        )
+
+    def test_get_printer_reused(self):
+        options = api.printer_options(mangle=True)
+        self.assertIs(api.get_printer(options), api.get_printer(
+            api.printer_options(obfuscate=True, drop_semi=True)))
+        self.assertIsNot(api.get_printer(options), api.get_printer(
+            api.printer_options()))
+
+
+class MinifyTestCase(unittest.TestCase):
+
+    def test_minify_text(self):
+        self.assertEqual(
+            ('var foo="bar";', None), crimp.minify(u'var foo = "bar";'))
+
+    def test_minify_bytes(self):
+        self.assertEqual(
+            (u'var foo="あ";', None),
+            crimp.minify(u'var foo = "あ";'.encode('shift_jis'),
+                         encoding='shift_jis'),
+        )
+
+    def test_minify_stream(self):
+        stream = io.StringIO(u'var foo = "bar";')
+        stream.name = 'foo.js'
+        code, mapping = crimp.minify(stream, source_map=True)
+        self.assertEqual('var foo="bar";', code)
+        self.assertEqual({
+            'version': 3,
+            'sources': ['foo.js'],
+            'names': [],
+            'mappings': 'AAAA,OAAQ,CAAE',
+        }, mapping)
+
+    def test_minify_options(self):
+        code, mapping = crimp.minify(
+            u'(function(root) { var foo = 1; root.foo = foo; })',
+            sourcepath='foo.js', source_map=True, mangle=True,
+        )
+        self.assertEqual('(function(a){var b=1;a.foo=b})', code)
+        self.assertEqual(['foo.js'], mapping['sources'])
+        self.assertEqual(['root', 'foo'], mapping['names'])
+
+        code, mapping = crimp.minify(
+            u'var foo = {a: 1};', pretty=True, indent_width=2)
+        self.assertEqual('var foo = {\n  a: 1\n};\n', code)
+
+    def test_minify_optimize_define(self):
+        source = u'if (DEBUG) log(1 + 2); var a = LEVEL;'
+        self.assertEqual(
+            'if(DEBUG)log(3);var a=LEVEL;',
+            crimp.minify(source, optimize=True)[0])
+        self.assertEqual('var a=(-1);', crimp.minify(source, define={
+            'DEBUG': 'false', 'LEVEL': '-1'})[0])
+        with self.assertRaises(ValueError):
+            crimp.minify(source, define={'DEBUG': 'debug'})
+
+    def test_minify_tree_cache(self):
+        source = u'(function(root) { var foo = 1; root.foo = foo; })'
+        trees = TreeCache()
+        code, mapping = crimp.minify(
+            source, 'foo.js', source_map=True, mangle=True, tree_cache=trees)
+        self.assertEqual(1, trees.misses)
+
+        # the tree is reused for other options.
+        def parse(*a, **kw):
+            raise AssertionError('parse should not be called')
+
+        original_parse, api.parse = api.parse, parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+        self.assertEqual((code, mapping), crimp.minify(
+            source, 'foo.js', source_map=True, mangle=True, tree_cache=trees))
+        self.assertEqual(
+            '(function(root) {\n    var foo = 1;\n    root.foo = foo;\n});\n',
+            crimp.minify(source, 'foo.js', pretty=True, tree_cache=trees)[0])
+        self.assertEqual(2, trees.hits)
+
+    def test_minify_syntax_error(self):
+        with self.assertRaises(ECMASyntaxError) as e:
+            crimp.minify(u'function(){};', sourcepath='foo.js')
+        self.assertEqual(
+            "Function statement requires a name at 1:9 in 'foo.js'",
+            str(e.exception))
+
+    def test_minify_bad_option(self):
+        with self.assertRaises(TypeError):
+            crimp.minify(u'var foo;', no_such_option=True)
+
+    def test_minify_bytes_bom(self):
+        self.assertEqual(('var foo="\u3042";', None), crimp.minify(
+            codecs.BOM_UTF8 + u'var foo = "\u3042";'.encode('utf8'),
+            encoding='latin1'))
+        self.assertEqual(('var foo="\u3042";', None), crimp.minify(
+            u'\ufeffvar foo = "\u3042";'.encode('utf-16-be'),
+            encoding='utf8'))
+
+
+class InputFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+
+    def write(self, data):
+        path = join(self.root, 'source.js')
+        with open(path, 'wb') as fd:
+            fd.write(data)
+        return path
+
+    def test_read(self):
+        path = self.write(u'var foo = "\u3042";\r\n'.encode('shift_jis'))
+        self.assertEqual(
+            (u'var foo = "\u3042";\r\n', path),
+            api.read(api.InputFile(path, 'shift_jis')))
+
+    def test_read_bom(self):
+        text = u'var foo = "\u3042";'
+        for encoding in ('utf-8-sig', 'utf-16', 'utf-16-le', 'utf-16-be',
+                         'utf-32', 'utf-32-le', 'utf-32-be'):
+            # the codecs without the endianness do not write the mark.
+            bom = u'\ufeff' if encoding[-3:] in ('-le', '-be') else u''
+            path = self.write((bom + text).encode(encoding))
+            self.assertEqual(text, api.InputFile(path, 'ascii').read())
+
+    def test_read_decode_error(self):
+        path = self.write(b'var \x82\xcd\x82\xa2 = 1;')
+        with self.assertRaises(UnicodeDecodeError) as e:
+            api.read(api.InputFile(path, 'utf-8'))
+        self.assertIn("codec can't decode byte 0x82", str(e.exception))
+
+    def test_read_missing(self):
+        with self.assertRaises(IOError):
+            api.read(api.InputFile(join(self.root, 'missing.js'), 'utf8'))
+
+
+class MinifyFileTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+
+    def write(self, name, text):
+        path = join(self.root, name)
+        with codecs.open(path, 'w', encoding='utf8') as fd:
+            fd.write(text)
+        return path
+
+    def read(self, name):
+        with codecs.open(join(self.root, name), encoding='utf8') as fd:
+            return fd.read()
+
+    def test_minify_file(self):
+        source = self.write('source.js', u'var foo = "bar";')
+        crimp.minify_file(source, join(self.root, 'dest.js'))
+        self.assertEqual('var foo="bar";', self.read('dest.js'))
+
+    def test_minify_file_hooks(self):
+        sources = [
+            self.write('a.js', u'var foo = "bar";'),
+            self.write('b.js', u'var bar = "foo";'),
+        ]
+        stats = Stats()
+        # the inputs are processed in this process regardless of jobs.
+        crimp.minify_file(
+            sources, join(self.root, 'dest.js'), jobs=2, hooks=[stats])
+        self.assertEqual(sources, list(stats.inputs))
+        self.assertIn('parse', stats.inputs[sources[0]]['durations'])
+
+        timings = Timings()
+        crimp.minify_file(
+            sources, join(self.root, 'dest.js'), jobs=2, timings=timings)
+        self.assertEqual(2, timings.counts['parse'])
+
+        with self.assertRaises(ValueError):
+            crimp.minify_file(
+                sources, join(self.root, 'dest.js'), timings=timings,
+                hooks=[stats])
+
+    def test_minify_file_source_map(self):
+        sources = [
+            self.write('a.js', u'var foo = "bar";'),
+            self.write('b.js', u'var bar = "foo";'),
+        ]
+        cache = Cache(join(self.root, 'cache'))
+        crimp.minify_file(
+            sources, join(self.root, 'dest.js'), source_map_path='',
+            cache=cache)
+        self.assertEqual(
+            'var foo="bar";var bar="foo";\n'
+            '//# sourceMappingURL=dest.js.map\n', self.read('dest.js'))
+        mapping = json.loads(self.read('dest.js.map'))
+        self.assertEqual(['a.js', 'b.js'], mapping['sources'])
+        self.assertEqual(2, cache.misses)
+
+        crimp.minify_file(
+            sources, join(self.root, 'other.js'),
+            source_map_path=join(self.root, 'other.map'),
+            cache=cache)
+        self.assertEqual(
+            'var foo="bar";var bar="foo";\n'
+            '//# sourceMappingURL=other.map\n', self.read('other.js'))
+        self.assertEqual(2, cache.hits)
+
+    def test_minify_file_index_map(self):
+        sources = [
+            self.write('a.js', u'var foo = "bar";'),
+            self.write('b.js', u'var bar = "foo";'),
+        ]
+        cache = Cache(join(self.root, 'cache'))
+        crimp.minify_file(
+            sources, join(self.root, 'dest.js'), source_map_path='',
+            cache=cache, index_map=True)
+        self.assertEqual(
+            'var foo="bar";var bar="foo";\n'
+            '//# sourceMappingURL=dest.js.map\n', self.read('dest.js'))
+        mapping = json.loads(self.read('dest.js.map'))
+        self.assertEqual([
+            {'line': 0, 'column': 0}, {'line': 0, 'column': 14},
+        ], [section['offset'] for section in mapping['sections']])
+        self.assertEqual(['a.js'], mapping['sections'][0]['map']['sources'])
+        self.assertEqual(['b.js'], mapping['sections'][1]['map']['sources'])
+        # both the fragments and the sections.
+        self.assertEqual(4, cache.misses)
+
+        # only the changed input has its section generated again.
+        self.write('b.js', u'var bar = "baz";')
+        crimp.minify_file(
+            sources, join(self.root, 'dest.js'), source_map_path='',
+            cache=cache, index_map=True)
+        self.assertEqual(2, cache.hits)
+        self.assertEqual(6, cache.misses)
+        self.assertEqual(
+            mapping['sections'][0],
+            json.loads(self.read('dest.js.map'))['sections'][0])
+
+    def test_minify_file_inline_source_map(self):
+        source = self.write('source.js', u'var foo = "bar";')
+        dest = join(self.root, 'dest.js')
+        crimp.minify_file(source, dest, source_map_path=dest)
+        self.assertIn(
+            'var foo="bar";\n//# sourceMappingURL=data:application/json',
+            self.read('dest.js'))
+
+    def test_minify_file_shared_scope(self):
+        sources = [
+            self.write('a.js', u'var zz = 1;'),
+            self.write('b.js', u'(function() { var zig = zz; })();'),
+        ]
+        cache = Cache(join(self.root, 'cache'))
+        crimp.minify_file(
+            sources, join(self.root, 'dest.js'), source_map_path='',
+            cache=cache, shared_scope=True, obfuscate=True)
+        self.assertEqual(
+            'var zz=1;(function(){var z=zz;})();\n'
+            '//# sourceMappingURL=dest.js.map\n', self.read('dest.js'))
+        mapping = json.loads(self.read('dest.js.map'))
+        self.assertEqual(['a.js', 'b.js'], mapping['sources'])
+        self.assertEqual(1, cache.misses)
+
+        # the result for the sources as a whole is reused.
+        def parse(*a, **kw):
+            raise AssertionError('parse should not be called')
+
+        original_parse, api.parse = api.parse, parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+        crimp.minify_file(
+            sources, join(self.root, 'other.js'), source_map_path='',
+            cache=cache, shared_scope=True, obfuscate=True)
+        self.assertEqual(1, cache.hits)
+        self.assertEqual(
+            mapping['mappings'],
+            json.loads(self.read('other.js.map'))['mappings'])
+
+    def test_minify_file_error(self):
+        source = self.write('source.js', u'function(){};')
+        with self.assertRaises(ECMASyntaxError):
+            crimp.minify_file(source, join(self.root, 'dest.js'))
+
+        with self.assertRaises(IOError):
+            crimp.minify_file(
+                join(self.root, 'missing.js'), join(self.root, 'dest.js'))
+
+
+class PassthroughTestCase(unittest.TestCase):
+
+    def test_is_minified(self):
+        self.assertTrue(api.is_minified(u'', 'lib.min.js'))
+        self.assertFalse(api.is_minified(u'a=b+1;' * 10, 'lib.js'))
+        self.assertTrue(api.is_minified(u'a=b+1;' * 1000, 'lib.js'))
+        self.assertTrue(api.is_minified(u'a=b+1;' * 1000))
+        self.assertFalse(api.is_minified(u'a = b + 1;' * 1000))
+        self.assertFalse(api.is_minified(u'a=b+1;\n' * 1000))
+
+    def test_passthrough_matcher(self):
+        self.assertIsNone(api.passthrough_matcher())
+        matcher = api.passthrough_matcher(['*.min.js', 'vendor/*'])
+        self.assertTrue(matcher(u'', '/src/lib.min.js'))
+        self.assertFalse(matcher(u'', '/src/lib.js'))
+        self.assertFalse(matcher(u'', None))
+        self.assertTrue(matcher(u'', os.path.abspath(join('vendor', 'a.js'))))
+        self.assertFalse(matcher(u'', join(os.sep, 'vendor', 'a.js')))
+        matcher = api.passthrough_matcher(minified=True)
+        self.assertTrue(matcher(u'', 'lib.min.js'))
+        self.assertFalse(matcher(u'var a = 1;', 'lib.js'))
+
+    def test_passthrough_fragments(self):
+        stream = io.StringIO()
+        fragments = api.passthrough_fragments(u'a();\nb()', 'lib.js')
+        mappings, sources, names = sourcemap.write(fragments, stream)
+        self.assertEqual(u'a();\nb()\n', stream.getvalue())
+        self.assertEqual([[(0, 0, 0, 0)], [(0, 0, 1, 0)], []], mappings)
+        self.assertEqual(['lib.js'], sources)
+        self.assertEqual([], api.passthrough_fragments(u'', 'lib.js'))
+        self.assertEqual(
+            [(u'a\n', 1, 1, None, NotImplemented)],
+            api.passthrough_fragments(u'a\n', None))
+
+    def test_passthrough_fragments_source_map_comment(self):
+        # the comments no longer apply once passed through.
+        for text in (
+                u'a();\n//# sourceMappingURL=lib.js.map\n',
+                u'a();\n//# sourceMappingURL=lib.js.map',
+                u'a();\n\n//@ sourceMappingURL=lib.js.map\n\n',
+                u'a();\n//# sourceURL=lib.js\n'
+                u'//# sourceMappingURL=data:application/json;base64,e30=\n'):
+            self.assertEqual(
+                [(u'a();\n', 1, 1, None, 'lib.js')],
+                api.passthrough_fragments(text, 'lib.js'))
+        # only those trailing the text.
+        self.assertEqual(
+            [(u'//# sourceURL=lib.js\n', 1, 1, None, 'lib.js'),
+             (u'a();\n', 2, 1, None, 'lib.js')],
+            api.passthrough_fragments(
+                u'//# sourceURL=lib.js\na();\n', 'lib.js'))
+        self.assertEqual(
+            [(u'a(); //# sourceMappingURL=lib.js.map\n', 1, 1, None,
+              'lib.js')],
+            api.passthrough_fragments(
+                u'a(); //# sourceMappingURL=lib.js.map', 'lib.js'))
+
+    def test_minify_file_passthrough(self):
+        root = mkdtemp()
+        self.addCleanup(rmtree, root)
+        sources = []
+        for name, text in (
+                ('a.js', u'var foo = 1;'),
+                ('b.min.js', u'var  bar = 2\n'),
+                ('c.js', u'(function() { var baz = 3; })();')):
+            sources.append(join(root, name))
+            with codecs.open(sources[-1], 'w', encoding='utf8') as fd:
+                fd.write(text)
+
+        parsed = []
+        original_parse = api.parse
+
+        def parse(text):
+            parsed.append(text)
+            return original_parse(text)
+
+        api.parse = parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+        for kwargs in ({'passthrough': ['*.min.js']}, {
+                'passthrough_minified': True}, {
+                'passthrough_minified': True, 'shared_scope': True}):
+            del parsed[:]
+            crimp.minify_file(
+                sources, join(root, 'dest.js'), obfuscate=True, **kwargs)
+            with codecs.open(join(root, 'dest.js'), encoding='utf8') as fd:
+                self.assertEqual(
+                    u'var foo=1;var  bar = 2\n(function(){var a=3;})();',
+                    fd.read())
+            self.assertEqual(2, len(parsed))
+
+
+class WriteTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+
+    def fragments(self, options):
+        return [
+            api.minify_text(text, sourcepath, api.printer_options(**options))
+            for text, sourcepath in (
+                (u'var foo = "bar";\nfunction f(a) { return a; }', 'a.js'),
+                (u'var bar = "foo";', None),
+                (u'if (foo) {\n  f(bar);\n}\n', 'c.js'),
+            )
+        ]
+
+    def test_write_identical(self):
+        def named(name):
+            stream = io.StringIO()
+            stream.name = name
+            return stream
+
+        for options in ({}, {'mangle': True}, {'pretty': True}):
+            fragments = self.fragments(options)
+            for inline in (False, True):
+                expected = named('out.js')
+                expected_map = expected if inline else named('out.js.map')
+                sourcemap.write_sourcemap(*sourcemap.write(
+                    chain.from_iterable(fragments), expected
+                ) + (expected, expected_map))
+
+                result = named('out.js')
+                result_map = result if inline else named('out.js.map')
+                api.write(iter(fragments), result, result_map)
+                self.assertEqual(expected.getvalue(), result.getvalue())
+                self.assertEqual(
+                    expected_map.getvalue(), result_map.getvalue())
+
+    def test_write_lazy(self):
+        stream = io.StringIO()
+        written = []
+
+        def produce():
+            for fragments in self.fragments({}):
+                written.append(stream.getvalue())
+                yield fragments
+
+        api.write(produce(), stream)
+        self.assertEqual([
+            '',
+            'var foo="bar";function f(a){return a;}',
+            'var foo="bar";function f(a){return a;}var bar="foo";',
+        ], written)
+
+    def test_minify_targets_stream(self):
+        sources = []
+        for name, text in (('a.js', 'var a = 1;'), ('b.js', 'var b = 2;')):
+            path = join(self.root, name)
+            with open(path, 'w') as fd:
+                fd.write(text)
+            sources.append(path)
+
+        options = api.printer_options()
+        for stream in (False, True):
+            output = join(self.root, 'out%s.js' % stream)
+            api.minify_targets([(
+                [api.InputFile(path, 'utf8') for path in sources],
+                partial(AtomicWriter, output),
+                partial(AtomicWriter, output + '.map'),
+            )], options, stream=stream)
+
+        for ext in ('', '.map'):
+            with open(join(self.root, 'outFalse.js' + ext)) as fd:
+                expected = fd.read()
+            with open(join(self.root, 'outTrue.js' + ext)) as fd:
+                self.assertEqual(
+                    expected.replace('outFalse', 'outTrue'), fd.read())
+
+        # a failure while streaming leaves the existing output untouched
+        with open(sources[1], 'w') as fd:
+            fd.write('var b = ;')
+        with self.assertRaises(ECMASyntaxError):
+            api.minify_targets([(
+                [api.InputFile(path, 'utf8') for path in sources],
+                partial(AtomicWriter, output), None,
+            )], options, stream=True)
+        with open(output) as fd:
+            self.assertIn('var a=1;var b=2;', fd.read())
+        self.assertEqual(sorted([
+            'a.js', 'b.js', 'outFalse.js', 'outFalse.js.map', 'outTrue.js',
+            'outTrue.js.map',
+        ]), sorted(os.listdir(self.root)))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmark tests
+"""
+
+import unittest
+import io
+
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from crimp import bench
+from crimp.api import minify
+
+
+class BenchTestCase(unittest.TestCase):
+
+    def test_generate(self):
+        text = bench.generate(4096)
+        self.assertGreaterEqual(len(text), 4096)
+        self.assertIn('module0', text)
+        self.assertIn('module1', text)
+        # must be valid source.
+        self.assertTrue(minify(text)[0])
+
+    def test_bench(self):
+        timings = bench.bench(
+            bench.generate(1), 'bench.js',
+            bench.printer_options(optimize=True), repeat=2)
+        for phase in bench.PHASES:
+            self.assertEqual(2, timings.counts[phase])
+
+    def test_main_generated(self):
+        stream = io.StringIO()
+        bench.main(
+            ['--sizes', '1', '2', '-n', '1', '-m', '--optimize'],
+            stream=stream)
+        lines = stream.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('# parser loaded in'))
+        self.assertTrue(lines[1].startswith('# parser tables:'))
+        self.assertTrue(lines[2].startswith('input'))
+        self.assertTrue(lines[3].startswith('generated-1k'))
+        self.assertTrue(lines[4].startswith('generated-2k'))
+
+    def test_main_paths(self):
+        root = mkdtemp()
+        self.addCleanup(rmtree, root)
+        source = join(root, 'source.js')
+        with open(source, 'w') as fd:
+            fd.write('var foo = "bar";')
+        stream = io.StringIO()
+        bench.main([source, '-n', '1', '--memory'], stream=stream)
+        lines = stream.getvalue().splitlines()
+        self.assertTrue(lines[3].startswith('source.js'))
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""
+Bundle tests
+"""
+
+import unittest
+import os
+
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from crimp import api
+from crimp import bundle
+from crimp.api import parse_text
+from crimp.cache import Cache
+from crimp.cache import TreeCache
+
+
+class ModuleTestCase(unittest.TestCase):
+
+    def test_find_module_ids(self):
+        self.assertEqual([
+            'a', './b', 'require', 'c', 'd',
+        ], bundle.find_module_ids(parse_text(
+            u"define('name', ['a', './b', 'require'], function(a, b) {\n"
+            u"  var c = require('c');\n"
+            u"  require(['d'], function(d) {});\n"
+            u"  other.require('e');\n"
+            u"  require(f);\n"
+            u"  define(['g' + 'h']);\n"
+            u"});\n", 'main.js')))
+
+    def test_resolve_module(self):
+        root = join(os.sep, 'root')
+        path = join(root, 'app', 'main.js')
+        self.assertEqual(
+            join(root, 'app', 'util.js'),
+            bundle.resolve_module('./util', path, root))
+        self.assertEqual(
+            join(root, 'lib.js'),
+            bundle.resolve_module('../lib.js', path, root))
+        self.assertEqual(
+            join(root, 'vendor', 'dep.js'),
+            bundle.resolve_module('vendor/dep', path, root))
+        self.assertIsNone(bundle.resolve_module('require', path, root))
+        self.assertIsNone(bundle.resolve_module('text!a.html', path, root))
+        self.assertIsNone(
+            bundle.resolve_module('https://example.com/a.js', path, root))
+
+
+class BundleTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+        os.mkdir(join(self.root, 'lib'))
+
+    def write(self, name, text):
+        with open(join(self.root, name), 'w') as fd:
+            fd.write(text)
+        return join(self.root, name)
+
+    def test_bundle(self):
+        main = self.write(
+            'main.js', "define(['./a', 'lib/b', './missing'], function() {});")
+        a = self.write('a.js', "define(['lib/b', 'lib/c'], function() {});")
+        b = self.write(join('lib', 'b.js'), "var c = require('./c');")
+        c = self.write(join('lib', 'c.js'), "require(['main']);")
+        other = self.write('other.js', "require(['./a']);")
+
+        parsed = []
+        original_parse = api.parse
+
+        def parse(text):
+            parsed.append(text)
+            return original_parse(text)
+
+        api.parse = parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+        trees = TreeCache()
+        cache = Cache(join(self.root, 'cache'))
+        # the circular dependency of c on main is broken.
+        self.assertEqual([c, b, a, main, other], bundle.bundle(
+            [main, other, a], cache=cache, tree_cache=trees))
+        self.assertEqual(5, len(parsed))
+        self.assertEqual(5, len(trees.entries))
+
+        # the module ids are reused from the cache.
+        self.assertEqual([c, b, a, main], bundle.bundle(
+            [main], root=self.root, cache=cache))
+        self.assertEqual(5, len(parsed))
+
+    def test_bundle_passthrough(self):
+        main = self.write('main.js', "require(['lib.min']);")
+        lib = self.write('lib.min.js', "require(['missing']);")
+        self.assertEqual([lib, main], bundle.bundle(
+            [main], passthrough=api.passthrough_matcher(minified=True)))
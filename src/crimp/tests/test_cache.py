@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Cache tests
+"""
+
+import unittest
+import os
+
+from os.path import exists
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from crimp import cache
+
+
+class DigestTestCase(unittest.TestCase):
+
+    def test_digest_stable(self):
+        self.assertEqual(cache.digest('a', 'b'), cache.digest('a', 'b'))
+
+    def test_digest_boundaries(self):
+        self.assertNotEqual(cache.digest('ab', 'c'), cache.digest('a', 'bc'))
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+
+    def test_get_missing(self):
+        c = cache.Cache(join(self.root, 'cache'))
+        self.assertIsNone(c.get(cache.digest('missing')))
+        self.assertEqual(1, c.misses)
+        self.assertEqual(0, c.size())
+
+    def test_put_get(self):
+        c = cache.Cache(join(self.root, 'cache'))
+        key = cache.digest('value')
+        c.put(key, [['var', 1, 1, None, True], [u'あ', 0, 0, None, False]])
+        self.assertEqual(
+            [['var', 1, 1, None, True], [u'あ', 0, 0, None, False]],
+            c.get(key),
+        )
+        self.assertEqual(1, c.hits)
+        self.assertTrue(exists(c.path(key)))
+
+    def test_get_corrupted(self):
+        c = cache.Cache(join(self.root, 'cache'))
+        key = cache.digest('value')
+        c.put(key, [])
+        with open(c.path(key), 'w') as fd:
+            fd.write('[')
+        self.assertIsNone(c.get(key))
+        self.assertFalse(exists(c.path(key)))
+
+    def test_put_failure(self):
+        target = join(self.root, 'file')
+        with open(target, 'w') as fd:
+            fd.write('')
+        # the root is a file, so nothing can be written under it.
+        c = cache.Cache(target)
+        c.put(cache.digest('value'), [])
+        self.assertIsNone(c.get(cache.digest('value')))
+
+    def test_prune_lru(self):
+        c = cache.Cache(join(self.root, 'cache'))
+        keys = [cache.digest(str(i)) for i in range(3)]
+        for idx, key in enumerate(keys):
+            c.put(key, ['x' * 100])
+            os.utime(c.path(key), (idx, idx))
+        # accessing the oldest entry makes it the most recently used
+        c.get(keys[0])
+        c.max_size = c.size() - 1
+        self.assertEqual(1, c.prune())
+        self.assertIsNotNone(c.get(keys[0]))
+        self.assertIsNone(c.get(keys[1]))
+        self.assertIsNotNone(c.get(keys[2]))
+
+    def test_prune_empty(self):
+        c = cache.Cache(join(self.root, 'cache'), max_size=0)
+        self.assertEqual(0, c.prune())
+
+
+class TreeCacheTestCase(unittest.TestCase):
+
+    def test_get_put(self):
+        trees = cache.TreeCache()
+        self.assertIsNone(trees.get(u'var a;', 'a.js'))
+        trees.put(u'var a;', 'a.js', 'tree')
+        self.assertEqual('tree', trees.get(u'var a;', 'a.js'))
+        self.assertIsNone(trees.get(u'var a;', 'b.js'))
+        self.assertEqual(1, trees.hits)
+        self.assertEqual(2, trees.misses)
+        trees.put(u'var a;', 'a.js', 'other')
+        self.assertEqual('other', trees.get(u'var a;', 'a.js'))
+        self.assertEqual(6 * cache.TREE_SIZE_FACTOR, trees.size)
+
+    def test_lru_count(self):
+        trees = cache.TreeCache(max_count=2)
+        trees.put(u'a', None, 'a')
+        trees.put(u'b', None, 'b')
+        # a is now the most recently used.
+        trees.get(u'a', None)
+        trees.put(u'c', None, 'c')
+        self.assertEqual('a', trees.get(u'a', None))
+        self.assertIsNone(trees.get(u'b', None))
+        self.assertEqual('c', trees.get(u'c', None))
+
+    def test_lru_size(self):
+        trees = cache.TreeCache(max_size=cache.TREE_SIZE_FACTOR * 5)
+        trees.put(u'aa', None, 'a')
+        trees.put(u'bb', None, 'b')
+        trees.put(u'cc', None, 'c')
+        self.assertIsNone(trees.get(u'aa', None))
+        self.assertEqual('b', trees.get(u'bb', None))
+        self.assertEqual(cache.TREE_SIZE_FACTOR * 4, trees.size)
+        # too large to be stored at all.
+        trees.put(u'dddddd', None, 'd')
+        self.assertIsNone(trees.get(u'dddddd', None))
+        self.assertEqual('c', trees.get(u'cc', None))
@@ -0,0 +1,176 @@
+# -*- coding: utf-8 -*-
+"""
+Resource limits tests
+"""
+
+import os
+import signal
+import threading
+import time
+import unittest
+
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from crimp import api
+from crimp import limits
+from crimp.api import parse_text
+from crimp.limits import LimitExceeded
+from crimp.limits import Limits
+
+HAS_SETITIMER = hasattr(signal, 'setitimer')
+
+
+class LimitsTestCase(unittest.TestCase):
+
+    def test_check_size(self):
+        checked = Limits(max_bytes=4)
+        checked.check_size(u'abcd', 'a.js')
+        with self.assertRaises(LimitExceeded) as e:
+            # 6 bytes once encoded.
+            checked.check_size(u'ééé', 'a.js')
+        self.assertEqual(
+            "input 'a.js' exceeds the size limit of 4 bytes",
+            str(e.exception))
+        Limits().check_size(u'abcdef', 'a.js')
+
+    def test_check_file(self):
+        root = mkdtemp()
+        self.addCleanup(rmtree, root)
+        path = join(root, 'a.js')
+        with open(path, 'w') as fd:
+            fd.write('var a = 1;')
+        Limits(max_bytes=10).check_file(path)
+        with self.assertRaises(LimitExceeded):
+            Limits(max_bytes=9).check_file(path)
+
+    def test_check_depth(self):
+        tree = parse_text(u'var a = [[[1]]];', 'a.js')
+        Limits(max_depth=20).check_depth(tree, 'a.js')
+        with self.assertRaises(LimitExceeded) as e:
+            Limits(max_depth=5).check_depth(tree, 'a.js')
+        self.assertEqual(
+            "input 'a.js' exceeds the nesting depth limit of 5",
+            str(e.exception))
+
+    def test_enforce_recursion(self):
+        def recurse():
+            recurse()
+
+        with self.assertRaises(LimitExceeded) as e:
+            with Limits().enforce('a.js'):
+                recurse()
+        self.assertEqual(
+            "input 'a.js' is nested too deeply to be processed",
+            str(e.exception))
+
+    @unittest.skipIf(not HAS_SETITIMER, 'setitimer is not available')
+    def test_enforce_timeout(self):
+        previous = signal.getsignal(signal.SIGALRM)
+        start = time.time()
+        with self.assertRaises(LimitExceeded) as e:
+            with Limits(timeout=0.05).enforce('a.js'):
+                time.sleep(2)
+        # interrupted rather than checked once done.
+        self.assertLess(time.time() - start, 1)
+        self.assertEqual(
+            "input 'a.js' exceeds the time limit of 0.05 seconds",
+            str(e.exception))
+        self.assertIs(previous, signal.getsignal(signal.SIGALRM))
+        self.assertEqual((0.0, 0.0), signal.getitimer(signal.ITIMER_REAL))
+
+        # nothing is raised once the context was left in time.
+        with Limits(timeout=0.05).enforce('a.js'):
+            pass
+        time.sleep(0.1)
+
+    def test_enforce_timeout_thread(self):
+        # signals are unavailable outside of the main thread, such that
+        # the time taken is only checked once done.
+        errors = []
+
+        def target():
+            try:
+                with Limits(timeout=0.01).enforce('a.js'):
+                    time.sleep(0.05)
+            except LimitExceeded as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=target)
+        thread.start()
+        thread.join()
+        self.assertEqual(1, len(errors))
+
+    @unittest.skipIf(not HAS_SETITIMER, 'setitimer is not available')
+    def test_enforce_rss(self):
+        self.addCleanup(setattr, limits, 'in_worker', limits.in_worker)
+        # the main process is never checked.
+        with Limits(max_rss=1).enforce('a.js'):
+            pass
+        limits.in_worker = lambda: True
+        with self.assertRaises(LimitExceeded) as e:
+            with Limits(max_rss=1).enforce('a.js'):
+                time.sleep(2)
+        self.assertEqual(
+            "input 'a.js' exceeds the memory limit of 1 bytes",
+            str(e.exception))
+
+    def test_rss(self):
+        self.assertGreater(limits.rss(), 0)
+
+
+class ApiTestCase(unittest.TestCase):
+
+    def test_minify(self):
+        self.assertEqual(('var a=[1];', None), api.minify(
+            u'var a = [1];', 'a.js', limits=Limits(max_bytes=12)))
+        with self.assertRaises(LimitExceeded):
+            api.minify(u'var a = [1];', 'a.js', limits=Limits(max_bytes=11))
+        with self.assertRaises(LimitExceeded):
+            api.minify(
+                u'x = ' + u'[' * 100 + u']' * 100, 'a.js',
+                limits=Limits(max_depth=50))
+
+    def test_minify_too_deep(self):
+        # trees too deep to be unparsed are rejected regardless.
+        with self.assertRaises(LimitExceeded):
+            api.minify(u'x = ' + u'a + ' * 5000 + u'a', 'a.js')
+
+    def test_minify_sources_jobs(self):
+        # enforced within the worker processes.
+        with self.assertRaises(LimitExceeded) as e:
+            api.minify_sources(
+                [(u'var a;', 'a.js'), (u'var abc;', 'b.js')],
+                api.printer_options(), jobs=2, limits=Limits(max_bytes=6))
+        self.assertEqual(
+            "input 'b.js' exceeds the size limit of 6 bytes",
+            str(e.exception))
+
+    @unittest.skipIf(not HAS_SETITIMER, 'setitimer is not available')
+    def test_minify_sources_rss(self):
+        # a single source is also processed by a worker process.
+        with self.assertRaises(LimitExceeded) as e:
+            api.minify_sources(
+                [(u'var a;', 'a.js')], api.printer_options(),
+                limits=Limits(max_rss=1))
+        self.assertEqual(
+            "input 'a.js' exceeds the memory limit of 1 bytes",
+            str(e.exception))
+
+    def test_minify_file(self):
+        root = mkdtemp()
+        self.addCleanup(rmtree, root)
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write('var a = 1;')
+        with open(join(root, 'b.js'), 'w') as fd:
+            fd.write('var b = 2;' * 10)
+        output = join(root, 'out.js')
+        for options in ({}, {'jobs': 2}, {'obfuscate': True,
+                                          'shared_scope': True}):
+            with self.assertRaises(LimitExceeded) as e:
+                api.minify_file(
+                    [join(root, 'a.js'), join(root, 'b.js')], output,
+                    limits=Limits(max_bytes=50), **options)
+            self.assertIn('b.js', str(e.exception))
+            self.assertFalse(os.path.exists(output))
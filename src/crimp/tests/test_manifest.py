@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""
+Manifest tests
+"""
+
+import unittest
+import os
+import stat
+
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from crimp.manifest import Manifest
+
+
+class ManifestTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+        self.path = join(self.root, 'out.js.manifest')
+        self.source = join(self.root, 'source.js')
+        self.write_source('var a = 1;')
+
+    def write_source(self, text, mtime=1000000000):
+        with open(self.source, 'w') as fd:
+            fd.write(text)
+        os.utime(self.source, (mtime, mtime))
+
+    def test_missing(self):
+        manifest = Manifest(self.path, 'key')
+        manifest.load()
+        self.assertIsNone(manifest.lookup(self.source))
+        self.assertIsNone(manifest.lookup_text(self.source, 'var a = 1;'))
+
+    def test_corrupted(self):
+        with open(self.path, 'w') as fd:
+            fd.write('{')
+        manifest = Manifest(self.path, 'key')
+        manifest.load()
+        self.assertEqual({}, manifest.entries)
+
+    def test_roundtrip(self):
+        manifest = Manifest(self.path, 'key')
+        manifest.update(self.source, 'var a = 1;', [['var', 1, 1, None, 1]])
+        manifest.save()
+
+        manifest = Manifest(self.path, 'key')
+        manifest.load()
+        self.assertEqual(
+            [['var', 1, 1, None, 1]], manifest.lookup(self.source))
+        self.assertEqual(1, manifest.hits)
+
+        # a different key discards everything
+        manifest = Manifest(self.path, 'other')
+        manifest.load()
+        self.assertIsNone(manifest.lookup(self.source))
+
+    def test_modified(self):
+        manifest = Manifest(self.path, 'key')
+        manifest.update(self.source, 'var a = 1;', [])
+        manifest.save()
+
+        # touched, but same content
+        self.write_source('var a = 1;', mtime=1000000001)
+        manifest = Manifest(self.path, 'key')
+        manifest.load()
+        self.assertIsNone(manifest.lookup(self.source))
+        self.assertEqual([], manifest.lookup_text(self.source, 'var a = 1;'))
+        manifest.save()
+
+        # the updated modification time was recorded.
+        manifest = Manifest(self.path, 'key')
+        manifest.load()
+        self.assertEqual([], manifest.lookup(self.source))
+
+        self.write_source('var a = 2;', mtime=1000000002)
+        self.assertIsNone(manifest.lookup(self.source))
+        self.assertIsNone(manifest.lookup_text(self.source, 'var a = 2;'))
+
+    def test_save_drops_unused(self):
+        manifest = Manifest(self.path, 'key')
+        manifest.update(self.source, 'var a = 1;', [])
+        manifest.save()
+
+        manifest = Manifest(self.path, 'key')
+        manifest.load()
+        manifest.save()
+
+        manifest = Manifest(self.path, 'key')
+        manifest.load()
+        self.assertEqual({}, manifest.entries)
+
+    def test_save_mode(self):
+        umask = os.umask(0o022)
+        self.addCleanup(os.umask, umask)
+        manifest = Manifest(self.path, 'key')
+        manifest.save()
+        # rather than the restrictive mode of the temporary file.
+        self.assertEqual(0o644, stat.S_IMODE(os.stat(self.path).st_mode))
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Mappings tests
+"""
+
+import unittest
+import base64
+import json
+
+from io import StringIO
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from calmjs.parse import sourcemap
+from calmjs.parse.vlq import encode_mappings
+
+from crimp.api import minify_text
+from crimp.api import printer_options
+from crimp.mappings import MappingsEncoder
+from crimp.mappings import PositionTracker
+from crimp.mappings import SourceMap
+from crimp.mappings import compose
+from crimp.mappings import decode_mappings
+from crimp.mappings import encode_section
+from crimp.mappings import encode_mappings as encode_absolute
+from crimp.mappings import find_source_map
+from crimp.mappings import write_index_map
+from crimp.mappings import write_sourcemap
+
+SOURCE = u'''
+var a = 1, b = { c: "d" };
+
+function add(first, second) {
+    // comment
+    return first + second;
+}
+
+if (a) {
+    add(a, b.c);
+}
+'''
+
+
+def raw_mappings(options):
+    stream = StringIO()
+    mappings, sources, names = sourcemap.write(
+        minify_text(SOURCE, 'source.js', printer_options(**options)),
+        stream, normalize=False)
+    return mappings
+
+
+class MappingsEncoderTestCase(unittest.TestCase):
+
+    def assertEncoded(self, mappings, chunk_size):
+        encoder = MappingsEncoder()
+        segments = [
+            (idx, segment) for idx, line in enumerate(mappings)
+            for segment in line
+        ]
+        # feed the encoder with the mappings split into chunks, with
+        # the first line of every chunk being a continuation.
+        line = 0
+        for offset in range(0, len(segments), chunk_size):
+            chunk = [[]]
+            for idx, segment in segments[offset:offset + chunk_size]:
+                while line < idx:
+                    chunk.append([])
+                    line += 1
+                chunk[-1].append(segment)
+            encoder.update(chunk)
+            self.assertEqual([[]], chunk)
+        while line < len(mappings) - 1:
+            encoder.update([[], []])
+            line += 1
+
+        self.assertEqual(
+            encode_mappings(sourcemap.normalize_mappings(mappings)),
+            encoder.getvalue())
+
+    def test_encode(self):
+        for options in ({}, {'mangle': True}, {'pretty': True}, {
+                'pretty': True, 'obfuscate': True}):
+            mappings = raw_mappings(options)
+            for chunk_size in (1, 3, 7, len(mappings) * 100):
+                self.assertEncoded(mappings, chunk_size)
+
+    def test_encode_empty(self):
+        encoder = MappingsEncoder()
+        self.assertEqual('', encoder.getvalue())
+        encoder.update([[], [], []])
+        self.assertEqual(';;', encoder.getvalue())
+
+    def test_write_sourcemap(self):
+        mappings = sourcemap.normalize_mappings(raw_mappings({}))
+        for inline in (False, True):
+            expected = StringIO()
+            expected.name = 'out.js'
+            expected_map = expected if inline else StringIO()
+            expected_map.name = 'out.js' if inline else 'out.js.map'
+            sourcemap.write_sourcemap(
+                mappings, ['source.js'], ['add'], expected, expected_map)
+
+            result = StringIO()
+            result.name = 'out.js'
+            result_map = result if inline else StringIO()
+            result_map.name = 'out.js' if inline else 'out.js.map'
+            write_sourcemap(
+                encode_mappings(mappings), ['source.js'], ['add'],
+                result, result_map)
+
+            self.assertEqual(expected.getvalue(), result.getvalue())
+            self.assertEqual(expected_map.getvalue(), result_map.getvalue())
+
+    def test_write_index_map(self):
+        output = StringIO()
+        output.name = 'out.js'
+        output_map = StringIO()
+        output_map.name = 'out.js.map'
+        tracker = PositionTracker(output)
+        sections = []
+        for name, options in (('a.js', {}), ('b.js', {'pretty': True})):
+            offset = (tracker.line, tracker.column)
+            sections.append((offset, encode_section(minify_text(
+                SOURCE, name, printer_options(**options)), tracker)))
+        write_index_map(sections, output, output_map)
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual('//# sourceMappingURL=out.js.map', lines[-1])
+        result = json.loads(output_map.getvalue())
+        self.assertEqual('out.js', result['file'])
+        self.assertEqual(3, result['version'])
+        self.assertEqual([
+            {'line': 0, 'column': 0},
+            {'line': 0, 'column': len(''.join(f[0] for f in minify_text(
+                SOURCE, 'a.js', printer_options())))},
+        ], [section['offset'] for section in result['sections']])
+
+        # every section is identical to the source map of the input on
+        # its own.
+        for section, (name, options) in zip(result['sections'], (
+                ('a.js', {}), ('b.js', {'pretty': True}))):
+            stream = StringIO()
+            mappings, sources, names = sourcemap.write(minify_text(
+                SOURCE, name, printer_options(**options)), stream)
+            self.assertEqual({
+                'version': 3,
+                'sources': sources,
+                'names': names,
+                'mappings': encode_mappings(mappings),
+            }, section['map'])
+
+
+class ComposeTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+
+    def write(self, name, text):
+        path = join(self.root, name)
+        with open(path, 'w') as fd:
+            fd.write(text)
+        return path
+
+    def test_decode_encode(self):
+        mappings = 'AAAA,IAAIA,CAAE;;AACF,GAAG;A'
+        lines = decode_mappings(mappings)
+        self.assertEqual([
+            [(0, 0, 0, 0), (4, 0, 0, 4, 0), (5, 0, 0, 6)],
+            [],
+            [(0, 0, 1, 4), (3, 0, 1, 7)],
+            [(0,)],
+        ], lines)
+        self.assertEqual(mappings, encode_absolute(lines))
+        self.assertEqual([[]], decode_mappings(''))
+
+    def test_lookup(self):
+        source_map = SourceMap({
+            'version': 3,
+            'sourceRoot': 'src/',
+            'sources': ['a.ts', 'http://example.com/b.ts'],
+            'names': ['foo'],
+            'mappings': encode_absolute([
+                [(0, 0, 0, 0), (4, 0, 0, 4, 0), (6, 1, 0, 4), (7,)],
+                [(0, 0, 1, 0)],
+            ]),
+        }, self.root)
+        a_ts = join(self.root, 'src', 'a.ts')
+        self.assertEqual(
+            [a_ts, 'http://example.com/b.ts'], source_map.sources)
+        self.assertEqual((a_ts, 0, 0, None), source_map.lookup(0, 0))
+        # offset from the start of the covering segment.
+        self.assertEqual((a_ts, 0, 2, None), source_map.lookup(0, 2))
+        self.assertEqual((a_ts, 0, 4, 'foo'), source_map.lookup(0, 4))
+        self.assertEqual((a_ts, 0, 5, None), source_map.lookup(0, 5))
+        self.assertEqual(
+            ('http://example.com/b.ts', 0, 4, None), source_map.lookup(0, 6))
+        self.assertEqual((a_ts, 1, 3, None), source_map.lookup(1, 3))
+        # unmapped
+        self.assertIsNone(source_map.lookup(0, 7))
+        self.assertIsNone(source_map.lookup(5, 0))
+
+    def test_index_map_unsupported(self):
+        with self.assertRaises(ValueError):
+            SourceMap({'version': 3, 'sections': []})
+
+    def test_find_source_map(self):
+        data = {
+            'version': 3, 'sources': ['a.ts'], 'names': [],
+            'mappings': 'AAAA',
+        }
+        self.write('a.js.map', json.dumps(data))
+        path = self.write('a.js', 'var a;\n//# sourceMappingURL=a.js.map\n')
+        source_map = find_source_map(path)
+        self.assertEqual([join(self.root, 'a.ts')], source_map.sources)
+
+        # inline
+        path = self.write('b.js', (
+            'var b;\n//# sourceMappingURL=data:application/json;base64,' +
+            base64.b64encode(json.dumps(data).encode('utf8')).decode('ascii') +
+            '\n\n'
+        ) + ' ' * 5000)
+        source_map = find_source_map(path)
+        self.assertEqual([join(self.root, 'a.ts')], source_map.sources)
+
+        # not on the last line
+        self.assertIsNone(find_source_map(self.write(
+            'c.js', '//# sourceMappingURL=a.js.map\nvar c;\n')))
+        self.assertIsNone(find_source_map(self.write('d.js', '')))
+
+    def test_find_source_map_invalid(self):
+        self.write('invalid.js.map', '{')
+        for name in ('invalid.js.map', 'missing.js.map'):
+            path = self.write('a.js', '//# sourceMappingURL=%s' % name)
+            with self.assertLogs('crimp.mappings', level='WARNING'):
+                self.assertIsNone(find_source_map(path))
+
+    def test_compose(self):
+        source_maps = {'/a.js': SourceMap({
+            'version': 3, 'sources': ['/a.ts'], 'names': ['orig'],
+            'mappings': encode_absolute([
+                [(0, 0, 0, 0)],
+                [(0, 0, 2, 0, 0), (4, 0, 2, 8)],
+            ]),
+        })}
+        mappings, sources, names = compose(encode_absolute([
+            [(0, 0, 0, 0), (1, 0, 0, 2), (2, 0, 1, 0, 0), (3, 0, 1, 5)],
+            [(0, 1, 1, 0, 0)],
+        ]), ['/a.js', '/b.js'], ['foo'], source_maps)
+        self.assertEqual(['/a.ts', '/b.js'], sources)
+        self.assertEqual(['orig', 'foo'], names)
+        self.assertEqual([
+            [(0, 0, 0, 0), (1, 0, 0, 2), (2, 0, 2, 0, 0), (3, 0, 2, 9)],
+            [(0, 1, 1, 0, 1)],
+        ], decode_mappings(mappings))
+
+        # unmapped in the source map of the input.
+        mappings, sources, names = compose(encode_absolute([
+            [(0, 0, 5, 0), (1, 0, 5, 1)],
+        ]), ['/a.js'], [], source_maps)
+        self.assertEqual([[(0,), (1,)]], decode_mappings(mappings))
+        self.assertEqual([], sources)
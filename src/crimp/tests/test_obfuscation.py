@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+Shared scope obfuscation tests
+"""
+
+import unittest
+
+from calmjs.parse.handlers.obfuscation import ID_CHARS
+from calmjs.parse.lexers.es5 import Lexer
+
+from crimp import api
+from crimp.obfuscation import SharedObfuscator
+from crimp.obfuscation import frequency_charset
+
+
+class FrequencyCharsetTestCase(unittest.TestCase):
+
+    def test_default_order(self):
+        self.assertEqual(ID_CHARS, frequency_charset([]))
+        self.assertEqual(ID_CHARS, frequency_charset(['0123 +-;']))
+
+    def test_frequency_order(self):
+        charset = frequency_charset(['zzz y', 'yy Bz'])
+        self.assertEqual('zyB' + ID_CHARS.replace(
+            'z', '').replace('y', '').replace('B', ''), charset)
+        self.assertEqual(sorted(ID_CHARS), sorted(charset))
+
+
+class SharedObfuscatorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.trees = [
+            api.parse_text(text, None) for text in (
+                'var zz = 1;',
+                '(function() { var zig = zz; return zig + zag; })();',
+            )
+        ]
+
+    def render(self, trees, charset=ID_CHARS):
+        obfuscator = SharedObfuscator(
+            self.trees, charset=charset,
+            reserved_keywords=Lexer.keywords_dict.keys())
+        printer = api.create_printer(
+            api.printer_options(mangle=True), obfuscation=obfuscator.rules)
+        return [
+            ''.join(f[0] for f in api.print_tree(printer, tree))
+            for tree in trees
+        ]
+
+    def test_shared(self):
+        self.assertEqual([
+            'var zz=1',
+            '(function(){var a=zz;return a+zag})()',
+        ], self.render(self.trees))
+
+    def test_charset(self):
+        self.assertEqual([
+            'var zz=1',
+            '(function(){var z=zz;return z+zag})()',
+        ], self.render(self.trees, charset='zga'))
+
+    def test_analyzed_up_front(self):
+        # all trees are analyzed before the first is unparsed, even if
+        # it is not the first tree.
+        self.assertEqual(
+            list(reversed(self.render(self.trees))),
+            self.render(list(reversed(self.trees))),
+        )
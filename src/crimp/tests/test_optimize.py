@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+Optimization pass tests
+"""
+
+import subprocess
+import unittest
+
+from crimp.api import get_printer
+from crimp.api import parse_text
+from crimp.api import print_tree
+from crimp.api import printer_options
+from crimp.optimize import define_literal
+from crimp.optimize import optimize
+
+try:
+    from shutil import which
+except ImportError:  # pragma: no cover
+    from distutils.spawn import find_executable as which
+
+NODE = which('node')
+
+# every source logs the values it computes, such that the output of the
+# original and the optimized versions can be compared.
+PROGRAMS = [
+    u"console.log(1 + 2 * 3, 7 % 3, 2 - 5, 'a' + 'b' + 1 + 2, 1 + 2 + 'a',"
+    u" 'x' + null + true, (1 + 2).toString(), typeof null, typeof 'a',"
+    u" !0, !'', 1 < 2, 'b' <= 'a', 1 === '1', null == null, 2 != 2);",
+    u"var x = 0;"
+    u"console.log(x || 'a', 0 && x, 'a' && x, true ? x : 1, '' ? 1 : 'b',"
+    u" 9007199254740993 + 1, 0x10 + 1, 1.5 + 1, 'it\\'s' + 'x');",
+    u"function f(a) {"
+    u"  if (a) { return g(a); var b = 1; function g(v) { return v + b; } }"
+    u"  return typeof b + typeof h;"
+    u"  function unused() { return unused2(); }"
+    u"  function unused2() {}"
+    u"  function h() {}"
+    u"}"
+    u"console.log(f(1), f(0));",
+    u"var r = [];"
+    u"if (false) { r.push(1); var y = 1; } else { r.push(2); }"
+    u"if (1 + 1 === 2) r.push(3); else r.push(4);"
+    u"while (0) { var z = 1; }"
+    u"for (var i = 0; i < 3; i++) { if (i) { continue; r.push(i); } r.push(i);"
+    u"}"
+    u"switch (r.length) { case 3: r.push('c'); break; r.push('d');"
+    u" default: r.push('e'); }"
+    u"console.log(r, typeof y, typeof z, y, z);",
+    u"function e(s) { function g() { return 1; } return eval(s); }"
+    u"console.log(e('g()'), ('a' + 'b'), 'c');",
+    u"console.log(1 / (0 * -1), 1 / (-1 * 0), 1 / (0 * 1), 1 / (2 * 0));",
+    u"function f() { { 'use strict'; } return this === undefined; }"
+    u"function g() { if (0) {} 'use strict'; return this === undefined; }"
+    u"function h() { 'use strict'; { 'a'; } return this === undefined; }"
+    u"console.log(f(), g(), h());",
+]
+
+
+def unparse(tree, **options):
+    printer = get_printer(printer_options(**options))
+    return ''.join(fragment[0] for fragment in print_tree(printer, tree))
+
+
+class OptimizeTestCase(unittest.TestCase):
+
+    def assertOptimized(self, expected, source):
+        self.assertEqual(expected, unparse(optimize(parse_text(source, 'a'))))
+
+    def test_fold(self):
+        self.assertOptimized(
+            "var a=7,b='ab1',c=(3).toString(),d=true,e='object',f=false;",
+            "var a = 1 + 2 * 3, b = 'a' + 'b' + 1, c = (1 + 2).toString(),"
+            " d = !0, e = typeof null, f = 'b' < 'a';")
+        self.assertOptimized(
+            'var a=x||true,b=0,c=y,d="it\'s",e=1.5+1,f=1-2,g="\\n"+\'y\';',
+            "var a = x || true, b = 0 && x, c = true ? y : z,"
+            " d = \"it'\" + 's', e = 1.5 + 1, f = 1 - 2, g = \"\\n\" + 'y';")
+
+    def test_fold_ambiguous_statements(self):
+        # the results must not be taken as a declaration or a directive.
+        self.assertOptimized(
+            'true?function(){}():0;(1&&{}).a;(\'ab\');',
+            "true ? function(){}() : 0; (1 && {}).a; ('a' + 'b');")
+
+    def test_number_accessor(self):
+        # only the integers require the grouping for the period.
+        self.assertOptimized(
+            '(3).toString();(1).a;1.5.toFixed(1);0x10.toString();'
+            '1e3.toString();1..toString();',
+            '(1 + 2).toString(); (1).a; 1.5.toFixed(1); 0x10.toString();'
+            ' 1e3.toString(); 1..toString();')
+
+    def test_fold_negative_zero(self):
+        self.assertOptimized(
+            'var a=0*-1,b=-1*0,c=0;', 'var a = 0 * -1, b = -1 * 0, c = 0 * 1;')
+
+    def test_directives(self):
+        # strings that become the leading statements are not directives.
+        self.assertOptimized(
+            'function f(){("use strict");return this;}'
+            'function g(){"use strict";("a");}',
+            'function f() { { "use strict"; } return this; }'
+            'function g() { "use strict"; { "a"; } }')
+
+    def test_unreachable(self):
+        self.assertOptimized(
+            'function f(){return g();var a,b;function g(){return a;}}',
+            'function f() { return g(); var a = 1; x();'
+            ' if (y) { var b; } function g() { return a; } }')
+        self.assertOptimized(
+            'L:{a();break L;}',
+            'L: { a(); break L; b(); }')
+        # the declarations of functions within blocks are left as is.
+        self.assertOptimized(
+            'function f(){return;{function g(){}}}',
+            'function f() { return; { function g() {} } }')
+
+    def test_branches(self):
+        self.assertOptimized(
+            'y();z();var q;a();var r;',
+            'if (false) { x(); var q = 1; } else { y(); { z(); } }'
+            ' if (!0) a(); while (0) { var r; }')
+        self.assertOptimized(
+            'while(x){}',
+            'while (x) if (0) a();')
+        self.assertOptimized(
+            'if(false){function k(){}}',
+            'if (false) { function k() {} }')
+
+    def test_unused_functions(self):
+        self.assertOptimized(
+            'function f(){function h(){i();}function i(){}return h;}',
+            'function f() { function g() { g(); } function h() { i(); }'
+            ' function i() {} return h; }')
+        # global functions, and those that may be referenced through
+        # eval or with are retained.
+        self.assertOptimized(
+            'function f(){function g(){}eval(s);}function h(){}',
+            'function f() { function g() {} eval(s); } function h() {}')
+        self.assertOptimized(
+            'function f(){function g(){}with(o){x;}}',
+            'function f() { function g() {} with (o) { x; } }')
+
+    def test_defines(self):
+        defines = {'DEBUG': 'false', 'LEVEL': '-1', 'ENV': '"prod"'}
+
+        def assertDefined(expected, source):
+            self.assertEqual(expected, unparse(
+                optimize(parse_text(source, 'a'), defines)))
+
+        assertDefined(
+            'var a=0,b=(-1).toFixed(),c=1;f(false,[false]);',
+            'if (DEBUG) { log(1); } var a = LEVEL + 1,'
+            ' b = LEVEL.toFixed(), c = ENV === "prod" ? 1 : 2;'
+            ' f(DEBUG, [DEBUG]);')
+        # assignments, properties and declarations are left as is.
+        assertDefined(
+            'DEBUG=1;DEBUG++;o.DEBUG;a={DEBUG:false};',
+            'DEBUG = 1; DEBUG++; o.DEBUG; a = {DEBUG: DEBUG};')
+        assertDefined(
+            'var DEBUG=true;if(DEBUG)a();',
+            'var DEBUG = true; if (DEBUG) a();')
+        # as are the names shadowed by local declarations, or that may
+        # be resolved through eval or with.
+        assertDefined(
+            'function f(DEBUG){return DEBUG;}'
+            'function g(){return LEVEL;var LEVEL;}'
+            'function h(){return function ENV(){return ENV;};}'
+            'try{}catch(DEBUG){DEBUG;}with(o){DEBUG;}'
+            'function e(){eval(s);return DEBUG;}',
+            'function f(DEBUG) { return DEBUG; }'
+            'function g() { return LEVEL; var LEVEL; }'
+            'function h() { return function ENV() { return ENV; }; }'
+            'try {} catch (DEBUG) { DEBUG; } with (o) { DEBUG; }'
+            'function e() { eval(s); return DEBUG; }')
+
+    def test_define_literal(self):
+        self.assertEqual('true', define_literal('true').value)
+        self.assertEqual("'a'", define_literal("'a'").value)
+        for text in ('x', '1 + 1', '{}', '1; 2', '"', ''):
+            with self.assertRaises(ValueError):
+                define_literal(text)
+
+    def test_tree_unmodified(self):
+        source = u'function f() { return 1 + 2; function g() {} }'
+        tree = parse_text(source, 'a')
+        original = unparse(tree)
+        self.assertEqual('function f(){return 3;}', unparse(optimize(tree)))
+        self.assertEqual(original, unparse(tree))
+
+    def test_mangle(self):
+        self.assertEqual(
+            'function f(b){var a=b+1;return a}',
+            unparse(optimize(parse_text(
+                'function f(arg) { var value = arg + (2 - 1); return value;'
+                ' function unused() {} }', 'a')), mangle=True))
+
+    @unittest.skipIf(NODE is None, 'node is not available')
+    def test_semantics(self):
+        def run(source):
+            return subprocess.check_output([NODE, '-e', source])
+
+        for source in PROGRAMS:
+            tree = parse_text(source, 'a')
+            optimized = unparse(optimize(tree))
+            self.assertNotEqual(unparse(tree), optimized)
+            self.assertEqual(run(source), run(optimized), source)
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Output tests
+"""
+
+import unittest
+import gzip
+import os
+import stat
+
+from os.path import exists
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from crimp import output
+from crimp.output import AtomicWriter
+from crimp.output import size_report
+
+
+class AtomicWriterTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+        self.path = join(self.root, 'out.js')
+
+    def read(self):
+        with open(self.path, 'rb') as fd:
+            return fd.read()
+
+    def test_write(self):
+        writer = AtomicWriter(self.path)
+        writer.write(u'var a="☃";')
+        self.assertFalse(exists(self.path))
+        writer.close()
+        self.assertTrue(writer.changed)
+        self.assertEqual(u'var a="☃";'.encode('utf8'), self.read())
+        self.assertEqual(['out.js'], os.listdir(self.root))
+        # closing again is a no-op
+        writer.close()
+
+    def test_discard(self):
+        with open(self.path, 'w') as fd:
+            fd.write('original')
+        writer = AtomicWriter(self.path)
+        writer.write(u'partial')
+        writer.discard()
+        writer.close()
+        self.assertFalse(writer.changed)
+        self.assertEqual(b'original', self.read())
+        self.assertEqual(['out.js'], os.listdir(self.root))
+
+    def test_skip_unchanged(self):
+        with open(self.path, 'w') as fd:
+            fd.write('var a=1;')
+        os.utime(self.path, (1000000000, 1000000000))
+
+        writer = AtomicWriter(self.path, skip_unchanged=True)
+        writer.write(u'var a=1;')
+        writer.close()
+        self.assertFalse(writer.changed)
+        self.assertEqual(1000000000, os.stat(self.path).st_mtime)
+        self.assertEqual(['out.js'], os.listdir(self.root))
+
+        writer = AtomicWriter(self.path, skip_unchanged=True)
+        writer.write(u'var a=2;')
+        writer.close()
+        self.assertTrue(writer.changed)
+        self.assertEqual(b'var a=2;', self.read())
+
+        # without skip_unchanged, always replaced.
+        os.utime(self.path, (1000000000, 1000000000))
+        writer = AtomicWriter(self.path)
+        writer.write(u'var a=2;')
+        writer.close()
+        self.assertTrue(writer.changed)
+        self.assertNotEqual(1000000000, os.stat(self.path).st_mtime)
+
+    def test_mode_preserved(self):
+        with open(self.path, 'w') as fd:
+            fd.write('original')
+        os.chmod(self.path, 0o640)
+        writer = AtomicWriter(self.path)
+        writer.write(u'var a=1;')
+        writer.close()
+        self.assertEqual(0o640, stat.S_IMODE(os.stat(self.path).st_mode))
+
+    def test_not_regular_file(self):
+        writer = AtomicWriter(os.devnull)
+        writer.write(u'var a=1;')
+        writer.close()
+        self.assertTrue(writer.changed)
+        self.assertEqual([], os.listdir(self.root))
+
+    def test_missing_directory(self):
+        with self.assertRaises(OSError):
+            AtomicWriter(join(self.root, 'missing', 'out.js'))
+
+
+class SidecarTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+        self.path = join(self.root, 'out.js')
+
+    def gunzip(self, path):
+        with gzip.open(path, 'rb') as fd:
+            return fd.read()
+
+    def write(self, text, **kw):
+        writer = AtomicWriter(self.path, compress=('gz',), **kw)
+        writer.write(text)
+        writer.close()
+        return writer
+
+    def test_gzip(self):
+        text = u'var a="\u2603";' * 10000
+        for compress_thread in (False, True):
+            writer = self.write(text, compress_thread=compress_thread)
+            self.assertEqual(
+                text.encode('utf8'), self.gunzip(self.path + '.gz'))
+            self.assertEqual(
+                ['out.js', 'out.js.gz'], sorted(os.listdir(self.root)))
+            self.assertEqual(len(text.encode('utf8')), writer.size)
+            self.assertEqual(
+                os.stat(self.path + '.gz').st_size, writer.sidecars[0].size)
+            self.assertEqual(
+                '%s: %d bytes, gz: %d bytes (%.1f%%)\n' % (
+                    self.path, writer.size, writer.sidecars[0].size,
+                    100.0 * writer.sidecars[0].size / writer.size,
+                ), size_report(writer))
+
+    def test_skip_unchanged(self):
+        self.write(u'var a=1;')
+        os.utime(self.path + '.gz', (1000000000, 1000000000))
+        writer = self.write(u'var a=1;', skip_unchanged=True)
+        self.assertFalse(writer.sidecars[0].writer.changed)
+        self.assertEqual(1000000000, os.stat(self.path + '.gz').st_mtime)
+
+        # a missing sidecar is written regardless.
+        os.unlink(self.path + '.gz')
+        writer = self.write(u'var a=1;', skip_unchanged=True)
+        self.assertFalse(writer.changed)
+        self.assertEqual(b'var a=1;', self.gunzip(self.path + '.gz'))
+
+    def test_discard(self):
+        writer = AtomicWriter(
+            self.path, compress=('gz',), compress_thread=True)
+        writer.write(u'partial')
+        writer.discard()
+        self.assertEqual([], os.listdir(self.root))
+
+    def test_compress_error(self):
+        writer = AtomicWriter(
+            self.path, compress=('gz',), compress_thread=True)
+
+        def compress(data):
+            raise ValueError('failure')
+
+        writer.sidecars[0].compress = compress
+        writer.write(u'var a=1;')
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertFalse(writer.changed)
+        self.assertEqual([], os.listdir(self.root))
+
+    def test_not_regular_file(self):
+        writer = AtomicWriter(os.devnull, compress=('gz',))
+        writer.write(u'var a=1;')
+        writer.close()
+        self.assertEqual([], writer.sidecars)
+        self.assertEqual('%s: 8 bytes\n' % os.devnull, size_report(writer))
+
+    def test_unsupported(self):
+        with self.assertRaises(ValueError):
+            AtomicWriter(self.path, compress=('gz', 'zip'))
+        self.assertEqual([], os.listdir(self.root))
+
+    @unittest.skipIf(
+        output.load_brotli() is None, 'brotli is unavailable')
+    def test_brotli(self):
+        writer = AtomicWriter(self.path, compress=('br',))
+        writer.write(u'var a=1;')
+        writer.close()
+        with open(self.path + '.br', 'rb') as fd:
+            self.assertEqual(b'var a=1;', output.load_brotli().decompress(
+                fd.read()))
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Parser tests
+"""
+
+import unittest
+import os
+import sys
+import threading
+
+from os.path import exists
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+from subprocess import Popen
+from subprocess import PIPE
+
+from calmjs.parse.exceptions import ECMASyntaxError
+from calmjs.parse.parsers.es5 import parse as es5_parse
+
+from crimp import parser
+
+SOURCES = [
+    u'var a = 1;\nfunction f(b) {\n  return b + a;\n}\n',
+    u'if (a) {\n  x = /re/g.test("y");\n} else b()\nc = 1',
+    u'(function(){ var s = "\\u2603"; return s; })();',
+]
+
+
+class ParserTestCase(unittest.TestCase):
+
+    def test_parse_identical(self):
+        for source in SOURCES + SOURCES:
+            self.assertEqual(
+                repr(es5_parse(source)), repr(parser.parse(source)))
+
+    def test_parse_positions(self):
+        # the line numbers must not carry over between parses.
+        for _ in range(2):
+            tree = parser.parse(SOURCES[0])
+            self.assertEqual(3, tree.children()[1].elements[0].lineno)
+
+    def test_parse_after_error(self):
+        with self.assertRaises(ECMASyntaxError) as e:
+            parser.parse(u'var a = ;\nvar b;')
+        self.assertEqual("Unexpected ';' at 1:9 between '=' at 1:7 and "
+                         "'var' at 2:1", str(e.exception))
+        self.assertEqual(
+            repr(es5_parse(SOURCES[1])), repr(parser.parse(SOURCES[1])))
+
+    def test_parse_lexer_error(self):
+        # the error handler must be bound to the lexer of the parse.
+        with self.assertRaises(ECMASyntaxError) as e:
+            parser.parse(u'var a = "')
+        self.assertEqual(
+            "Unterminated string literal '\"' at 1:9", str(e.exception))
+
+    def test_parser_reused(self):
+        first = parser.get_parser()
+        self.assertIs(first, parser.get_parser())
+        self.assertEqual('shipped', parser.stats['tables'])
+
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(parser.get_parser()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(first, results[0])
+        self.assertIn('parser tables: shipped', parser.report())
+
+
+class TablesTestCase(unittest.TestCase):
+
+    def test_generated_then_cached(self):
+        # emulate an installed version of ply that calmjs.parse does not
+        # ship the tables for, in a new process.
+        root = mkdtemp()
+        self.addCleanup(rmtree, root)
+        code = (
+            'from calmjs.parse.parsers import es5\n'
+            'es5.lextab += "_missing"\n'
+            'es5.yacctab += "_missing"\n'
+            'from crimp import api, parser\n'
+            'print(api.minify("var a = 1;")[0])\n'
+            'print(parser.stats["tables"])\n'
+        )
+        env = dict(os.environ)
+        env['CRIMP_TABLES_DIR'] = root
+        results = []
+        for _ in range(2):
+            p = Popen(
+                [sys.executable, '-c', code], stdout=PIPE, stderr=PIPE,
+                env=env)
+            stdout, stderr = p.communicate()
+            results.append(stdout.decode('utf8').split())
+            self.assertEqual(b'', stderr)
+        self.assertEqual([
+            ['var', 'a=1;', 'generated'],
+            ['var', 'a=1;', 'cached'],
+        ], results)
+        directory = join(root, os.listdir(root)[0])
+        self.assertTrue(exists(join(directory, parser.LEXTAB + '.py')))
+        self.assertTrue(exists(join(directory, parser.YACCTAB + '.py')))
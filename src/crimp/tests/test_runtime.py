@@ -5,6 +5,7 @@ Runtime tests
 
 import unittest
 import base64
+import gzip
 import json
 import sys
 import io
@@ -21,6 +22,7 @@ from shutil import rmtree
 from subprocess import Popen
 from subprocess import PIPE
 
+from crimp import api
 from crimp import runtime
 
 
@@ -456,6 +458,767 @@ class RuntimeTestCase(unittest.TestCase):
         self.assertIn(
             "'ascii' codec can't encode characters", sys.stderr.getvalue())
 
+    def test_cache_dir_warm_run(self):
+        root = self.mkdtemp()
+        cache_dir = join(root, 'cache')
+        source = join(root, 'source.js')
+        with open(source, 'w') as fd:
+            fd.write('(function(root) { var foo = "bar"; root.foo = foo; })')
+
+        self.chdir(root)
+        argv = (
+            'crimp', 'source.js', '-O', 'dest.js', '-s', '-m',
+            '--cache-dir', cache_dir,
+        )
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(*argv)
+        self.assertEqual(e.exception.args[0], 0)
+
+        with open(join(root, 'dest.js')) as fd:
+            cold = fd.read()
+        with open(join(root, 'dest.js.map')) as fd:
+            cold_map = fd.read()
+
+        def parse(*a, **kw):
+            raise AssertionError('parse should not be called')
+
+        original_parse, api.parse = api.parse, parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(*argv)
+        self.assertEqual(e.exception.args[0], 0)
+
+        with open(join(root, 'dest.js')) as fd:
+            self.assertEqual(cold, fd.read())
+        with open(join(root, 'dest.js.map')) as fd:
+            self.assertEqual(cold_map, fd.read())
+
+        # a change in options will result in a cache miss.
+        with self.assertRaises(AssertionError):
+            runtime.main(*argv + ('-p',))
+
+    def test_jobs_output_identical(self):
+        root = self.mkdtemp()
+        sources = []
+        for idx in range(4):
+            source = join(root, 'source%d.js' % idx)
+            with open(source, 'w') as fd:
+                fd.write(dedent('''
+                (function(root) {
+                  var value%d = 'value';
+                  root.value%d = function(arg) {
+                    return value%d + arg;
+                  };
+                })(window);
+                ''' % (idx, idx, idx)).lstrip())
+            sources.append(source)
+
+        self.chdir(root)
+        outputs = []
+        for idx, flags in enumerate((['-j', '1'], ['-j', '4'], ['--stream'])):
+            dest = join(root, 'dest%d.js' % idx)
+            with self.assertRaises(SystemExit) as e:
+                runtime.main(*['crimp'] + sources + [
+                    '-O', dest, '-s', dest + '.map', '-m'] + flags)
+            self.assertEqual(e.exception.args[0], 0)
+            with open(dest) as fd:
+                code = fd.read()
+            with open(dest + '.map') as fd:
+                mapping = json.loads(fd.read())
+            outputs.append((code.splitlines()[0], mapping['mappings']))
+
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[0], outputs[2])
+        self.assertEqual(4, outputs[1][0].count('(function(b){var a='))
+
+    def test_shared_scope(self):
+        root = self.mkdtemp()
+        sources = []
+        for idx, text in enumerate((
+                'var zz = 1;\n',
+                '(function(root) { var zig = zz; root.zig = zig; })(this);\n',
+                )):
+            source = join(root, 'source%d.js' % idx)
+            with open(source, 'w') as fd:
+                fd.write(text)
+            sources.append(source)
+
+        self.chdir(root)
+        for flags in (['-j', '2'], ['--stream']):
+            with self.assertRaises(SystemExit) as e:
+                runtime.main(*['crimp'] + sources + [
+                    '-O', 'dest.js', '-s', '-o', '--shared-scope'] + flags)
+            self.assertEqual(e.exception.args[0], 0)
+            with open(join(root, 'dest.js')) as fd:
+                self.assertEqual(
+                    'var zz=1;(function(i){var z=zz;i.zig=z;})(this);\n'
+                    '//# sourceMappingURL=dest.js.map\n', fd.read())
+
+    def test_jobs_syntax_error(self):
+        self.stub_stdio()
+        root = self.mkdtemp()
+        sources = []
+        for idx, text in enumerate(['var a = 1;', 'function(){};']):
+            source = join(root, 'source%d.js' % idx)
+            with open(source, 'w') as fd:
+                fd.write(text)
+            sources.append(source)
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(*['crimp'] + sources + ['-j', '2'])
+
+        self.assertEqual(e.exception.args[0], 1)
+        self.assertIn(
+            "Function statement requires a name at 1:9 in %r" % sources[1],
+            sys.stderr.getvalue())
+
+    def test_batch_paths(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        self.assertEqual([
+            join(root, 'out', 'a.js'),
+            join(root, 'out', 'lib', 'b.js'),
+        ], runtime.batch_paths(
+            [join('src', 'a.js'), join('src', 'lib', 'b.js')], 'out'))
+        self.assertEqual([
+            join(root, 'out', 'src', 'a.min.js'),
+        ], runtime.batch_paths(
+            [join('src', 'a.js')], 'out', base_dir=root,
+            output_ext='.min.js'))
+
+        with self.assertRaises(ValueError):
+            runtime.batch_paths(
+                [join('src', 'a.js')], 'out', base_dir=join(root, 'lib'))
+
+        with self.assertRaises(ValueError):
+            runtime.batch_paths([join('src', 'a.js')], 'src')
+
+    def test_batch_mode(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        os.mkdir(join(root, 'src'))
+        os.mkdir(join(root, 'src', 'lib'))
+        with open(join(root, 'src', 'a.js'), 'w') as fd:
+            fd.write('var foo = "bar";')
+        with open(join(root, 'src', 'lib', 'b.js'), 'w') as fd:
+            fd.write('var bar = "foo";')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', join('src', 'a.js'), join('src', 'lib', 'b.js'),
+                '-D', 'dist', '--output-ext', '.min.js', '-s')
+
+        self.assertEqual(e.exception.args[0], 0)
+
+        with open(join(root, 'dist', 'a.min.js')) as fd:
+            self.assertEqual(
+                'var foo="bar";\n//# sourceMappingURL=a.min.js.map\n',
+                fd.read())
+        with open(join(root, 'dist', 'lib', 'b.min.js')) as fd:
+            self.assertEqual(
+                'var bar="foo";\n//# sourceMappingURL=b.min.js.map\n',
+                fd.read())
+        with open(join(root, 'dist', 'lib', 'b.min.js.map')) as fd:
+            mapping = json.loads(fd.read())
+            self.assertEqual(['../../src/lib/b.js'], mapping['sources'])
+            self.assertEqual('b.min.js', mapping['file'])
+
+    def test_pretty_output(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write('var foo = function(bar) { return bar; };')
+
+        parsed = []
+        original_parse = api.parse
+
+        def parse(text):
+            parsed.append(text)
+            return original_parse(text)
+
+        api.parse = parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', 'a.js', '-O', 'a.min.js', '-m', '-s',
+                '--pretty-output', 'a.pretty.js', '--indent-width', '2')
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual(1, len(parsed))
+
+        with open(join(root, 'a.min.js')) as fd:
+            self.assertEqual(
+                'var foo=function(a){return a}\n'
+                '//# sourceMappingURL=a.min.js.map\n', fd.read())
+        with open(join(root, 'a.pretty.js')) as fd:
+            self.assertEqual(
+                'var foo = function(bar) {\n  return bar;\n};\n', fd.read())
+
+    def test_pretty_ext(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        os.mkdir(join(root, 'src'))
+        with open(join(root, 'src', 'a.js'), 'w') as fd:
+            fd.write('var foo = "bar";')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', join('src', 'a.js'), '-D', 'dist',
+                '--output-ext', '.min.js', '--pretty-ext', '.js', '-s')
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual(
+            ['a.js', 'a.min.js', 'a.min.js.map'],
+            sorted(os.listdir(join(root, 'dist'))))
+        with open(join(root, 'dist', 'a.js')) as fd:
+            self.assertEqual('var foo = "bar";\n', fd.read())
+
+    def test_pretty_invalid(self):
+        self.stub_stdio()
+        root = self.mkdtemp()
+        self.chdir(root)
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write('var foo = "bar";')
+
+        for argv in (
+                ['-O', 'out.js', '--pretty-output', 'out.js'],
+                ['-D', 'dist', '--pretty-output', 'out.js'],
+                ['-O', 'out.js', '--pretty-ext', '.js'],
+                ['-D', 'dist', '--output-ext', '.js', '--pretty-ext', '.js']):
+            with self.assertRaises(SystemExit) as e:
+                runtime.main(*['crimp', 'a.js'] + argv)
+            self.assertEqual(e.exception.args[0], 2)
+        self.assertFalse(exists(join(root, 'out.js')))
+
+    def test_passthrough(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        os.mkdir(join(root, 'vendor'))
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write('var foo = "bar";')
+        with open(join(root, 'vendor', 'lib.js'), 'w') as fd:
+            fd.write('var  lib = 1;')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', 'a.js', join('vendor', 'lib.js'), '-O', 'out.js',
+                '-s', '--passthrough', join('vendor', '*'))
+        self.assertEqual(e.exception.args[0], 0)
+        with open(join(root, 'out.js')) as fd:
+            self.assertEqual(
+                'var foo="bar";var  lib = 1;\n\n'
+                '//# sourceMappingURL=out.js.map\n', fd.read())
+        with open(join(root, 'out.js.map')) as fd:
+            mapping = json.loads(fd.read())
+        self.assertEqual(['a.js', 'vendor/lib.js'], mapping['sources'])
+
+    def test_optimize(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write(
+                'function f(value) {\n'
+                '  if (false) { log(value); }\n'
+                '  return value + (1 + 2);\n'
+                '  function unused() {}\n'
+                '}\n')
+        with open(join(root, 'b.js'), 'w') as fd:
+            fd.write('var b = f(1) + ("a" + "b");\n')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', 'a.js', 'b.js', '-O', 'out.js', '-s', '-m',
+                '--shared-scope', '--optimize')
+        self.assertEqual(e.exception.args[0], 0)
+        with open(join(root, 'out.js')) as fd:
+            self.assertEqual(
+                'function f(u){return u+3}var b=f(1)+\'ab\'\n'
+                '//# sourceMappingURL=out.js.map\n', fd.read())
+        with open(join(root, 'out.js.map')) as fd:
+            mapping = json.loads(fd.read())
+        self.assertEqual(['a.js', 'b.js'], mapping['sources'])
+
+    def test_define(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        self.stub_stdio()
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write('if (DEBUG) {\n  console.log(ENV);\n}\nvar env = ENV;\n')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', 'a.js', '--define', 'DEBUG=false',
+                '--define', 'ENV="production"')
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual('var env="production";', sys.stdout.getvalue())
+
+    def test_define_invalid(self):
+        self.stub_stdio()
+        for define in ('DEBUG', 'DEBUG=x', 'a.b=1'):
+            with self.assertRaises(SystemExit) as e:
+                runtime.main('crimp', '--define', define)
+            self.assertEqual(e.exception.args[0], 2)
+        self.assertIn(
+            "the value 'x' for the define 'DEBUG' must be a string, "
+            "number, boolean or null literal", sys.stderr.getvalue())
+
+    def test_limits(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        self.stub_stdio()
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write('var a = [[[1]]];\n')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', 'a.js', '--max-bytes', '17', '--max-depth', '20',
+                '--timeout', '10', '--max-rss', '1024')
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual('var a=[[[1]]];', sys.stdout.getvalue())
+
+        for flags in (['--max-bytes', '16'], ['--max-depth', '5']):
+            with self.assertRaises(SystemExit) as e:
+                runtime.main(*['crimp', 'a.js', '-O', 'out.js'] + flags)
+            self.assertEqual(e.exception.args[0], runtime.LIMIT_EXIT_CODE)
+        self.assertIn(
+            "exceeds the size limit of 16 bytes", sys.stderr.getvalue())
+        self.assertIn(
+            "exceeds the nesting depth limit of 5", sys.stderr.getvalue())
+        self.assertFalse(exists(join(root, 'out.js')))
+
+    def test_bundle(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        self.stub_stdio()
+        with open(join(root, 'main.js'), 'w') as fd:
+            fd.write("define(['./a', './b'], function(a, b) {});")
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write("define(['./b'], function(b) {});")
+        with open(join(root, 'b.js'), 'w') as fd:
+            fd.write("define([], function() {});")
+
+        parsed = []
+        original_parse = api.parse
+
+        def parse(text):
+            parsed.append(text)
+            return original_parse(text)
+
+        api.parse = parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', 'main.js', '-O', 'out.js', '--bundle',
+                '--pretty-output', 'out.pretty.js')
+        self.assertEqual(e.exception.args[0], 0)
+        # every file is parsed once, for the bundle and both outputs.
+        self.assertEqual(3, len(parsed))
+        with open(join(root, 'out.js')) as fd:
+            self.assertEqual(
+                "define([],function(){});"
+                "define(['./b'],function(b){});"
+                "define(['./a','./b'],function(a,b){});", fd.read())
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', '--bundle')
+        self.assertEqual(e.exception.args[0], 2)
+
+    def test_bundle_jobs(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        self.stub_stdio()
+        with open(join(root, 'main.js'), 'w') as fd:
+            fd.write("define(['./a', './b'], function(a, b) {});")
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write("define(['./b'], function(b) {});")
+        with open(join(root, 'b.js'), 'w') as fd:
+            fd.write("define([], function() {});")
+
+        # recorded in a file, as parses within the worker processes
+        # must also be accounted.
+        log = join(root, 'parsed.log')
+        original_parse = api.parse
+
+        def parse(text):
+            with open(log, 'a') as fd:
+                fd.write('parsed\n')
+            return original_parse(text)
+
+        api.parse = parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+        for flags in (['-j', '4'], ['--max-rss', '1024']):
+            with open(log, 'w'):
+                pass
+            with self.assertRaises(SystemExit) as e:
+                runtime.main(*[
+                    'crimp', 'main.js', '-O', 'out.js', '--bundle',
+                    '--pretty-output', 'out.pretty.js'] + flags)
+            self.assertEqual(e.exception.args[0], 0)
+            # the trees of the bundle are not parsed again by workers.
+            with open(log) as fd:
+                self.assertEqual(3, len(fd.readlines()))
+            with open(join(root, 'out.js')) as fd:
+                self.assertEqual(
+                    "define([],function(){});"
+                    "define(['./b'],function(b){});"
+                    "define(['./a','./b'],function(a,b){});", fd.read())
+
+    def test_batch_mode_invalid(self):
+        self.stub_stdio()
+        root = self.mkdtemp()
+        self.chdir(root)
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write('var foo = "bar";')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', '-D', 'dist')
+        self.assertEqual(e.exception.args[0], 2)
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', 'a.js', '-D', 'dist', '-O', 'out.js')
+        self.assertEqual(e.exception.args[0], 2)
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', 'a.js', '-D', '.')
+        self.assertEqual(e.exception.args[0], 2)
+        self.assertIn('would overwrite an input file', sys.stderr.getvalue())
+        self.assertFalse(exists(join(root, 'dist')))
+
+    def test_incremental(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        sources = []
+        for idx in range(3):
+            source = join(root, 'source%d.js' % idx)
+            with open(source, 'w') as fd:
+                fd.write('var value%d = %d;' % (idx, idx))
+            sources.append(source)
+
+        argv = ['crimp'] + sources + ['-O', 'dest.js', '-s', '--incremental']
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(*argv)
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertTrue(exists(join(root, 'dest.js.manifest')))
+
+        parsed = []
+        original_parse = api.parse
+
+        def parse(text, *a, **kw):
+            parsed.append(text)
+            return original_parse(text, *a, **kw)
+
+        api.parse = parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+
+        with open(sources[1], 'w') as fd:
+            fd.write('var value1 = "changed";')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(*argv)
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual(['var value1 = "changed";'], parsed)
+
+        with open(join(root, 'dest.js')) as fd:
+            incremental = fd.read()
+        with open(join(root, 'dest.js.map')) as fd:
+            incremental_map = fd.read()
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(*['crimp'] + sources + ['-O', 'dest.js', '-s'])
+        self.assertEqual(e.exception.args[0], 0)
+
+        with open(join(root, 'dest.js')) as fd:
+            self.assertEqual(incremental, fd.read())
+        with open(join(root, 'dest.js.map')) as fd:
+            self.assertEqual(incremental_map, fd.read())
+        self.assertIn('value1="changed"', incremental)
+
+    def test_incremental_passthrough(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        with open(join(root, 'a.js'), 'w') as fd:
+            fd.write('var  a = 1;')
+        with open(join(root, 'b.min.js'), 'w') as fd:
+            fd.write('var b=1;' * 10 + '\n')
+
+        def run(*flags):
+            with self.assertRaises(SystemExit) as e:
+                runtime.main(*[
+                    'crimp', 'a.js', 'b.min.js', '-O', 'out.js',
+                    '--incremental'] + list(flags))
+            self.assertEqual(e.exception.args[0], 0)
+            with open(join(root, 'out.js')) as fd:
+                return fd.read()
+
+        self.assertEqual('var a=1;' + 'var b=1;' * 10, run())
+        # the results recorded without passthrough are not reused.
+        self.assertEqual(
+            'var  a = 1;\n' + 'var b=1;' * 10, run('--passthrough', 'a.js'))
+        self.assertEqual(
+            'var a=1;' + 'var b=1;' * 10 + '\n',
+            run('--passthrough-minified'))
+        self.assertEqual('var a=1;' + 'var b=1;' * 10, run())
+
+    def test_incremental_encoding(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        with open(join(root, 'a.js'), 'wb') as fd:
+            fd.write(u'var a = "\u00e9";'.encode('utf8'))
+
+        def run(encoding):
+            with self.assertRaises(SystemExit) as e:
+                runtime.main(
+                    'crimp', 'a.js', '-O', 'out.js', '--incremental',
+                    '--encoding', encoding)
+            self.assertEqual(e.exception.args[0], 0)
+            with open(join(root, 'out.js'), 'rb') as fd:
+                return fd.read().decode(encoding)
+
+        self.assertEqual(u'var a="\u00e9";', run('utf8'))
+        # the input decoded differently is not reused from the manifest.
+        self.assertEqual(u'var a="\u00c3\u00a9";', run('latin1'))
+        self.assertEqual(u'var a="\u00e9";', run('utf8'))
+
+    def test_incremental_requires_output(self):
+        self.stub_stdio()
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', '--incremental')
+        self.assertEqual(e.exception.args[0], 2)
+
+    def test_skip_unchanged(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        source = join(root, 'source.js')
+        with open(source, 'w') as fd:
+            fd.write('var foo = 1;')
+        target = join(root, 'dest.js')
+
+        def run(*flags):
+            with self.assertRaises(SystemExit) as e:
+                runtime.main('crimp', source, '-O', target, '-s', *flags)
+            self.assertEqual(e.exception.args[0], 0)
+            os.utime(target, (1000000000, 1000000000))
+            os.utime(target + '.map', (1000000000, 1000000000))
+
+        run()
+        run('--skip-unchanged')
+        self.assertEqual(1000000000, os.stat(target).st_mtime)
+        self.assertEqual(1000000000, os.stat(target + '.map').st_mtime)
+        run()
+        # no temporary files remain
+        self.assertEqual(
+            ['dest.js', 'dest.js.map', 'source.js'], sorted(os.listdir(root)))
+
+        with open(source, 'w') as fd:
+            fd.write('var foo = 2;')
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', source, '-O', target, '-s', '--skip-unchanged')
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertNotEqual(1000000000, os.stat(target).st_mtime)
+        with open(target) as fd:
+            self.assertEqual(
+                'var foo=2;\n//# sourceMappingURL=dest.js.map\n', fd.read())
+
+    def test_compress(self):
+        self.stub_stdio()
+        root = self.mkdtemp()
+        self.chdir(root)
+        source = join(root, 'source.js')
+        with open(source, 'w') as fd:
+            fd.write('var foo = 1;')
+        target = join(root, 'dest.js')
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', source, '-O', target, '-s', '--compress', 'gz',
+                '--compress-thread')
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual([
+            'dest.js', 'dest.js.gz', 'dest.js.map', 'dest.js.map.gz',
+            'source.js',
+        ], sorted(os.listdir(root)))
+        for path in (target, target + '.map'):
+            with open(path, 'rb') as fd, gzip.open(path + '.gz') as gz:
+                self.assertEqual(fd.read(), gz.read())
+        report = sys.stderr.getvalue().splitlines()
+        self.assertEqual(2, len(report))
+        self.assertTrue(report[0].startswith('%s: %d bytes, gz: ' % (
+            target, os.stat(target).st_size)))
+
+    def test_compress_unsupported(self):
+        self.stub_stdio()
+        self.addCleanup(
+            setattr, runtime, 'available_compressions',
+            runtime.available_compressions)
+        runtime.available_compressions = lambda: ('gz',)
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', '--compress', 'br')
+        self.assertEqual(e.exception.args[0], 2)
+        self.assertIn('unsupported compression: br', sys.stderr.getvalue())
+
+    def test_input_source_maps(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        with open(join(root, 'orig.js'), 'w') as fd:
+            fd.write('var foo = 1;\n\n\nvar bar = foo;\n')
+        # generate the input along with its source map.
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', 'orig.js', '-p', '-O', join(root, 'gen.js'), '-s')
+        self.assertEqual(e.exception.args[0], 0)
+
+        for flags, sources, mappings in (
+                ([], ['gen.js'], 'AAAA,OAAQ,CAAE,EACV,OAAQ,CAAE'),
+                (['--input-source-maps'], ['orig.js'],
+                 'AAAA,OAAQ,CAAE,EAGV,OAAQ,CAAE')):
+            with self.assertRaises(SystemExit) as e:
+                runtime.main(*[
+                    'crimp', 'gen.js', '-O', join(root, 'out.js'), '-s'
+                ] + flags)
+            self.assertEqual(e.exception.args[0], 0)
+            with open(join(root, 'out.js.map')) as fd:
+                mapping = json.loads(fd.read())
+            self.assertEqual(sources, mapping['sources'])
+            self.assertEqual(mappings, mapping['mappings'])
+
+    def test_index_map(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        for name in ('a.js', 'b.js'):
+            with open(join(root, name), 'w') as fd:
+                fd.write('var %s = 1;\n' % name[0])
+        with self.assertRaises(SystemExit) as e:
+            runtime.main(
+                'crimp', 'a.js', 'b.js', '-O', join(root, 'out.js'), '-s',
+                '--index-map')
+        self.assertEqual(e.exception.args[0], 0)
+        with open(join(root, 'out.js.map')) as fd:
+            mapping = json.loads(fd.read())
+        self.assertNotIn('mappings', mapping)
+        self.assertEqual(
+            [['a.js'], ['b.js']],
+            [section['map']['sources'] for section in mapping['sections']])
+
+    def test_stats_json(self):
+        root = self.mkdtemp()
+        self.chdir(root)
+        self.stub_stdio()
+        for name in ('a.js', 'b.js'):
+            with open(join(root, name), 'w') as fd:
+                fd.write('var %s = 1;\n' % name[0])
+        events = []
+        with self.assertRaises(SystemExit) as e:
+            runtime.run(
+                inputs=['a.js', 'b.js'], output=join(root, 'out.js'),
+                mangle=False, obfuscate=False, pretty=False, source_map=None,
+                indent_width=4, drop_semi=False, encoding='utf8',
+                version=False, jobs=2, compress=['gz'],
+                stats_json=join(root, 'stats.json'),
+                hooks=[lambda stage, event: events.append(
+                    (stage, event['phase'], event['source']))],
+            )
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertIn(('start', 'parse', join(root, 'a.js')), events)
+        self.assertIn(('end', 'write', join(root, 'b.js')), events)
+
+        with open(join(root, 'stats.json')) as fd:
+            stats = json.loads(fd.read())
+        self.assertEqual(2, stats['phases']['parse']['count'])
+        self.assertEqual([join(root, 'a.js'), join(root, 'b.js')], [
+            record['source'] for record in stats['inputs']])
+        self.assertEqual([11, 11], [
+            record['input_size'] for record in stats['inputs']])
+        self.assertEqual([8, 8], [
+            record['output_size'] for record in stats['inputs']])
+        self.assertEqual([{
+            'path': join(root, 'out.js'),
+            'size': 16,
+            'compressed': {'gz': {
+                'size': stats['outputs'][0]['compressed']['gz']['size'],
+                'ratio': stats['outputs'][0]['compressed']['gz']['size'] /
+                16.0,
+            }},
+        }], stats['outputs'])
+
+    def test_watch(self):
+        from crimp import watch
+        root = self.mkdtemp()
+        self.chdir(root)
+        self.stub_stdio()
+        sources = []
+        for idx in range(2):
+            source = join(root, 'source%d.js' % idx)
+            with open(source, 'w') as fd:
+                fd.write('var value%d = %d;' % (idx, idx))
+            sources.append(source)
+        target = join(root, 'dest.js')
+
+        parsed = []
+        original_parse = api.parse
+
+        def parse(text, *a, **kw):
+            parsed.append(text)
+            return original_parse(text, *a, **kw)
+
+        api.parse = parse
+        self.addCleanup(setattr, api, 'parse', original_parse)
+
+        def read():
+            with open(target) as fd:
+                return fd.read()
+
+        outputs = []
+        modifications = [
+            # a syntax error must not abort watching.
+            'var value1 = ;',
+            # identical output.
+            'var  value1  =  1;',
+            'var value1 = "changed";',
+        ]
+
+        def next_(watcher):
+            outputs.append((read(), os.stat(target).st_mtime))
+            os.utime(target, (1000000000, 1000000000))
+            if not modifications:
+                raise KeyboardInterrupt
+            with open(sources[1], 'w') as fd:
+                fd.write(modifications.pop(0))
+            return {sources[1]}
+
+        original_next = watch.Watcher.next
+        watch.Watcher.next = next_
+        self.addCleanup(setattr, watch.Watcher, 'next', original_next)
+
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', sources[0], sources[1], '-O', target,
+                         '--watch')
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual([
+            'var value0 = 0;',
+            'var value1 = 1;',
+            'var value1 = ;',
+            'var  value1  =  1;',
+            'var value1 = "changed";',
+        ], parsed)
+        self.assertIn('Unexpected', sys.stderr.getvalue())
+
+        original = 'var value0=0;var value1=1;'
+        self.assertEqual(original, outputs[0][0])
+        # the syntax error left the output untouched
+        self.assertEqual((original, 1000000000), outputs[1])
+        # as did the identical output
+        self.assertEqual((original, 1000000000), outputs[2])
+        self.assertEqual('var value0=0;var value1="changed";', outputs[3][0])
+        self.assertNotEqual(1000000000, outputs[3][1])
+        self.assertEqual(['dest.js', 'source0.js', 'source1.js'], sorted(
+            os.listdir(root)))
+
+    def test_watch_requires_output(self):
+        self.stub_stdio()
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', 'source.js', '--watch')
+        self.assertEqual(e.exception.args[0], 2)
+
     def test_write_error(self):
         def error():
             raise OSError(28, 'No space left on device')
@@ -508,3 +1271,68 @@ class RuntimeTestCase(unittest.TestCase):
     def test_integration(self):
         p = Popen(['crimp'], stdin=PIPE, stdout=PIPE)
         self.assertEqual(b'var foo=1;', p.communicate(b'var foo = 1;')[0])
+
+
+def importtime(code, stdin=b''):
+    """
+    Run the code in a new interpreter with -X importtime and return the
+    mapping of every imported module to its cumulative import time in
+    microseconds.
+    """
+
+    p = Popen(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        stdin=PIPE, stdout=PIPE, stderr=PIPE,
+    )
+    stdout, stderr = p.communicate(stdin)
+    results = {}
+    for line in stderr.decode('utf8').splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if cumulative.strip().isdigit():
+            results[name.strip()] = int(cumulative)
+    return results
+
+
+@unittest.skipIf(sys.version_info < (3, 7), '-X importtime unavailable')
+class ImportTimeTestCase(unittest.TestCase):
+    """
+    Ensure that the costly imports are deferred until they are needed.
+    """
+
+    def assertNotImported(self, modules, imported):
+        for module in modules:
+            self.assertNotIn(module, imported, '%s was imported (%d us)' % (
+                module, imported.get(module, 0)))
+
+    def test_import(self):
+        imported = importtime('import crimp.runtime')
+        self.assertIn('crimp.runtime', imported)
+        self.assertNotImported([
+            'pkg_resources', 'calmjs.parse', 'ply', 'cProfile',
+            'concurrent.futures', 'multiprocessing', 'brotli',
+        ], imported)
+
+    def test_help(self):
+        imported = importtime(
+            'from crimp.runtime import main\n'
+            'try:\n'
+            '    main("crimp", "--help")\n'
+            'except SystemExit:\n'
+            '    pass\n'
+        )
+        self.assertNotImported(
+            ['pkg_resources', 'calmjs.parse', 'brotli'], imported)
+
+    def test_minify(self):
+        imported = importtime(
+            'from crimp.runtime import main\n'
+            'try:\n'
+            '    main("crimp")\n'
+            'except SystemExit:\n'
+            '    pass\n',
+            stdin=b'var foo = 1;',
+        )
+        self.assertIn('calmjs.parse', imported)
+        self.assertNotImported(['pkg_resources', 'cProfile'], imported)
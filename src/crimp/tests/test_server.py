@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Server tests
+"""
+
+import unittest
+import errno
+import signal
+import socket
+import sys
+import time
+
+from os.path import exists
+from os.path import join
+from tempfile import mkdtemp
+from threading import Thread
+from shutil import rmtree
+
+from calmjs.parse.exceptions import ECMASyntaxError
+
+from crimp import api
+from crimp import runtime
+from crimp import server
+from crimp.limits import LimitExceeded
+from crimp.limits import Limits
+from crimp.tests.test_runtime import StringIO
+
+OPTIONS = api.printer_options(mangle=True)
+
+
+@unittest.skipIf(
+    not hasattr(socket, 'AF_UNIX'), 'unix domain sockets are unsupported')
+class ServerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+        self.path = join(self.root, 'crimp.sock')
+
+    def start_server(self, **kw):
+        inst = server.create_server(self.path, **kw)
+        thread = Thread(target=inst.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+        def stop():
+            inst.shutdown()
+            inst.server_close()
+            thread.join()
+
+        self.addCleanup(stop)
+        return inst
+
+    def test_minify_unavailable(self):
+        self.assertFalse(server.available(self.path))
+        self.assertIsNone(server.minify(
+            self.path, [('var a = 1;', 'a.js')], OPTIONS))
+
+    def test_minify(self):
+        self.start_server()
+        self.assertTrue(server.available(self.path))
+        sources = [
+            ('(function(root) { var foo = 1; root.foo = foo; })', 'a.js'),
+            ('var bar = 2;', None),
+        ]
+        results = server.minify(self.path, sources, OPTIONS)
+        self.assertEqual([
+            api.minify_text(text, sourcepath, OPTIONS)
+            for text, sourcepath in sources
+        ], results)
+
+    def test_minify_define(self):
+        self.start_server()
+        options = api.printer_options(define={'DEBUG': 'false'})
+        self.assertEqual(
+            [[('var', 1, 1, None, 'a.js'), (' ', 0, 0, None, None),
+              ('a', 1, 5, None, 'a.js'), ('=', 1, 7, None, 'a.js'),
+              ('false', 1, 9, None, 'a.js'), (';', 1, 14, None, None)]],
+            server.minify(self.path, [('var a = DEBUG;', 'a.js')], options))
+
+    def test_minify_syntax_error(self):
+        self.start_server()
+        with self.assertRaises(ECMASyntaxError) as e:
+            server.minify(self.path, [('function(){};', 'a.js')], OPTIONS)
+        self.assertEqual(
+            "Function statement requires a name at 1:9 in 'a.js'",
+            str(e.exception))
+
+    def test_minify_limit_exceeded(self):
+        self.start_server()
+        self.assertEqual(1, len(server.minify(
+            self.path, [('var a;', 'a.js')], OPTIONS, Limits(max_bytes=6))))
+        with self.assertRaises(LimitExceeded) as e:
+            server.minify(
+                self.path, [('var a;', 'a.js')], OPTIONS, Limits(max_bytes=5))
+        self.assertEqual(
+            "input 'a.js' exceeds the size limit of 5 bytes",
+            str(e.exception))
+
+    @unittest.skipIf(
+        not hasattr(signal, 'setitimer'), 'setitimer is not available')
+    def test_minify_limits_enforced(self):
+        # the sources are processed by worker processes, where the
+        # limits are enforced as they are processed.
+        self.start_server()
+        source = 'var a = [' + '1,' * 100000 + '1];'
+        start = time.time()
+        with self.assertRaises(LimitExceeded) as e:
+            server.minify(
+                self.path, [(source, 'a.js')], OPTIONS, Limits(timeout=0.2))
+        self.assertLess(time.time() - start, 3)
+        self.assertEqual(
+            "input 'a.js' exceeds the time limit of 0.2 seconds",
+            str(e.exception))
+        with self.assertRaises(LimitExceeded) as e:
+            server.minify(
+                self.path, [('var a;', 'a.js')], OPTIONS, Limits(max_rss=1))
+        self.assertEqual(
+            "input 'a.js' exceeds the memory limit of 1 bytes",
+            str(e.exception))
+
+    def test_minify_server_limits(self):
+        # the limits of the requests may only be tighter.
+        self.start_server(limits=Limits(max_bytes=6))
+        self.assertEqual(1, len(server.minify(
+            self.path, [('var a;', 'a.js')], OPTIONS)))
+        for limits in (Limits(), Limits(max_bytes=100), Limits(max_bytes=5)):
+            with self.assertRaises(LimitExceeded):
+                server.minify(
+                    self.path, [('var ab;', 'a.js')], OPTIONS, limits)
+
+    def test_merge_limits(self):
+        limits = server.merge_limits(
+            Limits(max_bytes=10, timeout=1.0),
+            {'max_bytes': 20, 'timeout': 0.5, 'max_depth': 5})
+        self.assertEqual(
+            {'max_bytes': 10, 'timeout': 0.5, 'max_depth': 5,
+             'max_rss': None}, vars(limits))
+
+    def test_minify_server_error(self):
+        self.start_server()
+        with self.assertRaises(IOError) as e:
+            server.minify(self.path, [('var a;', 'a.js')], [['bad', 1]])
+        self.assertEqual(errno.EIO, e.exception.args[0])
+
+    def test_create_server_stale_socket(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(self.path)
+        sock.close()
+        self.assertTrue(exists(self.path))
+        self.start_server()
+        self.assertTrue(server.available(self.path))
+
+    def test_create_server_in_use(self):
+        self.start_server()
+        with self.assertRaises(OSError) as e:
+            server.create_server(self.path)
+        self.assertEqual(errno.EADDRINUSE, e.exception.args[0])
+
+    def test_runtime_connect(self):
+        self.start_server()
+        source = join(self.root, 'source.js')
+        with open(source, 'w') as fd:
+            fd.write('var foo = "bar";')
+
+        def minify_text(*a, **kw):
+            raise AssertionError('sources should be processed by server')
+
+        original, api.minify_text = api.minify_text, minify_text
+        self.addCleanup(setattr, api, 'minify_text', original)
+
+        old_stdout, sys.stdout = sys.stdout, StringIO()
+        self.addCleanup(setattr, sys, 'stdout', old_stdout)
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', source, '--connect', self.path)
+
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual('var foo="bar";', sys.stdout.getvalue())
+
+    def test_runtime_connect_fallback(self):
+        source = join(self.root, 'source.js')
+        with open(source, 'w') as fd:
+            fd.write('var foo = "bar";')
+
+        old_stdout, sys.stdout = sys.stdout, StringIO()
+        self.addCleanup(setattr, sys, 'stdout', old_stdout)
+        with self.assertRaises(SystemExit) as e:
+            runtime.main('crimp', source, '--connect', self.path)
+
+        self.assertEqual(e.exception.args[0], 0)
+        self.assertEqual('var foo="bar";', sys.stdout.getvalue())
+
+
+class RunServerTestCase(unittest.TestCase):
+
+    def test_unsupported(self):
+        class stub_socket(object):
+            pass
+
+        self.addCleanup(setattr, runtime, 'socket', runtime.socket)
+        runtime.socket = stub_socket
+        with self.assertRaises(SystemExit) as e:
+            runtime.run_server('crimp.sock')
+        self.assertEqual(1, e.exception.args[0])
+
+    @unittest.skipIf(
+        not hasattr(socket, 'AF_UNIX'), 'unix domain sockets are unsupported')
+    def test_attribute_error(self):
+        def serve(*a, **kw):
+            raise AttributeError('serve')
+
+        self.addCleanup(setattr, server, 'serve', server.serve)
+        server.serve = serve
+        # not mistaken for the lack of unix domain sockets.
+        with self.assertRaises(AttributeError):
+            runtime.run_server('crimp.sock')
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+Timing tests
+"""
+
+import unittest
+
+from crimp import timing
+
+
+class TimingsTestCase(unittest.TestCase):
+
+    def test_phase(self):
+        timings = timing.Timings()
+        with timings.phase('parse'):
+            pass
+        with timings.phase('parse'):
+            pass
+        with self.assertRaises(ValueError):
+            with timings.phase('write'):
+                raise ValueError('still recorded')
+        self.assertEqual(2, timings.counts['parse'])
+        self.assertEqual(1, timings.counts['write'])
+        self.assertEqual(0, timings.counts['read'])
+        self.assertEqual(sum(timings.durations.values()), timings.total)
+
+    def test_report(self):
+        timings = timing.Timings()
+        timings.record('parse', 3.0)
+        timings.record('write', 1.0)
+        report = timings.report().splitlines()
+        self.assertEqual(len(timing.PHASES) + 2, len(report))
+        self.assertIn('parse', report[2])
+        self.assertIn('75.0%', report[2])
+        self.assertIn('4.0000', report[-1])
+
+    @unittest.skipIf(timing.tracemalloc is None, 'tracemalloc unavailable')
+    def test_memory(self):
+        timings = timing.Timings(memory=True)
+        timing.tracemalloc.start()
+        try:
+            with timings.phase('parse'):
+                data = [0] * 100000
+        finally:
+            timing.tracemalloc.stop()
+        self.assertTrue(data)
+        self.assertGreater(timings.peaks['parse'], 100000)
+        self.assertIn('peak (KiB)', timings.report())
+
+    def test_null_timings(self):
+        with timing.null_timings.phase('parse'):
+            pass
+        timing.null_timings.record('parse', 1.0)
+        self.assertFalse(timing.null_timings.memory)
+
+    def test_hooks(self):
+        events = []
+        timings = timing.Timings(hooks=[
+            lambda stage, event: events.append((stage, dict(event)))])
+        with timings.phase('read', 'a.js') as event:
+            event['size'] = 3
+        with timing.null_timings.phase('read', 'a.js') as event:
+            event['size'] = 3
+        self.assertEqual(2, len(events))
+        self.assertEqual(('start', {
+            'phase': 'read', 'source': 'a.js', 'size': None,
+            'duration': None,
+        }), events[0])
+        self.assertEqual('end', events[1][0])
+        self.assertEqual(3, events[1][1]['size'])
+        self.assertEqual(timings.durations['read'], events[1][1]['duration'])
+
+
+class StatsTestCase(unittest.TestCase):
+
+    def test_report(self):
+        stats = timing.Stats()
+        timings = timing.Timings(hooks=[stats])
+        for source, size in (('a.js', 10), ('b.js', 20), (None, 30)):
+            with timings.phase('read', source) as event:
+                event['size'] = size
+            with timings.phase('write', source) as event:
+                event['size'] = size // 2
+        with timings.phase('parse', 'a.js'):
+            pass
+        stats.add_output('out.js', 15, [('gz', 5)])
+        stats.add_output('empty.js', 0, [('gz', 20)])
+
+        report = stats.report(timings)
+        self.assertEqual(3, report['phases']['read']['count'])
+        self.assertEqual(timings.total, report['total'])
+        self.assertEqual(['a.js', 'b.js'], [
+            record['source'] for record in report['inputs']])
+        self.assertEqual(10, report['inputs'][0]['input_size'])
+        self.assertEqual(5, report['inputs'][0]['output_size'])
+        self.assertEqual(
+            ['read', 'write', 'parse'],
+            list(report['inputs'][0]['durations']))
+        self.assertEqual(
+            sum(report['inputs'][0]['durations'].values()),
+            report['inputs'][0]['total'])
+        self.assertEqual({'size': 5, 'ratio': 5 / 15.0}, (
+            report['outputs'][0]['compressed']['gz']))
+        self.assertEqual(0.0, report['outputs'][1]['compressed']['gz'][
+            'ratio'])
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Watch tests
+"""
+
+import unittest
+import os
+
+from os.path import join
+from tempfile import mkdtemp
+from shutil import rmtree
+
+from crimp.watch import Watcher
+
+
+class WatcherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = mkdtemp()
+        self.addCleanup(rmtree, self.root)
+        self.paths = [join(self.root, name) for name in ('a.js', 'b.js')]
+        for path in self.paths:
+            self.write(path, 'var a;', 1000000000)
+
+    def write(self, path, text, mtime):
+        with open(path, 'w') as fd:
+            fd.write(text)
+        os.utime(path, (mtime, mtime))
+
+    def create_watcher(self, **kw):
+        watcher = Watcher(self.paths, interval=0.01, debounce=0.01, **kw)
+        self.addCleanup(watcher.close)
+        return watcher
+
+    def test_changed(self):
+        watcher = self.create_watcher(notify=False)
+        self.assertEqual(set(), watcher.changed())
+        self.write(self.paths[0], 'var b;', 1000000001)
+        self.assertEqual({self.paths[0]}, watcher.changed())
+        self.assertEqual(set(), watcher.changed())
+        os.unlink(self.paths[1])
+        self.assertEqual({self.paths[1]}, watcher.changed())
+        self.write(self.paths[1], 'var b;', 1000000001)
+        self.assertEqual({self.paths[1]}, watcher.changed())
+
+    def test_next_debounced(self):
+        watcher = self.create_watcher(notify=False)
+        modifications = [
+            (self.paths[0], 1000000001),
+            (self.paths[1], 1000000002),
+            (self.paths[0], 1000000003),
+        ]
+
+        def wait(timeout):
+            # one modification for every wait, as if in a burst.
+            if modifications:
+                self.write(modifications[0][0], 'var b;', modifications[0][1])
+                waits.append(modifications.pop(0))
+            else:
+                waits.append(None)
+
+        waits = []
+        watcher.wait = wait
+        self.assertEqual(set(self.paths), watcher.next())
+        # the last wait saw no further modification.
+        self.assertEqual(4, len(waits))
+        self.assertIsNone(waits[-1])
+
+    def test_next_notify(self):
+        # inotify if available, otherwise polling.
+        watcher = self.create_watcher()
+        self.write(self.paths[1], 'var b;', 1000000001)
+        self.assertEqual({self.paths[1]}, watcher.next())
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+Accounting of the time (and optionally memory) spent in every phase of
+the minification process.
+
+Hooks may be registered with the Timings to be notified as every phase
+starts and ends for every input, e.g. to feed build metrics; the Stats
+hook provided here aggregates those per input for a JSON report.
+"""
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from timeit import default_timer
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+# the phases in the order they happen in.
+PHASES = (
+    'read', 'parse', 'optimize', 'rules', 'unparse', 'write', 'sourcemap')
+
+
+class Timings(object):
+    """
+    Accumulates the durations of the phases.
+    """
+
+    def __init__(self, memory=False, hooks=()):
+        """
+        Arguments
+
+        memory
+            Also track the peak memory allocated within every phase
+            through tracemalloc, which must be started (and stopped) by
+            the caller.  Note that this will slow down everything
+            considerably.
+        hooks
+            Callables to be invoked with 'start' or 'end' along with the
+            event (a dict of the phase, the source, the size and the
+            duration) as every phase starts and ends.  The source is
+            the path of the input the phase applies to (or None if it
+            applies to no input in particular), the size is the number
+            of bytes that it handled (or None if unknown), and the
+            duration is None until the phase ends.
+        """
+
+        self.memory = memory and tracemalloc is not None
+        self.hooks = list(hooks)
+        self.durations = OrderedDict((phase, 0.0) for phase in PHASES)
+        self.counts = OrderedDict((phase, 0) for phase in PHASES)
+        self.peaks = OrderedDict((phase, 0) for phase in PHASES)
+
+    def record(self, phase, duration, peak=0):
+        self.durations[phase] = self.durations.get(phase, 0.0) + duration
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        self.peaks[phase] = max(self.peaks.get(phase, 0), peak)
+
+    @contextmanager
+    def phase(self, phase, source=None):
+        """
+        A context manager that records the duration of the phase, which
+        provides the event passed to the hooks such that the size may
+        be assigned to it before the phase ends.
+        """
+
+        event = {
+            'phase': phase, 'source': source, 'size': None,
+            'duration': None,
+        }
+        for hook in self.hooks:
+            hook('start', event)
+        if self.memory:
+            reset_peak()
+        start = default_timer()
+        try:
+            yield event
+        finally:
+            duration = default_timer() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.memory else 0
+            self.record(phase, duration, peak)
+            event['duration'] = duration
+            for hook in self.hooks:
+                hook('end', event)
+
+    @property
+    def total(self):
+        return sum(self.durations.values())
+
+    def report(self):
+        """
+        Return the formatted table of the phases.
+        """
+
+        total = self.total or 1.0
+        lines = ['%-10s %6s %10s %7s%s' % (
+            'phase', 'count', 'time (s)', '%', ' peak (KiB)' * self.memory)]
+        for phase, duration in self.durations.items():
+            lines.append('%-10s %6d %10.4f %6.1f%%%s' % (
+                phase, self.counts[phase], duration,
+                100.0 * duration / total,
+                ' %11.1f' % (self.peaks[phase] / 1024.0) * self.memory,
+            ))
+        lines.append('%-10s %6s %10.4f' % ('total', '', self.total))
+        return '\n'.join(lines) + '\n'
+
+
+class NullTimings(object):
+    """
+    The no-op variant, for when nothing is to be recorded.
+    """
+
+    memory = False
+    hooks = ()
+
+    def record(self, phase, duration, peak=0):
+        pass
+
+    @contextmanager
+    def phase(self, phase, source=None):
+        yield {}
+
+
+class Stats(object):
+    """
+    A hook that aggregates the durations and sizes of the phases for
+    every input, for the report written by the --stats-json flag.
+    """
+
+    def __init__(self):
+        self.inputs = OrderedDict()
+        self.outputs = []
+
+    def __call__(self, stage, event):
+        if stage != 'end' or event['source'] is None:
+            return
+        record = self.inputs.get(event['source'])
+        if record is None:
+            record = self.inputs[event['source']] = {
+                'source': event['source'],
+                'durations': OrderedDict(),
+                'sizes': OrderedDict(),
+            }
+        phase = event['phase']
+        record['durations'][phase] = (
+            record['durations'].get(phase, 0.0) + event['duration'])
+        if event['size'] is not None:
+            record['sizes'][phase] = event['size']
+
+    def add_output(self, path, size, compressed=()):
+        """
+        Record an output of the size (in bytes) along with the 2-tuples
+        of the extension and the size of its compressed copies.
+        """
+
+        self.outputs.append({
+            'path': path,
+            'size': size,
+            'compressed': OrderedDict((ext, {
+                'size': compressed_size,
+                'ratio': float(compressed_size) / size if size else 0.0,
+            }) for ext, compressed_size in compressed),
+        })
+
+    def report(self, timings):
+        """
+        Return the report as a dict, with the totals of every phase from
+        the timings.  Inputs are listed in the order they were first
+        encountered, with the input size being the size read and the
+        output size being the size written for them.
+        """
+
+        return OrderedDict([
+            ('phases', OrderedDict((phase, {
+                'count': timings.counts[phase],
+                'duration': duration,
+            }) for phase, duration in timings.durations.items())),
+            ('total', timings.total),
+            ('inputs', [OrderedDict([
+                ('source', record['source']),
+                ('input_size', record['sizes'].get('read')),
+                ('output_size', record['sizes'].get('write')),
+                ('durations', record['durations']),
+                ('total', sum(record['durations'].values())),
+            ]) for record in self.inputs.values()]),
+            ('outputs', self.outputs),
+        ])
+
+
+def reset_peak():
+    try:
+        tracemalloc.reset_peak()
+    except AttributeError:  # pragma: no cover
+        # Python<3.9; approximate by clearing all traces.
+        tracemalloc.clear_traces()
+
+
+null_timings = NullTimings()
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+"""
+Watching of the input files for modifications.
+
+The state of every file is determined through stat, which is done at a
+fixed interval.  If the optional inotify_simple package is available,
+the directories containing the files are watched through inotify such
+that the files will only be checked (almost immediately) after the
+kernel reports activity within them.
+"""
+
+import logging
+import os
+import time
+
+from os.path import dirname
+
+try:
+    import inotify_simple
+except ImportError:  # pragma: no cover
+    inotify_simple = None
+
+logger = logging.getLogger(__name__)
+
+# seconds between checks of the files.
+DEFAULT_INTERVAL = 0.5
+# seconds that the files must remain unchanged after a modification
+# was seen before it is reported, such that bursts of modifications
+# (e.g. from a version control checkout) are reported together.
+DEFAULT_DEBOUNCE = 0.1
+
+
+def create_notifier(paths):
+    """
+    Return an inotify_simple.INotify instance that watches for activity
+    within the directories of the paths, or None if unavailable.
+    Directories are watched, as editors may replace files rather than
+    writing to them.
+    """
+
+    if inotify_simple is None:
+        return None
+    flags = inotify_simple.flags
+    mask = (
+        flags.CLOSE_WRITE | flags.MODIFY | flags.MOVED_TO | flags.CREATE |
+        flags.DELETE | flags.ATTRIB
+    )
+    try:
+        notifier = inotify_simple.INotify()
+    except (IOError, OSError) as e:  # pragma: no cover
+        logger.debug('inotify unavailable, using polling: %s', e)
+        return None
+    try:
+        for directory in sorted(set(dirname(path) for path in paths)):
+            notifier.add_watch(directory, mask)
+    except (IOError, OSError) as e:  # pragma: no cover
+        logger.debug('inotify unavailable, using polling: %s', e)
+        notifier.close()
+        return None
+    return notifier
+
+
+class Watcher(object):
+    """
+    Watches a list of files for modifications.
+    """
+
+    def __init__(
+            self, paths, interval=DEFAULT_INTERVAL,
+            debounce=DEFAULT_DEBOUNCE, notify=True):
+        """
+        Arguments
+
+        paths
+            The list of absolute paths to the files to be watched.
+        interval
+            The number of seconds between the checks of the files.
+        debounce
+            The number of seconds that the files must remain unchanged
+            after a modification before it is reported.
+        notify
+            Make use of inotify if available.
+        """
+
+        self.paths = paths
+        self.interval = interval
+        self.debounce = debounce
+        self.notifier = create_notifier(paths) if notify else None
+        self.state = self.snapshot()
+
+    def stat(self, path):
+        try:
+            st = os.stat(path)
+        except (IOError, OSError):
+            return None
+        return st.st_size, st.st_mtime, st.st_ino
+
+    def snapshot(self):
+        return {path: self.stat(path) for path in self.paths}
+
+    def changed(self):
+        """
+        Return the set of paths modified since the previous check.
+        """
+
+        state = self.snapshot()
+        result = set(
+            path for path in self.paths if state[path] != self.state[path])
+        self.state = state
+        return result
+
+    def wait(self, timeout):
+        if self.notifier is None:
+            time.sleep(timeout)
+        else:
+            self.notifier.read(timeout=int(timeout * 1000))
+
+    def next(self):
+        """
+        Block until any of the files have been modified and remained
+        unchanged for the debounce period, then return the set of the
+        modified paths.
+        """
+
+        result = set()
+        while not result:
+            self.wait(self.interval)
+            result = self.changed()
+        while True:
+            self.wait(self.debounce)
+            changed = self.changed()
+            if not changed:
+                return result
+            result.update(changed)
+
+    def close(self):
+        if self.notifier is not None:
+            self.notifier.close()
+            self.notifier = None